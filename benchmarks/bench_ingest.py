@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+""" bench_ingest.py
+
+End-to-end ingestion benchmark.
+
+Runs the database Manager against a ``FakeSource`` and an embedded SQLite
+database through three stages:
+
+    add         Manager.add_stock for every ticker, with quotes through
+                ``lag`` business days ago.
+    sync        Manager.sync_quotes after the source catches up to today.
+    recompute   indicators.update_all with check_all for every ticker.
+
+Each stage reports wall time, quote rows written (recomputed for the last
+stage), rows per second, SQL statements issued and source requests. Stage
+times are recorded in the benchmark history like any other suite. With
+--universe the source serves a synthetic ``Universe`` with listings,
+delistings, splits and gaps instead of plain random walks. With the
+STOCKS_TIMING environment variable set, the per-stage and per-indicator
+span summary is printed as well.
+
+usage:
+    python bench_ingest.py [--tickers 10] [--years 5] [--universe] [--no-save]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import event
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'sources'))
+sys.path.insert(0, os.path.join(_root, 'quant'))
+sys.path.insert(0, os.path.join(_root, 'database'))
+import database #database
+import indicators #database
+import timing #database
+from models import Quote #database
+
+import harness
+from fakesource import FakeSource
+from universe import Universe
+
+
+class QueryCounter(object):
+    """ Count statements executed on an engine
+    """
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._before)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+class Stage(object):
+    """ Measure one stage of the benchmark
+    """
+    def __init__(self, name, manager, counter, source):
+        self.name = name
+        self.manager = manager
+        self.counter = counter
+        self.source = source
+
+    def __enter__(self):
+        self.rows = self._rows()
+        self.queries = self.counter.count
+        self.requests = self.source.requests
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.time() - self.start
+        self.queries = self.counter.count - self.queries
+        self.requests = self.source.requests - self.requests
+        self.rows = self._rows() - self.rows
+
+    def _rows(self):
+        session = self.manager.db.Session()
+        rows = session.query(Quote).count()
+        session.close()
+        return rows
+
+    def report(self):
+        rate = self.rows / self.seconds if self.seconds else 0.0
+        print '%-10s %10.3f s %10d rows %12.0f rows/s %10d queries %6d requests' % (
+                self.name, self.seconds, self.rows, rate, self.queries, self.requests)
+
+
+def tickers(n):
+    """ n distinct synthetic ticker symbols
+    """
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(letters[(i // 26 ** k) % 26] for k in range(3)) for i in range(n)]
+
+
+def run(n_tickers=10, years=5, lag=20, directory=None, universe=False):
+    """ Run every stage and return them
+    """
+    directory = directory or tempfile.mkdtemp()
+    try:
+        db = database.Database('sqlite:///%s' % os.path.join(directory, 'stocks.db'))
+        as_of = np.busday_offset(np.datetime64(date.today(), 'D'), -lag,
+                                 roll='backward').tolist()
+        if universe:
+            universe = Universe(n_tickers, years)
+            source = universe.source(as_of=as_of)
+            symbols = [symbol.lower() for symbol in universe.symbols]
+        else:
+            start = date.today() - timedelta(days=365 * years)
+            source = FakeSource(start=start, as_of=as_of)
+            symbols = tickers(n_tickers)
+        manager = database.Manager(db, source, request_delay=0)
+        manager.create_database()
+        counter = QueryCounter(db.Engine)
+
+        stages = []
+        with Stage('add', manager, counter, source) as stage:
+            for symbol in symbols:
+                manager.add_stock(symbol)
+        stages.append(stage)
+
+        source.as_of = date.today()
+        with Stage('sync', manager, counter, source) as stage:
+            manager.sync_quotes()
+        stages.append(stage)
+
+        with Stage('recompute', manager, counter, source) as stage:
+            session = db.Session()
+            for symbol in symbols:
+                indicators.update_all(symbol, session, True, True)
+            session.close()
+        # Nothing is inserted, count the quotes whose indicators were rewritten
+        stage.rows = stage._rows()
+        stages.append(stage)
+        return stages
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the ingestion benchmark')
+    parser.add_argument('--tickers', type=int, default=10)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--lag', type=int, default=20,
+                        help='business days of quotes left for the sync stage')
+    parser.add_argument('--universe', action='store_true',
+                        help='serve a synthetic universe with corporate actions')
+    harness.add_record_arguments(parser)
+    args = parser.parse_args(argv)
+
+    stages = run(args.tickers, args.years, args.lag, universe=args.universe)
+    for stage in stages:
+        stage.report()
+    if timing.enabled:
+        print
+        print timing.summary()
+
+    kind = 'u' if args.universe else ''
+    results = dict(('%s[%dx%dy%s]' % (stage.name, args.tickers, args.years, kind), stage.seconds)
+                   for stage in stages)
+    return harness.record(results, 'ingest', args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+""" bench_quant.py
+
+Benchmarks for the quant.analysis kernels and the indicator registry.
+
+Every kernel runs over synthetic price series of several lengths. The
+``indicators`` benchmark computes the whole ``indicators.indicators`` list
+the way ``indicator.update`` does with check_all, so columns that depend on
+others (macd, macd_signal...) see their inputs.
+
+usage:
+    python bench_quant.py [-k moving_average] [--threshold 0.2] [--no-save]
+"""
+
+import os
+import sys
+
+import numpy as np
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'quant'))
+sys.path.insert(0, os.path.join(_root, 'database'))
+import analysis #quant
+import indicators #database
+
+import harness
+
+
+SIZES = (1000, 10000, 100000)
+
+
+def synthetic_prices(n, seed=0):
+    """ Geometric random walk of n daily high, low, close and volume values
+    """
+    random = np.random.RandomState(seed)
+    close = 100 * np.exp(np.cumsum(random.normal(0.0002, 0.01, n)))
+    spread = close * random.uniform(0.001, 0.02, n)
+    high = close + spread
+    low = close - spread
+    volume = random.randint(1000, 100000, n).astype(float)
+    return high, low, close, volume
+
+
+def compute_indicators(close):
+    """ Compute every registered indicator over a price series
+    """
+    data = {'adj_close': close}
+    for calc in indicators.indicators:
+        data[calc.name] = np.empty(len(close))
+        data[calc.name] = calc.function(*calc._get_args(data))
+    return data
+
+
+def build_suite(sizes=SIZES):
+    suite = harness.Suite('quant')
+    for n in sizes:
+        high, low, close, volume = synthetic_prices(n)
+        macd = analysis.macd(close)
+        signal = analysis.macd_signal(close, macd)
+        kernels = [
+            ('moving_average', analysis.moving_average, 20, close),
+            ('exp_weighted_moving_average', analysis.exp_weighted_moving_average, 20, close),
+            ('percent_change', analysis.percent_change, close),
+            ('moving_stdev', analysis.moving_stdev, 20, close),
+            ('moving_var', analysis.moving_var, 20, close),
+            ('momentum', analysis.momentum, 20, close),
+            ('rate_of_change', analysis.rate_of_change, 20, close),
+            ('velocity', analysis.velocity, 20, close),
+            ('acceleration', analysis.acceleration, 20, close),
+            ('macd', analysis.macd, close),
+            ('macd_signal', analysis.macd_signal, close, macd),
+            ('macd_hist', analysis.macd_hist, close, macd, signal),
+            ('value_oscillator', analysis.value_oscillator, 5, 20, close),
+            ('exp_weighted_value_oscillator', analysis.exp_weighted_value_oscillator, 5, 20, close),
+            ('trix', analysis.trix, 15, close),
+            ('relative_strength_index', analysis.relative_strength_index, 14, close),
+            ('relative_momentum_index', analysis.relative_momentum_index, 14, 5, close),
+            ('accumulation_distribution', analysis.accumulation_distribution, high, low, close, volume),
+            ('chaikin_oscillator', analysis.chaikin_oscillator, high, low, close, volume),
+            ('indicators', compute_indicators, close)]
+        for kernel in kernels:
+            suite.add('%s[%d]' % (kernel[0], n), *kernel[1:])
+    return suite
+
+
+if __name__ == '__main__':
+    sys.exit(harness.main(build_suite()))
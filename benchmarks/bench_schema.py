@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+""" bench_schema.py
+
+Hot query plans and timings before and after the (Ticker, Date) index
+migration.
+
+A synthetic universe is written to an SQLite file without the composite
+index. The queries Manager, Client and the indicators issue per ticker are
+timed and explained, the migration is run, and they are timed and
+explained again.
+
+usage:
+    python bench_schema.py [--tickers 200] [--years 20] [--no-save]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy import text
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'sources'))
+sys.path.insert(0, os.path.join(_root, 'quant'))
+sys.path.insert(0, os.path.join(_root, 'database'))
+import database #database
+import migrations #database
+
+import harness
+from universe import Universe
+
+
+# Per-ticker queries issued on the sync and read paths
+QUERIES = [
+    ('last_quote',
+     'SELECT MAX(Date) FROM Quotes WHERE Ticker = :ticker'),
+    ('date_range',
+     'SELECT Id, Date, AdjClose FROM Quotes WHERE Ticker = :ticker '
+     'AND Date >= :start AND Date <= :end ORDER BY Date'),
+    ('newest_indicator',
+     'SELECT Indicators.ma_5_day FROM Indicators JOIN Quotes ON Quotes.Id = Indicators.Id '
+     'WHERE Quotes.Ticker = :ticker ORDER BY Quotes.Date DESC LIMIT 1'),
+    ('full_history',
+     'SELECT Quotes.Id, Quotes.AdjClose FROM Quotes JOIN Indicators '
+     'ON Quotes.Id = Indicators.Id WHERE Quotes.Ticker = :ticker ORDER BY Quotes.Date'),
+]
+
+
+def time_queries(engine, symbols, start, end, repeat=3):
+    """ Seconds per ticker of every query, best of repeat passes
+    """
+    results = {}
+    connection = engine.connect()
+    for name, sql in QUERIES:
+        statement = text(sql)
+        best = None
+        for i in range(repeat):
+            begin = time.time()
+            for symbol in symbols:
+                connection.execute(statement, ticker=symbol, start=start, end=end).fetchall()
+            elapsed = (time.time() - begin) / len(symbols)
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+    connection.close()
+    return results
+
+
+def show_plans(engine, symbol, start, end):
+    for name, sql in QUERIES:
+        print '  %s' % name
+        for row in migrations.explain(engine, sql, {'ticker': symbol, 'start': start, 'end': end}):
+            print '      %s' % (row,)
+
+
+def run(n_tickers=200, years=20, directory=None):
+    directory = directory or tempfile.mkdtemp()
+    try:
+        db = database.Database('sqlite:///%s' % os.path.join(directory, 'stocks.db'))
+        universe = Universe(n_tickers, years)
+        print 'Writing %d quotes' % universe.write(db)
+        db.Engine.execute('DROP INDEX %s' % migrations.TICKER_DATE_INDEX)
+        db.Engine.execute('ANALYZE')
+
+        symbols = [symbol.lower() for symbol in universe.symbols]
+        start = str(universe.dates[len(universe.dates) // 2])
+        end = str(universe.dates[len(universe.dates) // 2 + 250])
+
+        print '\nBefore:'
+        show_plans(db.Engine, symbols[0], start, end)
+        before = time_queries(db.Engine, symbols, start, end)
+
+        begin = time.time()
+        migrations.add_ticker_date_index(db.Engine)
+        db.Engine.execute('ANALYZE')
+        migration = time.time() - begin
+
+        print '\nAfter:'
+        show_plans(db.Engine, symbols[0], start, end)
+        after = time_queries(db.Engine, symbols, start, end)
+
+        print '\n%-20s %14s %14s %8s' % ('query', 'before', 'after', 'speedup')
+        for name, sql in QUERIES:
+            print '%-20s %14s %14s %7.1fx' % (name, harness.format_time(before[name]),
+                                              harness.format_time(after[name]),
+                                              before[name] / after[name])
+        print 'migration took %.2f s' % migration
+        return before, after
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the schema migration')
+    parser.add_argument('--tickers', type=int, default=200)
+    parser.add_argument('--years', type=int, default=20)
+    harness.add_record_arguments(parser)
+    args = parser.parse_args(argv)
+
+    before, after = run(args.tickers, args.years)
+    size = '%dx%dy' % (args.tickers, args.years)
+    results = dict(('%s[%s,indexed]' % (name, size), seconds)
+                   for name, seconds in after.iteritems())
+    results.update(('%s[%s,unindexed]' % (name, size), seconds)
+                   for name, seconds in before.iteritems())
+
+    return harness.record(results, 'schema', args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+""" bench_sources.py
+
+Benchmarks for parsing source dumps.
+
+Netfonds tick and book dumps and Yahoo! Finance price CSVs are generated in
+memory at several sizes, so nothing is downloaded. The per-row tick parser
+netfonds used before vectorizing is timed alongside as a baseline.
+
+usage:
+    python bench_sources.py [-k ticks] [--threshold 0.2] [--no-save]
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'sources'))
+import netfonds #sources
+import yahoofinance #sources
+
+import harness
+
+
+SIZES = (1000, 10000, 100000)
+
+
+def legacy_parse_ticks(body):
+    """ Per-row strptime tick parsing netfonds used before vectorizing
+    """
+    data = [row for row in [row.split() for row in body.split('\n')][1:] if len(row) >= 3]
+    timestamps = [datetime.strptime(row[0], '%Y%m%dT%H%M%S') for row in data]
+    return {
+            'dates': [timestamp.date() for timestamp in timestamps],
+            'times': [(timestamp + timedelta(hours=-6)).time() for timestamp in timestamps],
+            'prices': [float(row[1]) for row in data],
+            'quantities': [int(row[2]) for row in data]}
+
+
+def tick_dump(n):
+    return '\n'.join(
+        ['time price quantity board source buyer seller initiator'] +
+        ['20130102T%02d%02d%02d %.2f %d Auto NYSE' % (15 + (i // 3600) % 7, (i // 60) % 60,
+                                                      i % 60, 20 + 0.01 * (i % 100), 100)
+         for i in range(n)])
+
+
+def book_dump(n):
+    return '\n'.join(
+        ['time bid bid_depth bid_depth_total offer offer_depth offer_depth_total'] +
+        ['20130102T%02d%02d%02d %.2f %d %d %.2f %d %d' % (15 + (i // 3600) % 7, (i // 60) % 60,
+                                                          i % 60, 20.0, i, 5 * i, 20.05, i + 1,
+                                                          5 * i + 1)
+         for i in range(n)])
+
+
+def price_csv(n):
+    return '\n'.join(
+        ['Date,Open,High,Low,Close,Volume,Adj Close'] +
+        ['%04d-%02d-%02d,10.00,10.50,9.50,10.25,1200,10.20' % (1900 + i // 336, i // 28 % 12 + 1,
+                                                              i % 28 + 1)
+         for i in range(n)])
+
+
+def build_suite(sizes=SIZES):
+    suite = harness.Suite('sources')
+    for n in sizes:
+        ticks = tick_dump(n)
+        suite.add('netfonds_ticks[%d]' % n, netfonds._parse_ticks, ticks)
+        suite.add('netfonds_ticks_legacy[%d]' % n, legacy_parse_ticks, ticks)
+        suite.add('netfonds_books[%d]' % n, netfonds._parse_books, book_dump(n))
+        suite.add('yahoo_prices[%d]' % n, yahoofinance.parse_historical_prices, price_csv(n))
+    return suite
+
+
+if __name__ == '__main__':
+    sys.exit(harness.main(build_suite()))
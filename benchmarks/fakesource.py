@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+""" fakesource.py
+
+Deterministic stand-in for the yahoofinance source module.
+
+Prices are a seeded random walk per ticker over business days, served as
+Yahoo! formatted CSV and parsed with the real parser, so benchmarks exercise
+the same code path as a live download without touching the network.
+"""
+
+import time
+import zlib
+from datetime import date
+
+import numpy as np
+
+import yahoofinance
+
+
+def _to_datetime64(value):
+    if not isinstance(value, date):
+        value = date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    return np.datetime64(value, 'D')
+
+
+def random_walk(symbol, dates, seed=0):
+    """ Synthetic quotes for symbol on dates as ``yahoofinance.price_dtype``
+    records
+
+    The walk depends only on symbol, seed and the first date, so any
+    sub-range of dates agrees with the full history.
+    """
+    random = np.random.RandomState((zlib.crc32(symbol) ^ seed) & 0xffffffff)
+    n = len(dates)
+    close = 20 * np.exp(np.cumsum(random.normal(0.0003, 0.015, n)))
+    spread = close * random.uniform(0.001, 0.02, n)
+    prices = np.empty(n, dtype=yahoofinance.price_dtype)
+    prices['Date'] = dates
+    prices['Open'] = close + spread * random.uniform(-1, 1, n)
+    prices['High'] = np.maximum(prices['Open'], close) + spread
+    prices['Low'] = np.minimum(prices['Open'], close) - spread
+    prices['Close'] = close
+    prices['Volume'] = random.randint(1000, 1000000, n)
+    prices['AdjClose'] = close
+    return prices
+
+
+class FakeSource(object):
+    """ Quote source serving synthetic histories
+
+    :param start: First date of every history.
+    :param as_of: Last date quotes are available for. Move it forward to
+    simulate new quotes arriving.
+    :param seed: Seed mixed into every ticker's walk.
+    :param latency: Seconds each price request takes.
+    :param histories: (optional) Function of (symbol, dates) returning quote
+    records, replacing ``random_walk``.
+    """
+    def __init__(self, start=date(1990, 1, 1), as_of=None, seed=0, latency=0.0,
+                 histories=None):
+        self.__name__ = 'fake'
+        self.start = _to_datetime64(start)
+        self.as_of = as_of or date.today()
+        self.seed = seed
+        self.latency = latency
+        self.histories = histories or (lambda symbol, dates: random_walk(symbol, dates, seed))
+        self.requests = 0
+        self._cache = {}
+
+    def get_name(self, symbol):
+        return '%s Inc.' % symbol.upper()
+
+    def get_stock_exchange(self, symbol):
+        return 'NYSE'
+
+    def get_sector(self, symbol):
+        return 'Technology'
+
+    def get_industry(self, symbol):
+        return 'Software'
+
+    def history(self, symbol):
+        """ Full history of a symbol through ``as_of``
+        """
+        if symbol not in self._cache:
+            end = _to_datetime64(date.today())
+            days = np.arange(self.start, end + 1, dtype='M8[D]')
+            self._cache[symbol] = self.histories(symbol, days[np.is_busday(days)])
+        prices = self._cache[symbol]
+        return prices[prices['Date'] <= _to_datetime64(self.as_of)]
+
+    def get_csv(self, symbol, start_date, end_date):
+        """ Yahoo! formatted CSV response, newest quote first
+        """
+        prices = self.history(symbol)
+        prices = prices[(prices['Date'] >= _to_datetime64(start_date)) &
+                        (prices['Date'] <= _to_datetime64(end_date))][::-1]
+        lines = ['Date,Open,High,Low,Close,Volume,Adj Close']
+        lines.extend('%s,%.2f,%.2f,%.2f,%.2f,%d,%.2f' % row for row in
+                     zip(prices['Date'].astype(str), prices['Open'], prices['High'],
+                         prices['Low'], prices['Close'], prices['Volume'],
+                         prices['AdjClose']))
+        return '\n'.join(lines) + '\n'
+
+    def get_historical_price_array(self, symbol, start_date, end_date):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return yahoofinance.parse_historical_prices(self.get_csv(symbol, start_date, end_date))
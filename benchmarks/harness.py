@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+""" harness.py
+
+Minimal offline benchmark harness.
+
+A suite is a list of named callables. Each is timed with the best of several
+repeats, the number of calls per repeat being calibrated so one repeat takes
+at least ``min_time`` seconds. Results are appended to a JSON history file
+and compared against the previous run; anything slower by more than the
+threshold is reported as a regression and the script exits non-zero.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+import numpy as np
+
+
+HISTORY_DIR = os.environ.get('STOCKS_BENCHMARK_DIR',
+                             os.path.expanduser('~/.stocks/benchmarks'))
+
+
+def time_function(function, repeat=5, min_time=0.2):
+    """ Best time per call of function in seconds
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    best = min([elapsed] + timer.repeat(repeat - 1, number))
+    return best / number
+
+
+class Suite(object):
+    """ A named collection of benchmarks
+    """
+    def __init__(self, name):
+        self.name = name
+        self.benchmarks = []
+
+    def add(self, name, function, *args, **kwargs):
+        """ Add a benchmark calling function(*args, **kwargs)
+        """
+        self.benchmarks.append((name, lambda: function(*args, **kwargs)))
+
+    def run(self, repeat=5, min_time=0.2, match=None, verbose=True):
+        """ Time every benchmark whose name contains match
+
+        Returns a dict of benchmark name to seconds per call.
+        """
+        results = {}
+        for name, function in self.benchmarks:
+            if match is not None and match not in name:
+                continue
+            results[name] = time_function(function, repeat, min_time)
+            if verbose:
+                print '%-50s %12s' % (name, format_time(results[name]))
+                sys.stdout.flush()
+        return results
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1.0), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '%.3f %s' % (seconds / scale, unit)
+    return '%.1f ns' % (seconds / 1e-9)
+
+
+def history_path(suite_name, directory=None):
+    return os.path.join(directory or HISTORY_DIR, '%s.json' % suite_name)
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(path, history):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=1, sort_keys=True)
+
+
+def environment():
+    """ Describe the environment results were measured in
+    """
+    try:
+        commit = subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.node()}
+
+
+def compare(results, baseline, threshold=0.2):
+    """ Find benchmarks slower than baseline by more than threshold
+
+    Returns a list of (name, baseline seconds, seconds, ratio) tuples.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name in baseline and baseline[name] > 0:
+            ratio = results[name] / baseline[name]
+            if ratio > 1 + threshold:
+                regressions.append((name, baseline[name], results[name], ratio))
+    return regressions
+
+
+def add_record_arguments(parser):
+    """ Add the --threshold, --history and --no-save options ``record`` reads
+    """
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='slowdown ratio reported as a regression')
+    parser.add_argument('--history', help='JSON history file')
+    parser.add_argument('--no-save', action='store_true', help="don't record this run")
+
+
+def record(results, suite_name, args):
+    """ Compare results with the suite's history, report and save them
+
+    :param results: Dict of benchmark name to seconds.
+    :param args: Parsed options added by ``add_record_arguments``.
+    :returns: Exit status, 1 if anything regressed
+    """
+    path = args.history or history_path(suite_name)
+    history = load_history(path)
+    baseline = {}
+    for run in history:
+        baseline.update(run['results'])
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, after, ratio in regressions:
+        print 'REGRESSION %-39s %12s -> %12s (%.2fx)' % (name, format_time(before),
+                                                         format_time(after), ratio)
+
+    if not args.no_save:
+        run = environment()
+        run.update({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results})
+        history.append(run)
+        save_history(path, history)
+    return 1 if regressions else 0
+
+
+def main(suite, argv=None):
+    """ Command line entry point shared by all suites
+    """
+    parser = argparse.ArgumentParser(description='Run the %s benchmarks' % suite.name)
+    parser.add_argument('-k', '--match', help='only run benchmarks containing this string')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2)
+    add_record_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = suite.run(args.repeat, args.min_time, args.match)
+    return record(results, suite.name, args)
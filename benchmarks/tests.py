@@ -0,0 +1,76 @@
+from datetime import date
+
+import numpy as np
+from sqlalchemy import create_engine, event
+
+from universe import Universe, ticker_symbols
+import models #database
+""" tests.py
+
+Unit tests for the benchmark data generators
+"""
+
+
+# ------------------------------------------------
+# Test Universe
+# ------------------------------------------------
+
+class SQLiteDatabase(object):
+    """ The parts of ``database.Database`` the universe writes through
+    """
+    def __init__(self):
+        self.Base = models.Base
+        self.Engine = create_engine('sqlite://')
+
+
+def test_ticker_symbols():
+    """ [benchmarks.universe] Test symbols are distinct and shortest first
+    """
+    symbols = ticker_symbols(30)
+    np.testing.assert_equal(len(set(symbols)), 30)
+    np.testing.assert_equal(symbols[:2] + symbols[26:28], ['A', 'B', 'AA', 'AB'])
+
+
+def test_history_splits():
+    """ [benchmarks.universe] Test pre-split prices are higher and volumes lower by the factor
+    """
+    universe = Universe(10, years=10, end=date(2013, 6, 28), split_rate=0.5)
+    split = 0
+    for symbol, prices in universe.histories():
+        np.testing.assert_array_equal(prices, universe.history(symbol))
+        factor = prices['Close'] / prices['AdjClose']
+        assert (np.diff(factor) <= 1e-9).all()
+        before = factor >= 4
+        if before.any():
+            split += 1
+            # Share volume times the factor is drawn from the same distribution
+            ratio = (np.median(prices['Volume'][before] * factor[before]) /
+                     np.median(prices['Volume'][np.isclose(factor, 1)]))
+            assert 0.5 < ratio < 2, ratio
+    assert split > 0
+
+
+def test_universe_write():
+    """ [benchmarks.universe] Test quotes are committed a batch at a time with their indicators
+    """
+    db = SQLiteDatabase()
+    db.Base.metadata.create_all(db.Engine)
+    commits = []
+    event.listen(db.Engine, 'commit', lambda connection: commits.append(1))
+    universe = Universe(5, years=2, end=date(2013, 6, 28))
+    lengths = [len(prices) for symbol, prices in universe.histories()]
+    n_quotes = universe.write(db, batch_size=1)
+    np.testing.assert_equal(n_quotes, sum(lengths))
+    engine = db.Engine
+    np.testing.assert_equal(engine.execute('SELECT COUNT(*) FROM Symbols').scalar(), 5)
+    np.testing.assert_equal(engine.execute('SELECT COUNT(*) FROM Quotes').scalar(), n_quotes)
+    np.testing.assert_equal(engine.execute('SELECT COUNT(*) FROM Indicators JOIN Quotes '
+                                           'ON Quotes.Id = Indicators.Id').scalar(), n_quotes)
+    # Symbols, then each ticker's history as soon as it fills a batch
+    np.testing.assert_equal(len(commits), 1 + np.count_nonzero(lengths))
+
+
+if __name__ == '__main__':
+    test_ticker_symbols()
+    test_history_splits()
+    test_universe_write()
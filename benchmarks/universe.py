@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+""" universe.py
+
+Synthetic market universe for scale testing.
+
+Histories are reproducible from the seed alone and each ticker is generated
+independently, so a universe of any size can be streamed a ticker at a time
+or written straight into the Symbols/Quotes tables. Prices follow a market
+factor whose drift and volatility switch between regimes, plus an
+idiosyncratic walk per ticker. Tickers list and delist part way through the
+calendar, split their shares, and miss days to trading halts and data gaps.
+
+sample usage:
+>>> from universe import Universe
+>>> universe = Universe(1000, years=40)
+>>> source = universe.source()              # serve through a FakeSource
+>>> universe.write(database.Database(url))  # or write into the database
+"""
+
+import argparse
+import os
+import sys
+from datetime import date
+
+import numpy as np
+from sqlalchemy import func, select
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'sources'))
+sys.path.insert(0, os.path.join(_root, 'database'))
+import yahoofinance #sources
+from models import Symbol, Quote, Indicator #database
+
+from fakesource import FakeSource
+
+
+# (daily drift, daily volatility) of the market in each regime
+REGIMES = ((0.0005, 0.007),     # calm bull
+           (0.0001, 0.012),     # normal
+           (-0.0012, 0.030))    # crisis
+
+SPLIT_FACTORS = (2.0, 3.0, 1.5)
+
+
+def ticker_symbols(n):
+    """ n distinct upper case ticker symbols, shortest first
+    """
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    symbols = []
+    length = 1
+    while len(symbols) < n:
+        index = np.arange(min(n - len(symbols), 26 ** length))
+        symbols.extend(''.join(letters[(i // 26 ** k) % 26] for k in reversed(range(length)))
+                       for i in index)
+        length += 1
+    return symbols
+
+
+class Universe(object):
+    """ Reproducible synthetic OHLCV histories for many tickers
+
+    :param n_tickers: Number of tickers.
+    :param years: Calendar length in years, ending at ``end``.
+    :param end: (optional) Last date of the calendar. Defaults to today.
+    :param seed: Seed every history is derived from.
+    :param regimes: Sequence of (drift, volatility) market regimes.
+    :param regime_length: Mean length of a regime in business days.
+    :param listed_fraction: Fraction of tickers listed on the first day; the
+    rest list at a random later date.
+    :param delisting_rate: Annual probability a listed ticker delists.
+    :param split_rate: Annual expected number of splits per ticker.
+    :param gap_rate: Probability any single quote is missing.
+    :param halt_rate: Annual expected number of multi-day trading halts.
+    """
+    def __init__(self, n_tickers, years=40, end=None, seed=0, regimes=REGIMES,
+                 regime_length=250, listed_fraction=0.5, delisting_rate=0.02,
+                 split_rate=0.05, gap_rate=0.001, halt_rate=0.02):
+        self.seed = seed
+        self.regimes = np.array(regimes, dtype=float)
+        self.split_rate = split_rate
+        self.gap_rate = gap_rate
+        self.halt_rate = halt_rate
+
+        end = np.datetime64(end or date.today(), 'D')
+        start = end - np.timedelta64(int(365.25 * years), 'D')
+        days = np.arange(start, end + 1, dtype='M8[D]')
+        self.dates = days[np.is_busday(days)]
+        self.symbols = ticker_symbols(n_tickers)
+        self._index = dict((symbol, i) for i, symbol in enumerate(self.symbols))
+
+        random = np.random.RandomState(seed)
+        n = len(self.dates)
+
+        # Market regime path from geometrically distributed regime lengths
+        lengths = random.geometric(1.0 / regime_length, size=n // regime_length * 4 + 4)
+        while lengths.sum() < n:
+            lengths = np.append(lengths, random.geometric(1.0 / regime_length, size=len(lengths)))
+        states = random.randint(len(self.regimes), size=len(lengths))
+        self.regime = np.repeat(states, lengths)[:n]
+        drift, vol = self.regimes[self.regime].T
+        self.market_returns = drift + vol * random.standard_normal(n)
+        self.market_vol = vol
+
+        # Listing and delisting days, [listed, delisted) is the trading span
+        late = random.uniform(size=n_tickers) >= listed_fraction
+        self.listed = np.where(late, random.randint(0, max(n - 250, 1), size=n_tickers), 0)
+        lifetime = random.exponential(252.0 / max(delisting_rate, 1e-9), size=n_tickers)
+        self.delisted = np.minimum(self.listed + 250 + lifetime.astype(np.int64), n)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def history(self, symbol):
+        """ Quote history of one ticker as ``yahoofinance.price_dtype`` records
+
+        Close is unadjusted, so it jumps on split days. AdjClose is adjusted
+        back from the last quote and Volume is in shares traded on the day.
+        """
+        i = self._index[symbol.upper()]
+        random = np.random.RandomState([self.seed, i])
+        listed, delisted = self.listed[i], self.delisted[i]
+        m = delisted - listed
+        vol = self.market_vol[listed:delisted]
+
+        beta = random.uniform(0.5, 1.8)
+        idiosyncratic = random.uniform(0.5, 2.0) * vol * random.standard_normal(m)
+        returns = beta * self.market_returns[listed:delisted] + idiosyncratic
+        adjusted = random.uniform(5, 100) * np.exp(np.cumsum(returns))
+
+        # Prices before a split are higher by its factor
+        per_day = np.ones(m)
+        n_splits = random.poisson(self.split_rate * m / 252.0)
+        per_day[random.randint(1, max(m, 2), size=n_splits) % m] *= random.choice(
+                SPLIT_FACTORS, size=n_splits)
+        factor = np.append(np.cumprod(per_day[::-1])[::-1][1:], 1.0)
+        close = adjusted * factor
+
+        # Intraday prices from overnight and intraday noise
+        previous = np.append(close[:1], close[:-1] / per_day[1:])
+        open_ = previous * np.exp(0.3 * vol * random.standard_normal(m))
+        high = np.maximum(open_, close) * (1 + vol * np.abs(random.standard_normal(m)))
+        low = np.minimum(open_, close) * (1 - vol * np.abs(random.standard_normal(m)))
+        # Fewer shares traded before a split, at a price higher by its factor
+        volume = np.round(random.lognormal(12, 1, m) / factor)
+
+        # Missing days and trading halts
+        keep = random.uniform(size=m) >= self.gap_rate
+        for start in random.randint(0, max(m, 1), size=random.poisson(self.halt_rate * m / 252.0)):
+            keep[start:start + random.randint(2, 10)] = False
+
+        prices = np.empty(keep.sum(), dtype=yahoofinance.price_dtype)
+        prices['Date'] = self.dates[listed:delisted][keep]
+        prices['Open'] = open_[keep]
+        prices['High'] = high[keep]
+        prices['Low'] = low[keep]
+        prices['Close'] = close[keep]
+        prices['Volume'] = volume[keep]
+        prices['AdjClose'] = adjusted[keep]
+        return prices
+
+    def histories(self):
+        """ Iterate over (symbol, history) for every ticker
+        """
+        for symbol in self.symbols:
+            yield symbol, self.history(symbol)
+
+    def source(self, **kwargs):
+        """ A ``FakeSource`` serving this universe's histories
+        """
+        start = self.dates[0].tolist()
+        return FakeSource(start=start, histories=lambda symbol, dates: self.history(symbol),
+                          **kwargs)
+
+    def write(self, db, batch_size=100000):
+        """ Write every ticker into the Symbols, Quotes and Indicators tables
+
+        Each batch of quotes is committed along with its indicator rows, so
+        no transaction grows with the size of the universe.
+
+        :param db: ``Database`` to write to. Tables are created if needed.
+        :param batch_size: Quote rows per executemany and transaction.
+        Histories aren't split, so a batch ends on the first ticker that
+        reaches it.
+        :returns: Number of quotes written
+        """
+        db.Base.metadata.create_all(db.Engine)
+        names = yahoofinance.price_dtype.names
+        n_quotes = 0
+        with db.Engine.begin() as connection:
+            connection.execute(Symbol.__table__.insert(), [
+                    {'Ticker': symbol.lower(), 'Name': '%s Inc.' % symbol,
+                     'Exchange': 'NYSE'} for symbol in self.symbols])
+        rows = []
+        for symbol, prices in self.histories():
+            columns = [prices[name].tolist() for name in names]
+            rows.extend(dict(zip(names, values), Ticker=symbol.lower())
+                        for values in zip(*columns))
+            if len(rows) >= batch_size:
+                n_quotes += _write_quotes(db.Engine, rows)
+                rows = []
+        if rows:
+            n_quotes += _write_quotes(db.Engine, rows)
+        return n_quotes
+
+
+def _write_quotes(engine, rows):
+    # Insert quotes and the indicator rows of their new Ids in one transaction
+    with engine.begin() as connection:
+        last = connection.execute(select([func.max(Quote.Id)])).scalar() or 0
+        connection.execute(Quote.__table__.insert(), rows)
+        connection.execute(Indicator.__table__.insert().from_select(
+                ['Id'], select([Quote.Id]).where(Quote.Id > last)))
+    return len(rows)
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(_root, 'quant'))
+    import database #database
+
+    parser = argparse.ArgumentParser(description='Write a synthetic universe to a database')
+    parser.add_argument('url', help='SQLAlchemy database URL of an empty database')
+    parser.add_argument('--tickers', type=int, default=100)
+    parser.add_argument('--years', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    universe = Universe(args.tickers, args.years, seed=args.seed)
+    print 'Wrote %d quotes for %d tickers' % (universe.write(database.Database(args.url)),
+                                             len(universe))
@@ -3,6 +3,7 @@
 Data sources
 """
 from ..database import Client
+from ..database.tickstore import TickStore
 
 class IntradayQuotes(object):
     """
@@ -37,13 +38,44 @@ class IntradayQuotes(object):
         return self.stock_db.get_quotes(ticker, start_date, end_date, eager_load=True)
 
 
+    def get_price_history(self, tickers, start_date, end_date):
+        """ Get the adjusted closing prices of several securities
+        :param tickers: List of ticker symbols to quote.
+        :param start_date: Starting date of quote list as a string or a
+        ``Datetime.date`` object.
+        :param end_date: Ending date of qoute list as a string or a
+        ``Datetime.date`` object.
+        :returns: Tuple of (tickers, dates, prices) arrays, one element per
+        quote
+        """
+        return self.stock_db.get_price_history(tickers, start_date, end_date)
+
+
+    def get_economic_indicators(self, names, end_date=None):
+        """ Get the stored observations of several economic indicators
+        :param names: List of indicator names.
+        :param end_date: (Optional) Last observation date to get.
+        :returns: Tuple of (dates, values) where values is a dict of
+        indicator name to an array aligned with dates
+        """
+        return self.stock_db.get_economic_indicators(names, end_date)
+
+
 class TickQuotes(object):
     """
-    API for retreiving tick-by-tick data from the stock database
+    API for retreiving tick-by-tick data from the tick store
     """
-    def __init__(self):
-        self.stock_db = Client()
+    def __init__(self, root=None):
+        self.tick_store = TickStore(root)
 
-    def get_quotes(self, ticker):
-        pass
+    def get_quotes(self, ticker, start, end):
+        """ Get the trades for a security in a time range
+        :param ticker: Ticker symbol of the security to quote.
+        :param start: Start of the range as a ``datetime``, ``date`` or
+        ``datetime64``.
+        :param end: End of the range (exclusive). A ``date`` includes the
+        whole day.
+        :returns: Structured array of (timestamp, price, size) records
+        """
+        return self.tick_store.get(ticker, start, end)
 
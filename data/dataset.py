@@ -8,26 +8,29 @@ from pandas import concat
 from sklearn.preprocessing import normalize
 
 from .datafeed import IntradayQuotes
-from .utilities import get_raw_data
+from .utilities import get_indicator_table, get_raw_data
 
 
 class Dataset(object):
     """ Dataset Class
     """
     def __init__(self, symbols=None, sector=None,
-                 index=None, size=None):
+                 index=None, size=None, economic_indicators=None):
         """ Create an instance of the Dataset class
 
         :param symbols: List of securities to include in dataset
         :param sector: List of sectors to include in dataset
         :param index: List of indicies to include in dataset
         :param size: Maximum number of rows to include in dataset
+        :param economic_indicators: List of economic indicators to add as
+        columns, aligned to each security's trading dates
         :param data_callback: function called for each set of data added to the set
         the function should take a numPy ndarray of data as an argument. the return
         value is ignored.
         """
         self.symbols = symbols if hasattr(symbols,'__iter__') else (symbols,)
         self._data = None
+        self.economic_indicators = economic_indicators
         self._initialize_dataset(symbols, sector, index, size)
 
     @property
@@ -68,9 +71,13 @@ class Dataset(object):
 
         if self.symbols is not None:
             data_frames = []
+            # Economic indicators are fetched once and joined to every symbol
+            table = None
+            if self.economic_indicators is not None:
+                table = get_indicator_table(self.economic_indicators)
             # Generate Matricies for each symbol
             for ticker in self.symbols:
-                data = get_raw_data(ticker)
+                data = get_raw_data(ticker, economic_indicators=table)
                 data_frames.append(data)
             # Concatenate Matricies
             self._data = concat(data_frames, keys=self.symbols)
@@ -101,7 +108,8 @@ class MLDataset(Dataset):
     Data set with training and target data for machine learning or regression
     analysis.
     """
-    def __init__(self, symbols=None, sector=None, index=None, size=None, target_function=None):
+    def __init__(self, symbols=None, sector=None, index=None, size=None, target_function=None,
+                 economic_indicators=None):
         """ Create an instance of the MLDataset class
 
         :param symbols: List of securities to include in dataset
@@ -111,11 +119,14 @@ class MLDataset(Dataset):
         :param target_function: function that generates target data for machine
         learning / regression. The function should take a numpy array and
         return a 1D numpy array.
+        :param economic_indicators: List of economic indicators to add as
+        columns, aligned to each security's trading dates
         """
         # Initialize class
         self._training_data = None
         self._target_data = None
-        super(MLDataset, self).__init__(symbols, sector,index, size)
+        super(MLDataset, self).__init__(symbols, sector,index, size,
+                                        economic_indicators)
         self._ML_init(target_function)
 
 
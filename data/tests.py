@@ -0,0 +1,113 @@
+from datetime import date
+
+import numpy as np
+
+import utilities
+""" tests.py
+
+Unit tests for data module
+"""
+
+
+# ------------------------------------------------
+# Test Economic Indicator Alignment
+# ------------------------------------------------
+
+def test_asof_join():
+    """ [data.utilities] Test values are known from their date plus the lag
+    """
+    dates = np.array(['2013-01-01', '2013-01-02', '2013-01-03', '2013-01-07'], dtype='M8[D]')
+    series_dates = np.array(['2013-01-02', '2013-01-04'], dtype='M8[D]')
+    np.testing.assert_array_equal(utilities.asof_join(dates, series_dates, [1.0, 2.0]),
+                                  [np.nan, 1.0, 1.0, 2.0])
+    np.testing.assert_array_equal(utilities.asof_join(dates, series_dates, [1.0, 2.0], lag=1),
+                                  [np.nan, np.nan, 1.0, 2.0])
+    np.testing.assert_array_equal(utilities.asof_join(dates, series_dates, [1.0, 2.0], lag=10),
+                                  [np.nan] * 4)
+    np.testing.assert_array_equal(utilities.asof_join(dates, [], []), [np.nan] * 4)
+
+
+def test_align_indicators():
+    """ [data.utilities] Test missing observations are skipped and release lags applied
+    """
+    table = utilities.IndicatorTable(
+        ['real_gdp', 'sp_500'],
+        np.array(['2013-01-01', '2013-01-02', '2013-01-03'], dtype='M8[D]'),
+        {'real_gdp': np.array([15.0, np.nan, np.nan]),
+         'sp_500': np.array([np.nan, 1460.0, np.nan])})
+    dates = np.array(['2013-01-02', '2013-01-03', '2013-01-04', '2013-05-01'], dtype='M8[D]')
+    aligned = utilities.align_indicators(dates, table)
+    # real_gdp is only published 120 days after its observation date
+    np.testing.assert_array_equal(aligned['real_gdp'], [np.nan, np.nan, np.nan, 15.0])
+    # NaN rows of other series don't hide the last sp_500 value
+    np.testing.assert_array_equal(aligned['sp_500'], [np.nan, 1460.0, 1460.0, 1460.0])
+    aligned = utilities.align_indicators(dates, table, lags={'real_gdp': 0, 'sp_500': 0})
+    np.testing.assert_array_equal(aligned['real_gdp'], [15.0] * 4)
+    np.testing.assert_array_equal(aligned['sp_500'], [1460.0] * 4)
+    # Series not ingested yet come back all NaN
+    table = utilities.IndicatorTable(['sp_500'], table.dates, {'sp_500': np.full(3, np.nan)})
+    np.testing.assert_array_equal(utilities.align_indicators(dates, table)['sp_500'],
+                                  [np.nan] * 4)
+
+
+# ------------------------------------------------
+# Test Price Matrix
+# ------------------------------------------------
+
+def test_align_prices():
+    """ [data.utilities] Test listing masks and forward fill
+    """
+    tickers = ['a', 'a', 'a', 'b', 'b']
+    dates = np.array(['2013-01-02', '2013-01-04', '2013-01-07',
+                      '2013-01-03', '2013-01-04'], dtype='M8[D]')
+    matrix = utilities.align_prices(tickers, dates, [1.0, 2.0, 3.0, 10.0, 11.0])
+    np.testing.assert_array_equal(matrix.dates, np.array(['2013-01-02', '2013-01-03',
+                                                          '2013-01-04', '2013-01-07'],
+                                                         dtype='M8[D]'))
+    np.testing.assert_array_equal(matrix.tickers, ['a', 'b'])
+    np.testing.assert_array_equal(matrix.prices, [[1.0, np.nan], [1.0, 10.0],
+                                                  [2.0, 11.0], [3.0, np.nan]])
+    np.testing.assert_array_equal(matrix.listed, [[True, False], [True, True],
+                                                  [True, True], [True, False]])
+    np.testing.assert_array_equal(matrix.observed[:, 0], [True, False, True, True])
+
+
+def test_align_prices_no_fill():
+    """ [data.utilities] Test missing prices stay NaN without fill and columns follow symbols
+    """
+    tickers = ['a', 'a', 'b', 'b', 'b']
+    dates = np.array(['2013-01-02', '2013-01-04', '2013-01-02',
+                      '2013-01-03', '2013-01-04'], dtype='M8[D]')
+    matrix = utilities.align_prices(tickers, dates, [1.0, 2.0, 10.0, 11.0, 12.0],
+                                    symbols=['b', 'a', 'c'], fill=False)
+    np.testing.assert_array_equal(matrix.prices, [[10.0, 1.0, np.nan],
+                                                  [11.0, np.nan, np.nan],
+                                                  [12.0, 2.0, np.nan]])
+    np.testing.assert_(not matrix.listed[:, 2].any())
+
+
+class FakeQuotes(object):
+    """ IntradayQuotes answering from fixed arrays
+    """
+    requested = None
+
+    def get_price_history(self, tickers, start, end):
+        FakeQuotes.requested = (list(tickers), start, end)
+        return (np.array(['aapl', 'goog', 'aapl']),
+                np.array(['2013-01-02', '2013-01-03', '2013-01-03'], dtype='M8[D]'),
+                np.array([500.0, 700.0, 510.0]))
+
+
+def test_get_price_matrix():
+    """ [data.utilities] Test price matrix columns follow the requested tickers
+    """
+    original = utilities.IntradayQuotes
+    utilities.IntradayQuotes = FakeQuotes
+    try:
+        matrix = utilities.get_price_matrix(['GOOG', 'AAPL'], date(2013, 1, 1), date(2013, 1, 31))
+    finally:
+        utilities.IntradayQuotes = original
+    np.testing.assert_equal(FakeQuotes.requested,
+                            (['goog', 'aapl'], date(2013, 1, 1), date(2013, 1, 31)))
+    np.testing.assert_array_equal(matrix.tickers, ['goog', 'aapl'])
+    np.testing.assert_array_equal(matrix.prices, [[np.nan, 500.0], [700.0, 510.0]])
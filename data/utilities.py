@@ -2,17 +2,25 @@
 """ utilities.py
 Utility functions
 """
+from collections import namedtuple
+
 import numpy as np
 from pandas import DataFrame
 
+from ..sources import fred
 from .datafeed import IntradayQuotes
 from datetime import date
 
-def get_raw_data(ticker, start=date(1900, 01, 01), end=date.today()):
+def get_raw_data(ticker, start=date(1900, 01, 01), end=date.today(),
+                 economic_indicators=None):
     """ Generate an array of quotes and indicators for the given stock
     :param ticker: Ticker of the security to quote.
     :param start: (Optional) Start of date range to get.
     :param end: (Optional) End of date range to get.
+    :param economic_indicators: (Optional) Names of economic indicators to
+    add as columns, or an ``IndicatorTable`` already fetched with
+    ``get_indicator_table``. Each is aligned to the quote dates with
+    ``asof_join``.
     :returns: tuple containing (raw data, ticker_and_date_info)
    """
     # Get quotes
@@ -161,5 +169,135 @@ def get_raw_data(ticker, start=date(1900, 01, 01), end=date.today()):
 
     data = DataFrame(raw_data[:,1:], index=raw_data[:,0], columns=col_names).dropna()
 
+    if economic_indicators is not None:
+        if not isinstance(economic_indicators, IndicatorTable):
+            economic_indicators = get_indicator_table(economic_indicators, end)
+        aligned = align_indicators(np.array(data.index, dtype='M8[D]'),
+                                   economic_indicators)
+        for name in economic_indicators.names:
+            data[name] = aligned[name]
+
     return data
 
+
+# Stored observations of several economic indicators
+IndicatorTable = namedtuple('IndicatorTable', ['names', 'dates', 'values'])
+
+
+def get_indicator_table(names=None, end=None):
+    """ Fetch economic indicator observations for as-of joins in one query
+    :param names: (Optional) Indicator names. Defaults to every FRED series.
+    :param end: (Optional) Last observation date to get.
+    :returns: ``IndicatorTable``
+    """
+    names = sorted(names or fred.indicators)
+    dates, values = IntradayQuotes().get_economic_indicators(names, end)
+    return IndicatorTable(names, dates, values)
+
+
+def asof_join(dates, series_dates, values, lag=0):
+    """ Align a series to dates using the last value known on each date
+
+    :param dates: Sorted array of dates to align to.
+    :param series_dates: Sorted array of observation dates.
+    :param values: Array of observations aligned with series_dates.
+    :param lag: (Optional) Days between an observation's date and the first
+    date it may be used.
+    :returns: Array of values aligned with dates, NaN before the first
+    available observation and everywhere for a series without observations
+    """
+    dates = np.asarray(dates, dtype='M8[D]')
+    if not len(series_dates):
+        return np.full(len(dates), np.nan)
+    available = np.asarray(series_dates, dtype='M8[D]') + np.timedelta64(lag, 'D')
+    rows = np.searchsorted(available, dates, side='right') - 1
+    aligned = np.asarray(values, dtype=float)[np.maximum(rows, 0)]
+    aligned[rows < 0] = np.nan
+    return aligned
+
+
+def align_indicators(dates, table, lags=None):
+    """ As-of join every series of an ``IndicatorTable`` onto dates
+
+    Each series is reduced to the dates it was actually observed on and
+    shifted by its release lag, so monthly and quarterly series only appear
+    once they would have been published.
+
+    :param dates: Sorted array of dates to align to.
+    :param table: ``IndicatorTable`` of observations.
+    :param lags: (Optional) Dict of indicator name to release lag in days.
+    Defaults to ``fred.release_lag``.
+    :returns: Dict of indicator name to an array aligned with dates
+    """
+    lags = lags or {}
+    aligned = {}
+    for name in table.names:
+        values = table.values[name]
+        observed = ~np.isnan(values)
+        lag = lags.get(name, fred.release_lag(name))
+        aligned[name] = asof_join(dates, table.dates[observed], values[observed], lag)
+    return aligned
+
+
+# Calendar-aligned prices for several securities
+PriceMatrix = namedtuple('PriceMatrix', ['dates', 'tickers', 'prices',
+                                         'listed', 'observed'])
+
+
+def align_prices(tickers, dates, prices, symbols=None, fill=True):
+    """ Build a (dates x tickers) price matrix from quote columns
+
+    The master date index is the sorted union of all quote dates. A security
+    is listed from its first quote through its last; dates outside that span
+    are masked. Missing quotes inside the span are forward-filled from the
+    last known price if fill is True.
+
+    :param tickers: Array of ticker symbols, one per quote.
+    :param dates: Array of quote dates, one per quote.
+    :param prices: Array of prices, one per quote.
+    :param symbols: (Optional) Column order of the matrix. Defaults to the
+    sorted unique tickers.
+    :param fill: (Optional) Forward-fill missing prices.
+    :returns: ``PriceMatrix`` of dates, tickers, prices, listed mask and
+    observed mask. Prices are NaN where a security is not listed.
+    """
+    tickers = np.asarray(tickers)
+    dates = np.asarray(dates, dtype='M8[D]')
+    prices = np.asarray(prices, dtype=float)
+    symbols = np.unique(tickers) if symbols is None else np.asarray(symbols, dtype=object)
+
+    master, rows = np.unique(dates, return_inverse=True)
+    order = np.argsort(symbols)
+    cols = order[np.searchsorted(symbols[order], tickers)]
+
+    matrix = np.empty((len(master), len(symbols)))
+    matrix[:] = np.nan
+    matrix[rows, cols] = prices
+    observed = ~np.isnan(matrix)
+
+    # Listed from first through last quote
+    index = np.arange(len(master))[:, np.newaxis]
+    first = np.where(observed, index, len(master)).min(axis=0)
+    last = np.where(observed, index, -1).max(axis=0)
+    listed = (index >= first) & (index <= last)
+
+    if fill:
+        # Row of the most recent observation for each cell
+        latest = np.maximum.accumulate(np.where(observed, index, 0), axis=0)
+        matrix = matrix[latest, np.arange(len(symbols))]
+        matrix[~listed] = np.nan
+
+    return PriceMatrix(master, symbols, matrix, listed, observed)
+
+
+def get_price_matrix(tickers, start=date(1900, 01, 01), end=date.today(), fill=True):
+    """ Generate a calendar-aligned price matrix for several stocks
+    :param tickers: Tickers of the securities to quote.
+    :param start: (Optional) Start of date range to get.
+    :param end: (Optional) End of date range to get.
+    :param fill: (Optional) Forward-fill missing prices.
+    :returns: ``PriceMatrix`` with one column per ticker
+    """
+    symbols = np.array([ticker.lower() for ticker in tickers], dtype=object)
+    quote_tickers, dates, prices = IntradayQuotes().get_price_history(symbols, start, end)
+    return align_prices(quote_tickers, dates, prices, symbols, fill)
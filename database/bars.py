@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+""" bars.py
+Tick-to-bar aggregation
+
+Bars are built with vectorized group-boundary reductions: ticks are
+assigned a group key, group starts are found where the key changes, and
+OHLCV values are reduced with ``ufunc.reduceat``.
+"""
+
+import os
+
+import numpy as np
+
+from tickstore import TickStore, to_ns
+
+bar_dtype = np.dtype([('timestamp', 'M8[ns]'),
+                      ('open', np.float64),
+                      ('high', np.float64),
+                      ('low', np.float64),
+                      ('close', np.float64),
+                      ('volume', np.int64),
+                      ('n_ticks', np.int64)])
+
+_units = {'s': 10 ** 9, 'm': 60 * 10 ** 9, 'h': 3600 * 10 ** 9,
+          'd': 86400 * 10 ** 9}
+
+
+def parse_resolution(resolution):
+    """ Convert a resolution string such as '5m' to nanoseconds
+    """
+    return int(resolution[:-1]) * _units[resolution[-1].lower()]
+
+
+def _group_starts(keys):
+    """ Indices where a sorted key array changes value
+    """
+    if not len(keys):
+        return np.empty(0, dtype=np.intp)
+    return np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+
+
+def _reduce(starts, timestamps, opens, highs, lows, closes, volumes, counts):
+    """ Reduce groups beginning at starts into bars
+    """
+    bars = np.empty(len(starts), dtype=bar_dtype)
+    if not len(starts):
+        return bars
+    ends = np.append(starts[1:], len(opens)) - 1
+    bars['timestamp'] = timestamps
+    bars['open'] = opens[starts]
+    bars['high'] = np.maximum.reduceat(highs, starts)
+    bars['low'] = np.minimum.reduceat(lows, starts)
+    bars['close'] = closes[ends]
+    bars['volume'] = np.add.reduceat(volumes, starts)
+    bars['n_ticks'] = np.add.reduceat(counts, starts)
+    return bars
+
+
+def _tick_bars(keys, timestamps, prices, sizes):
+    timestamps = np.asarray(timestamps).view(np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=np.int64)
+    starts = _group_starts(keys)
+    return _reduce(starts, timestamps[starts].view('M8[ns]'), prices, prices,
+                   prices, prices, sizes, np.ones(len(prices), dtype=np.int64))
+
+
+def time_bars(timestamps, prices, sizes, resolution):
+    """ Build fixed-interval bars from ticks
+
+    :param timestamps: Sorted array of datetime64[ns] or int64 ns timestamps.
+    :param prices: Array of trade prices.
+    :param sizes: Array of trade sizes.
+    :param resolution: Bar width as a string ('1s', '1m', '5m', '1h', ...)
+    or in nanoseconds.
+    :returns: Structured array of ``bar_dtype`` bars labelled with the start
+    of their interval. Intervals without trades are omitted.
+    """
+    width = parse_resolution(resolution) if isinstance(resolution, basestring) else resolution
+    keys = np.asarray(timestamps).view(np.int64) // width
+    bars = _tick_bars(keys, timestamps, prices, sizes)
+    bars['timestamp'] = (keys[_group_starts(keys)] * width).view('M8[ns]')
+    return bars
+
+
+def volume_bars(timestamps, prices, sizes, threshold):
+    """ Build bars that each contain threshold shares traded
+
+    A tick belongs to the bar in which its first share trades, so bars may
+    overshoot the threshold by up to one trade.
+
+    :returns: Structured array of ``bar_dtype`` bars labelled with the time
+    of their first trade.
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    keys = (np.cumsum(sizes) - sizes) // threshold
+    return _tick_bars(keys, timestamps, prices, sizes)
+
+
+def dollar_bars(timestamps, prices, sizes, threshold):
+    """ Build bars that each contain threshold dollars traded
+
+    :returns: Structured array of ``bar_dtype`` bars labelled with the time
+    of their first trade.
+    """
+    dollars = np.asarray(prices, dtype=np.float64) * np.asarray(sizes)
+    keys = ((np.cumsum(dollars) - dollars) // threshold).astype(np.int64)
+    return _tick_bars(keys, timestamps, prices, sizes)
+
+
+def resample_bars(bars, resolution):
+    """ Aggregate time bars into coarser time bars
+
+    :param bars: Structured array of ``bar_dtype`` time bars.
+    :param resolution: Coarser bar width. Must be a multiple of the width of
+    the input bars for the result to match bars built from ticks.
+    """
+    width = parse_resolution(resolution) if isinstance(resolution, basestring) else resolution
+    keys = bars['timestamp'].view(np.int64) // width
+    starts = _group_starts(keys)
+    return _reduce(starts, (keys[starts] * width).view('M8[ns]'), bars['open'],
+                   bars['high'], bars['low'], bars['close'], bars['volume'],
+                   bars['n_ticks'])
+
+
+class BarCache(object):
+    """ Multi-resolution time bar pyramids over the tick store
+
+    For each symbol and day the finest resolution is built from the ticks and
+    every coarser level is resampled from the level below it, so ticks are
+    scanned once per day. Levels are saved next to the day's ticks and
+    memory-mapped on later reads. A level is rebuilt when the day has gained
+    ticks since it was saved.
+    """
+    def __init__(self, store=None, resolutions=('1s', '1m', '5m', '15m', '1h', '1d')):
+        """ Create an instance of the BarCache class
+
+        :param store: (Optional) ``TickStore`` to read ticks from.
+        :param resolutions: (Optional) Pyramid levels from finest to
+        coarsest. Each must be a multiple of the one before it.
+        """
+        self.store = TickStore() if store is None else store
+        self.resolutions = list(resolutions)
+        self._levels = {}
+
+    def _bar_path(self, symbol, day, resolution):
+        return os.path.join(self.store.day_path(symbol, day), 'bars_%s.npy' % resolution)
+
+    def _build(self, symbol, day):
+        """ Build and save every level of a day's pyramid
+        """
+        ticks = self.store.read_day(symbol, day)
+        bars = time_bars(ticks['timestamp'], ticks['price'], ticks['size'],
+                         self.resolutions[0])
+        levels = {self.resolutions[0]: bars}
+        for resolution in self.resolutions[1:]:
+            bars = resample_bars(bars, resolution)
+            levels[resolution] = bars
+        for resolution, bars in levels.iteritems():
+            np.save(self._bar_path(symbol, day, resolution), bars)
+        return levels
+
+    def day_bars(self, symbol, day, resolution):
+        """ Get one day of bars at a pyramid resolution
+        """
+        day = np.datetime64(day, 'D')
+        n_ticks = len(self.store.read_day(symbol, day)['timestamp'])
+        key = (symbol.lower(), day, resolution)
+        bars = self._levels.get(key)
+        if bars is None and os.path.exists(self._bar_path(symbol, day, resolution)):
+            bars = np.load(self._bar_path(symbol, day, resolution), mmap_mode='r')
+        if bars is None or bars['n_ticks'].sum() != n_ticks:
+            levels = self._build(symbol, day)
+            for level, level_bars in levels.iteritems():
+                self._levels[(symbol.lower(), day, level)] = level_bars
+            bars = levels[resolution]
+        self._levels[key] = bars
+        return bars
+
+    def get_bars(self, symbol, start, end, resolution='1m'):
+        """ Get time bars for a symbol in a time range
+
+        :param symbol: Ticker symbol.
+        :param start: Start of the range (inclusive).
+        :param end: End of the range (exclusive). A date without a time
+        includes that whole day.
+        :param resolution: (Optional) One of the pyramid resolutions.
+        :returns: Structured array of ``bar_dtype`` bars starting in the range.
+        """
+        if resolution not in self.resolutions:
+            raise ValueError('Resolution %s is not cached' % resolution)
+        start = to_ns(start)
+        end = to_ns(end, end=True)
+        days = self.store.days(symbol)
+        days = days[(days.astype(np.int64) >= start // _units['d']) &
+                    (days.astype(np.int64) <= (end - 1) // _units['d'])]
+        chunks = []
+        for day in days:
+            bars = self.day_bars(symbol, day, resolution)
+            lo, hi = np.searchsorted(bars['timestamp'].view(np.int64), [start, end])
+            chunks.append(bars[lo:hi])
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=bar_dtype)
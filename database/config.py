@@ -13,3 +13,6 @@ for key in envkeys:
 STOCKS_SQL_HOSTNAME = 'localhost'
 STOCKS_SQL_DATABASE = 'stock_data'
 
+# Tick data store
+STOCKS_TICK_STORE = os.environ.get('STOCKS_TICK_STORE',
+                                   os.path.expanduser('~/.stocks/ticks'))
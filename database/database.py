@@ -1,44 +1,67 @@
 #!/usr/bin/env python
 
+import os
 import sys
 import time
 import datetime
 from datetime import  date, timedelta
-from models import Base, Symbol, Quote, Indicator
+from models import Base, Symbol, Quote, Indicator, EconomicIndicator
 from numpy import array, asarray
-from sqlalchemy import create_engine, desc
+from sqlalchemy import create_engine, func
 from sqlalchemy.orm import sessionmaker, joinedload, eagerload
-from sqlalchemy.sql import and_
+from sqlalchemy.sql import and_, select
 
 
 import config as cfg
 import indicators
+import planner
+import timing
+import tradingcalendar
+import upsert
+import watermarks
+from profiling import QueryProfiler
 
 sys.path.insert(0, '../sources')
 import yahoofinance as quotes #sources
+from router import SourceRouter
 
 class Database(object):
 
-    def __init__(self):
+    def __init__(self, engine_config=None, profile=None):
         """
         Set up database access
+
+        :param engine_config: (optional) SQLAlchemy database URL. Defaults to
+        the MySQL database in config.py.
+        :param profile: (optional) Profile SQL statements with a
+        ``QueryProfiler``. Defaults to on if STOCKS_PROFILE_SQL is set.
         """
         self.Base = Base
 
-        # Handle edge case here
-        if cfg.STOCKS_SQL_PASSWORD == '':
-            engine_config = 'mysql://%s@%s/%s' % (cfg.STOCKS_SQL_USER,
-                                                  cfg.STOCKS_SQL_HOSTNAME,
-                                                  cfg.STOCKS_SQL_DATABASE)
-        else:
-            engine_config = 'mysql://%s:%s@%s/%s' % (cfg.STOCKS_SQL_USER,
-                                                     cfg.STOCKS_SQL_PASSWORD,
-                                                     cfg.STOCKS_SQL_HOSTNAME,
-                                                     cfg.STOCKS_SQL_DATABASE)
+        if engine_config is None:
+            engine_config = self._default_engine_config()
         self.Engine = create_engine(engine_config)
         self.Session = sessionmaker()
         self.Session.configure(bind=self.Engine)
 
+        if profile is None:
+            profile = bool(os.environ.get('STOCKS_PROFILE_SQL'))
+        self.profiler = QueryProfiler(self.Engine)
+        if profile:
+            self.profiler.start()
+
+    def _default_engine_config(self):
+        # Handle edge case here
+        if cfg.STOCKS_SQL_PASSWORD == '':
+            return 'mysql://%s@%s/%s' % (cfg.STOCKS_SQL_USER,
+                                         cfg.STOCKS_SQL_HOSTNAME,
+                                         cfg.STOCKS_SQL_DATABASE)
+        else:
+            return 'mysql://%s:%s@%s/%s' % (cfg.STOCKS_SQL_USER,
+                                            cfg.STOCKS_SQL_PASSWORD,
+                                            cfg.STOCKS_SQL_HOSTNAME,
+                                            cfg.STOCKS_SQL_DATABASE)
+
 
 class Manager(object):
     """ Stock Database Manager
@@ -46,8 +69,29 @@ class Manager(object):
     This is used to manage the stock database
     """
 
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db=None, source=None, router=None, request_delay=10,
+                 calendar=None):
+        """
+        :param db: (optional) ``Database`` to manage. Defaults to the
+        configured database.
+        :param source: (optional) Module used for symbol information and,
+        unless a router is given, historical prices. Defaults to yahoofinance.
+        :param router: (optional) ``SourceRouter`` used to download quotes.
+        :param request_delay: (optional) Seconds to wait after each download.
+        :param calendar: (optional) ``TradingCalendar`` deciding which days
+        can have quotes. Defaults to the NYSE calendar.
+        """
+        self.db = db or Database()
+        self.source = source or quotes
+        if router is None:
+            if source is None:
+                router = SourceRouter.default(observer=self._record_request)
+            else:
+                router = SourceRouter([(source.__name__, source.get_historical_price_array)],
+                                      observer=self._record_request)
+        self.router = router
+        self.request_delay = request_delay
+        self.calendar = calendar or tradingcalendar.get('NYSE')
 
     def create_database(self):
         """ Create stock database tables if they do not exist already
@@ -76,21 +120,21 @@ class Manager(object):
             return
 
         if name is None:
-            name = quotes.get_name(ticker)
+            name = self.source.get_name(ticker)
         if exchange is None:
-            exchange = quotes.get_stock_exchange(ticker)
+            exchange = self.source.get_stock_exchange(ticker)
         if sector is None:
-            sector = quotes.get_sector(ticker)
+            sector = self.source.get_sector(ticker)
         if industry is None:
-            industry = quotes.get_industry(ticker)
+            industry = self.source.get_industry(ticker)
 
         stock = Symbol(ticker, name, exchange, sector, industry)
 
         session.add(stock)
-        q = self._download_quotes(ticker, date(1900, 01, 01), date.today())
-        for quote in q:
-            quote.Features = Indicator(quote.Id)
-        session.add_all(q)
+        session.flush()
+        prices, adjusted = self._download_quotes(ticker, date(1900, 01, 01), date.today())
+        if prices is not None:
+            self._insert_quotes(ticker, prices, session, adjusted=adjusted)
         session.commit()
         session.close()
         self.update_quotes(ticker)
@@ -109,26 +153,67 @@ class Manager(object):
         symbol = session.query(Symbol).filter_by(Ticker=ticker.lower()).first()
         print "Deleting %s. This can take a while!" % (ticker.upper())
         session.delete(symbol)
+        watermarks.delete(session, ticker)
         session.commit()
         session.close()
 
 
+    def _record_request(self, name, seconds, error):
+        timing.record('source_request', seconds, source=name, error=bool(error))
+
+    @timing.timed('download_quotes')
     def _download_quotes(self, ticker, start_date, end_date):
-        """ Get quotes from Yahoo Finance
+        """ Get quotes from the fastest healthy source
+
+        Sources of adjusted prices are asked first. When they all fail the
+        router falls back to unadjusted ones.
+
+        Returns (prices, adjusted): a structured array of quotes in ascending
+        date order, or None if there are none, and False if their AdjClose
+        isn't adjusted for splits and dividends.
         """
         ticker = ticker.lower()
-        if start_date == end_date:
-            return
-        start = start_date
-        end = end_date
-        data = quotes.get_historical_prices(ticker, start, end)
-        data = data[len(data) - 1:0:-1]
-        if len(data):
-            return [Quote(ticker, val[0], val[1], val[2],
-                          val[3], val[4], val[5], val[6])
-                    for val in data if len(val) > 6]
+        name, prices = self.router.route(ticker, start_date, end_date, adjusted=False)
+        adjusted = name not in self.router.unadjusted
+        if len(prices):
+            return prices, adjusted
         else:
-            return
+            return None, adjusted
+
+    def _insert_quotes(self, ticker, prices, session, watermark=True, adjusted=True):
+        """ Bulk upsert an array of quotes and their indicator rows
+
+        Quotes are upserted on (Ticker, Date) in executemany batches, so
+        quotes already stored are overwritten rather than duplicated. Then
+        one INSERT ... SELECT adds an empty Indicators row for every quote of
+        the ticker without one.
+        The ticker's quotes watermark is moved in the same transaction unless
+        watermark is False, as when filling gaps behind it.
+        Unadjusted prices move the unadjusted watermark back to their oldest
+        quote. Adjusted prices downloaded through the newest quote from on or
+        before it replace every unadjusted quote, and delete it.
+
+        Returns the date of the newest quote inserted.
+        """
+        columns = [prices[name].tolist() for name in prices.dtype.names]
+        rows = [dict(zip(prices.dtype.names, values), Ticker=ticker)
+                for values in zip(*columns)]
+        upsert.upsert(session, Quote.__table__, ['Ticker', 'Date'], rows)
+        missing = (select([Quote.Id])
+                   .select_from(Quote.__table__.outerjoin(
+                       Indicator.__table__, Indicator.Id == Quote.Id))
+                   .where(and_(Quote.Ticker == ticker, Indicator.Id == None)))
+        session.execute(Indicator.__table__.insert().from_select(['Id'], missing))
+        newest = prices['Date'].max().tolist()
+        if watermark:
+            watermarks.save(session, ticker, {watermarks.QUOTES: newest})
+        oldest = prices['Date'].min().tolist()
+        unadjusted = watermarks.load(session, [ticker]).get(ticker, {}).get(watermarks.UNADJUSTED)
+        if not adjusted and (unadjusted is None or oldest < unadjusted):
+            watermarks.save(session, ticker, {watermarks.UNADJUSTED: oldest})
+        elif adjusted and watermark and unadjusted is not None and oldest <= unadjusted:
+            watermarks.delete(session, ticker, [watermarks.UNADJUSTED])
+        return newest
 
     def _calculate_indicators(self, ticker):
         """ Calculate indicators and add to indicators table
@@ -145,40 +230,131 @@ class Manager(object):
         session.commit()
         session.close()
 
-    def update_quotes(self, ticker, check_all=True):
+    def _last_complete_day(self):
+        # Ignore missing quotes for today until they're published, this keeps
+        # us from hitting the yahoo API when we know the data isn't there yet
+        return self.calendar.last_complete_day()
+
+    @timing.timed('update_quotes')
+    def update_quotes(self, ticker, check_all=True, marks=None):
         """
         Get all missing quotes through current day for the given stock
+
+        :param marks: (optional) The ticker's watermarks, as loaded by
+        ``watermarks.load``. Loaded here if not given.
         """
         ticker = ticker.lower()
         stockquotes = None
         session = self.db.Session()
-        last = session.query(Quote).filter_by(
-            Ticker=ticker).order_by(desc(Quote.Date)).first().Date
+        if marks is None:
+            marks = watermarks.load(session, [ticker]).get(ticker, {})
+        with timing.span('last_quote'):
+            last = marks.get(watermarks.QUOTES)
+            if last is None:
+                # Answered from the (Ticker, Date) index alone
+                last = session.query(func.max(Quote.Date)).filter(
+                    Quote.Ticker == ticker).scalar()
         start_date = last + timedelta(days=1)
-        # Ignore missing quotes for today unless it's after 7, this keeps
-        # us from hitting the yahoo API when we know the data isn't there yet
-        end_date = (date.today() if datetime.datetime.now().time() >
-                datetime.time(19) else date.today() - timedelta(days=1))
-        if end_date > start_date:
-            stockquotes = self._download_quotes(ticker, start_date, end_date)
+        # Unadjusted quotes are downloaded again
+        if marks.get(watermarks.UNADJUSTED) is not None:
+            start_date = min(start_date, marks[watermarks.UNADJUSTED])
+        end_date = self._last_complete_day()
+        if start_date <= end_date and self.calendar.count(start_date, end_date):
+            stockquotes, adjusted = self._download_quotes(ticker, start_date, end_date)
             # Appease the API rate limit gods????
-            time.sleep(10)
+            with timing.span('rate_limit_sleep'):
+                time.sleep(self.request_delay)
             if stockquotes is not None:
-                for quote in stockquotes:
-                    quote.Features = Indicator(quote.Id)
-                session.add_all(stockquotes)
+                with timing.span('insert_quotes'):
+                    marks[watermarks.QUOTES] = self._insert_quotes(ticker, stockquotes, session,
+                                                                   adjusted=adjusted)
         #indicators.update_all(ticker, session, False, check_all)
-        indicators.update_all(ticker, session, True, check_all)
-        session.commit()
+        with timing.span('update_indicators'):
+            indicators.update_all(ticker, session, True, check_all, marks)
+        with timing.span('commit'):
+            session.commit()
+        session.close()
+
+    def plan_sync(self, check_all=False):
+        """
+        Plan the downloads and recomputes a sync needs, without running them
+
+        :param check_all: Also look for missing days inside each history.
+        """
+        session = self.db.Session()
+        names = [calc.name for calc in indicators.indicators]
+        plan = planner.plan(session, self._last_complete_day(), names, gaps=check_all,
+                            calendar=self.calendar.busdaycal)
         session.close()
+        return plan
 
-    def sync_quotes(self, check_all=False):
+    def sync_quotes(self, check_all=False, dry_run=False):
         """
         Updates quotes for all stocks through current day.
+
+        The whole universe is planned up front, so tickers with nothing to
+        download or compute cost nothing, and every download covers exactly
+        the days missing.
+
+        :param check_all: Also look for and fill missing days inside each
+        history, recomputing indicators of the tickers filled.
+        :param dry_run: Print the plan instead of running it.
+
+        A download that fails is reported and skipped, along with the
+        ticker's later gaps, and the rest of the plan still runs.
+        """
+        plan = self.plan_sync(check_all)
+        if dry_run:
+            print planner.format_plan(plan)
+            return plan
+
+        session = self.db.Session()
+        filled = set()
+        failed = set()
+        for item in plan.downloads:
+            if item.kind == planner.GAP and item.ticker in failed:
+                continue
+            try:
+                self._run_download(item, session)
+            except Exception, e:
+                session.rollback()
+                failed.add(item.ticker)
+                print 'Failed to download %s %s .. %s: %s' % (item.ticker, item.start,
+                                                             item.end, e)
+                continue
+            if item.kind == planner.GAP:
+                filled.add(item.ticker)
+        marks = watermarks.load(session)
+        for ticker in plan.recompute:
+            with timing.span('update_indicators'):
+                indicators.update_all(ticker, session, True, ticker in filled,
+                                      marks.get(ticker, {}))
+            print 'Updated quotes for %s' % ticker
+        session.close()
+        return plan
+
+    def _run_download(self, item, session):
+        """ Download and insert the quotes of a planner WorkItem
+
+        Gap downloads move the ticker's gaps watermark to the end of the
+        item, in the same transaction, whether or not the source had the
+        missing days.
         """
-        for symbol in self._stocks():
-            self.update_quotes(symbol, check_all)
-            print 'Updated quotes for %s' % symbol
+        prices, adjusted = self._download_quotes(item.ticker, item.start, item.end)
+        # Appease the API rate limit gods????
+        with timing.span('rate_limit_sleep'):
+            time.sleep(self.request_delay)
+        if prices is not None:
+            # Coalesced requests download some stored days again, which the
+            # upsert simply overwrites
+            with timing.span('insert_quotes'):
+                self._insert_quotes(item.ticker, prices, session,
+                                    watermark=item.kind != planner.GAP, adjusted=adjusted)
+        if item.kind == planner.GAP:
+            tried = watermarks.load(session, [item.ticker]).get(item.ticker, {})
+            if tried.get(watermarks.GAPS) is None or tried[watermarks.GAPS] < item.end:
+                watermarks.save(session, item.ticker, {watermarks.GAPS: item.end})
+        session.commit()
 
     def check_stock_exists(self, ticker, session=None):
         """
@@ -203,8 +379,8 @@ class Manager(object):
         if session is None:
             newsession = True
             session = self.db.Session()
-        exists = bool(session.query(Symbol).filter_by(Ticker=ticker.lower(),
-                                                      Date=q_date).count())
+        exists = session.query(Quote.Id).filter_by(Ticker=ticker.lower(),
+                                                   Date=q_date).first() is not None
         if newsession:
             session.close()
         return exists
@@ -239,9 +415,13 @@ class Client(object):
     The stock database client is used to access the stock database.
     """
 
-    def __init__(self):
-        self.db = Database()
-        self.manager = Manager()
+    def __init__(self, db=None):
+        """
+        :param db: (optional) ``Database`` to read. Defaults to the
+        configured database.
+        """
+        self.db = db or Database()
+        self.manager = Manager(self.db)
 
     def get_quotes(self, ticker, quote_date, end_date=None, eager_load=False):
         """
@@ -277,6 +457,51 @@ class Client(object):
         session.close()
         return stockquotes
 
+    def get_price_history(self, tickers, start_date, end_date, column='AdjClose'):
+        """
+        Return the price history for several stocks from a single query.
+
+        :param tickers: List of stock ticker symbols
+        :param start_date: Starting date for quotes to retrieve.
+        :param end_date: Ending date for quotes to retrieve.
+        :param column: (optional) Quote column to retrieve.
+        :returns: tuple of (tickers, dates, prices) numpy arrays with one
+        element per quote, ordered by date.
+        """
+        tickers = [ticker.lower() for ticker in tickers]
+        session = self.db.Session()
+        rows = (session.query(Quote.Ticker, Quote.Date, getattr(Quote, column))
+                .filter(and_(Quote.Ticker.in_(tickers),
+                             Quote.Date >= start_date,
+                             Quote.Date <= end_date))
+                .order_by(Quote.Date).all())
+        session.close()
+        symbols, dates, prices = zip(*rows) if rows else ((), (), ())
+        return (array(symbols, dtype=object), array(dates, dtype='M8[D]'),
+                array(prices, dtype=float))
+
+    def get_economic_indicators(self, names, end_date=None):
+        """
+        Return economic indicator observations from a single query.
+
+        :param names: List of indicator column names
+        :param end_date: (optional) Last observation date to retrieve.
+        :returns: tuple of (dates, values) where dates is a sorted numpy
+        array of observation dates and values is a dict of indicator name to
+        an array of values aligned with dates. Missing values are NaN.
+        """
+        session = self.db.Session()
+        query = session.query(EconomicIndicator.Date,
+                              *[getattr(EconomicIndicator, name) for name in names])
+        if end_date is not None:
+            query = query.filter(EconomicIndicator.Date <= end_date)
+        rows = query.order_by(EconomicIndicator.Date).all()
+        session.close()
+        columns = zip(*rows) if rows else [()] * (len(names) + 1)
+        values = dict((name, array(column, dtype=float))
+                      for name, column in zip(names, columns[1:]))
+        return array(columns[0], dtype='M8[D]'), values
+
     def stocks(self, session=None):
         """
         Return a list of the stocks available in the database
@@ -306,6 +531,9 @@ if __name__ == '__main__':
             check_all = len(argv) > 2
             db.sync_quotes(check_all)
 
+        elif opt == 'plan':
+            db.sync_quotes(len(argv) > 2, dry_run=True)
+
         elif opt == 'add':
             db.add_stock(str(argv[2]))
 
@@ -315,5 +543,16 @@ if __name__ == '__main__':
         elif opt == 'delete':
             db.delete_symbol(str(argv[2]))
 
+        if db.db.profiler.active:
+            print db.db.profiler.report()
+
+        if timing.enabled:
+            # Dump to STOCKS_TIMING_OUTPUT if set, otherwise print a summary
+            output = os.environ.get('STOCKS_TIMING_OUTPUT')
+            if output:
+                timing.dump(output)
+            else:
+                print timing.summary()
+
     else:
         exit('No command specified. Exiting.')
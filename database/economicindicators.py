@@ -4,54 +4,133 @@ Economic indicators
 """
 
 from ..sources import fred
-from datetime import date
+from .models import EconomicIndicator as EconomicIndicatorRow
+from datetime import date, timedelta
+from sqlalchemy import case, func, text
+
 
 class EconomicIndicator(object):
-    def __init__(self, name, column_name,frequency_hint=None):
+    """ A single FRED series stored in a column of the EconomicIndicators
+    table
+    """
+    def __init__(self, name, column_name=None, frequency_hint=None):
         self.name = name
-        self.column_name = name
+        self.column_name = column_name or name
         self.frequency = frequency_hint
 
     def update(self, session):
-        data = fred.get(self.column_name)
-        for row in data:
-            if not self._row_exists(session, row[0]):
-                pass
+        """ Download and store observations newer than the watermark
+        """
+        marks = watermarks(session, [self.column_name])
+        previous = latest_values(session, marks)
+        observations = self.download(marks[self.column_name],
+                                     previous.get(self.column_name))
+        upsert_observations(session, {self.column_name: observations})
 
+    def download(self, watermark=None, previous=None):
+        """ Get observations after the watermark date as (dates, values) arrays
 
-    def _row_exists(self, session, fordate):
-        """ Return true if a row exists for the specified date
+        :param previous: (optional) Value stored at the watermark, carried
+        into leading dates without data.
         """
-        return (session.query(EconomicIndicator).filter_by(Date=fordate).count() > 0)
+        start = watermark + timedelta(days=1) if watermark is not None else None
+        return fred.get(self.name, start, previous)
 
-    def _get_most_recent_row(self, session):
-        last = (session.query(EconomicIndicator).order_by(EconomicIndicator.Date.desc())
-                                    .first())
-        return last
-
-    def _new_data_available(self,  session):
+    def _new_data_available(self, session):
         """ Check if column is up to date
         """
-        available = False
-        data = fred.get(self.column_name)
-        newest_available = data[0][0]
-        last = self._get_most_recent_row(session)
+        watermark = watermarks(session, [self.column_name])[self.column_name]
+        return watermark is None or watermark < date.today()
+
+
+def watermarks(session, columns):
+    """ Get the newest populated date of each column in one query
+
+    Returns a dict of column name to date, or None for empty columns.
+    """
+    Row = EconomicIndicatorRow
+    newest = [func.max(case([(getattr(Row, column) != None, Row.Date)]))
+              for column in columns]
+    dates = session.query(*newest).one()
+    return dict(zip(columns, [_to_date(d) for d in dates]))
+
+
+def latest_values(session, marks):
+    """ Get each column's value at its watermark in one query
+
+    :param marks: Dict of column name to watermark date, as returned by
+    ``watermarks``.
+    :returns: Dict of column name to value, for columns with a watermark
+    """
+    dates = set(mark for mark in marks.itervalues() if mark is not None)
+    if not dates:
+        return {}
+    Row = EconomicIndicatorRow
+    columns = sorted(marks)
+    rows = dict((_to_date(row[0]), row[1:]) for row in
+                session.query(Row.Date, *[getattr(Row, c) for c in columns])
+                       .filter(Row.Date.in_(dates)))
+    return dict((column, rows[marks[column]][i]) for i, column in enumerate(columns)
+                if marks[column] in rows)
+
+
+def _to_date(value):
+    # Some drivers hand back aggregate dates as strings
+    if value is None or isinstance(value, date):
+        return value
+    return date(*map(int, str(value)[:10].split('-')))
+
+
+def upsert_observations(session, observations):
+    """ Bulk upsert observations keyed by date
+
+    :param observations: Dict of column name to (dates, values) arrays.
+    Observations of every column on a date are merged into one row, and each
+    date is written by a single INSERT ... ON DUPLICATE KEY UPDATE that
+    leaves the columns it doesn't carry untouched.
+    """
+    columns = sorted(observations)
+    rows = {}
+    for column in columns:
+        dates, values = observations[column]
+        for obs_date, value in zip(dates.tolist(), values.tolist()):
+            rows.setdefault(obs_date, dict.fromkeys(columns))[column] = value
+    if not rows:
+        return 0
+    params = [dict(row, Date=obs_date) for obs_date, row in sorted(rows.iteritems())]
+    session.execute(_upsert_statement(session.bind.dialect.name, columns), params)
+    return len(params)
 
-        # Here we check for the whole row's existance in case this is the first column we're updating
-        if last is not None:
-            newest_stored = last.Date
-        else:
-            newest_stored = date(1900,01,01)
-        if newest_available > newest_stored:
-            # The row doesn't exist yet
-            available = True
 
-        if available is False:
-            # The row already exists, see if this column is populated
-            if getattr(last, self.column_name) is None:
-                available = True
-        return available
+def _upsert_statement(dialect, columns):
+    table = EconomicIndicatorRow.__tablename__
+    names = ', '.join(['Date'] + columns)
+    values = ', '.join(':' + name for name in ['Date'] + columns)
+    if dialect == 'mysql':
+        updates = ', '.join('%s = COALESCE(VALUES(%s), %s)' % (c, c, c) for c in columns)
+        sql = 'INSERT INTO %s (%s) VALUES (%s) ON DUPLICATE KEY UPDATE %s'
+    else:
+        updates = ', '.join('%s = COALESCE(excluded.%s, %s.%s)' % (c, c, table, c)
+                            for c in columns)
+        sql = 'INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (Date) DO UPDATE SET %s'
+    return text(sql % (table, names, values, updates))
 
 
+def update_all(session, names=None):
+    """ Bring every FRED series up to date
 
+    Watermarks for all columns are read in a single query, only newer
+    observations are downloaded, concurrently under the FRED rate limit,
+    and all of them are written in one batch of upserts.
 
+    :param names: (optional) Series to update, defaults to all of
+    ``fred.indicators``.
+    """
+    names = sorted(names or fred.indicators)
+    marks = watermarks(session, names)
+    starts = dict((name, mark + timedelta(days=1))
+                  for name, mark in marks.iteritems() if mark is not None)
+    observations = fred.get_many(names, starts, latest_values(session, marks))
+    n_rows = upsert_observations(session, observations)
+    session.commit()
+    return n_rows
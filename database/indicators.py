@@ -9,6 +9,9 @@ from pandas import DataFrame
 from sqlalchemy.orm import joinedload
 
 from models import Quote, Indicator
+import timing
+import upsert
+import watermarks
 
 sys.path.insert(0, '../quant')
 import analysis #quant
@@ -27,20 +30,33 @@ class indicator(object):
         self.columns = [self.name] if columns is None else [self.name] + columns
         self.columns_to_pass = ['adj_close'] if columns is None else ['adj_close'] + columns
 
-    def update(self, ticker, session, commit=True, check_all=False):
+    def update(self, ticker, session, commit=True, check_all=False, marks=None):
+        """ Calculate missing values of this indicator
+
+        :param marks: (optional) The ticker's watermarks, as loaded by
+        ``watermarks.load``. They replace the per-indicator freshness query
+        and are updated with the new watermark.
+        """
+        with timing.span('indicator_update', indicator=self.name):
+            self._update(ticker, session, commit, check_all, marks)
+
+    def _update(self, ticker, session, commit=True, check_all=False, marks=None):
 
         # Grab some info
         ticker = ticker.lower()
 
         # See if there is anything to do
-        if not check_all and self._is_up_to_date(ticker, session):
-            return
+        with timing.span('indicator_check', indicator=self.name):
+            if not check_all and self._is_up_to_date(ticker, session, marks):
+                return
 
         # Commit the changes if the calculation relies on another column in the dataset
         if len(self.columns_to_pass) > 1:
-            session.commit()
+            with timing.span('indicator_commit', indicator=self.name):
+                session.commit()
 
-        data = self._get_columns(ticker, session)
+        with timing.span('indicator_get_columns', indicator=self.name):
+            data = self._get_columns(ticker, session)
 
         # Find the empty rows
         if not check_all:
@@ -53,35 +69,44 @@ class indicator(object):
                 args = self._get_args(data, update_range)
 
                 # Calculate moving average
-                calculated = self.function(*args)
+                with timing.span('indicator_calculate', indicator=self.name):
+                    calculated = self.function(*args)
 
                 # Update the database
-                column = data[self.name]
                 ids = data['ids']
                 undef = self.nundefined
-                for row_index in rows_to_update:
-                    value  = calculated[row_index - first_to_update + undef]
-                    if np.isnan(value):
-                        value = None
-                    (session.query(Indicator)
-                            .filter_by(Id=ids[row_index])
-                            .update({self.name: value}))
+                with timing.span('indicator_write', indicator=self.name):
+                    self._write(session, [ids[row_index] for row_index in rows_to_update],
+                                [calculated[row_index - first_to_update + undef]
+                                 for row_index in rows_to_update])
         else:
             args = self._get_args(data)
             #print("Calling "+str(self.function)+" with arguments: "+str(args))
-            calculated = self.function(*args)
-            ids = data['ids']
-            for row_index in range(len(data['ids'])):
-                value = calculated[row_index]
-                if np.isnan(value):
-                    value = None
-                session.query(Indicator).filter_by(Id=ids[row_index]).update({self.name:value})
+            with timing.span('indicator_calculate', indicator=self.name):
+                calculated = self.function(*args)
+            with timing.span('indicator_write', indicator=self.name):
+                self._write(session, data['ids'], calculated)
+
+        # Record how far this indicator is computed, in the same transaction
+        if len(data):
+            newest = data['dates'].iloc[-1]
+            watermarks.save(session, ticker, {self.name: newest})
+            if marks is not None:
+                marks[self.name] = newest
 
         # Commit changes
         if commit:
-            session.commit()
+            with timing.span('indicator_commit', indicator=self.name):
+                session.commit()
 
 
+    def _write(self, session, ids, values):
+        """ Upsert calculated values into Indicators rows in batches
+        """
+        rows = [{'Id': int(qid), self.name: None if np.isnan(value) else float(value)}
+                for qid, value in zip(ids, values)]
+        upsert.upsert(session, Indicator.__table__, ['Id'], rows)
+
     def _get_args(self, data, range_data=None):
         """ Get arguments to pass to indicator calculation function
         """
@@ -108,23 +133,32 @@ class indicator(object):
 
 
 
-    def _is_up_to_date(self, ticker, session):
+    def _is_up_to_date(self, ticker, session, marks=None):
         """ Check if column is up to date
         """
-        last = (session.query(Quote).filter_by(Ticker=ticker)
-                                    .order_by(Quote.Date.desc())
-                                    .first())
-        return getattr(last.Features, self.name) is not None
+        if marks is not None and watermarks.QUOTES in marks and self.name in marks:
+            return watermarks.is_fresh(marks, self.name)
+
+        # No watermark yet, walk the (Ticker, Date) index backwards to the newest quote and
+        # read just this column of its indicators
+        value = (session.query(getattr(Indicator, self.name))
+                        .join(Quote, Quote.Id == Indicator.Id)
+                        .filter(Quote.Ticker == ticker)
+                        .order_by(Quote.Date.desc())
+                        .limit(1)
+                        .scalar())
+        return value is not None
 
     def _get_columns(self, ticker, session):
         """ Get a numpy ndarray containing the specified columns
         TODO: Make this work
         """
         ticker = ticker.lower()
-        keys = ['ids', 'adj_close'] + self.columns
+        keys = ['ids', 'dates', 'adj_close'] + self.columns
         values = []
-        for q in session.query(Quote).options(joinedload(Quote.Features, innerJoin=True)).filter_by(Ticker=ticker).order_by(Quote.Date).all():
-            values.append([q.Id, q.AdjClose] + [getattr(q.Features, name) for name in self.columns])
+        # Values are written with core upserts, so refresh objects already in the session
+        for q in session.query(Quote).options(joinedload(Quote.Features, innerjoin=True)).filter_by(Ticker=ticker).order_by(Quote.Date).populate_existing().all():
+            values.append([q.Id, q.Date, q.AdjClose] + [getattr(q.Features, name) for name in self.columns])
 
         return DataFrame(values, columns=keys)
 
@@ -232,7 +266,7 @@ indicators = [
 
 
 
-def update_all(ticker, session, commit=True, check_all=False):
+def update_all(ticker, session, commit=True, check_all=False, marks=None):
     """ Update all columns in the Indicators table
 
     :param ticker: Ticker symbol of stock to update.
@@ -245,10 +279,15 @@ def update_all(ticker, session, commit=True, check_all=False):
     :param check_all: (Optional) Whether or not to check for and u   pdate holes
     in the data
     :type check_all: bool
+    :param marks: (Optional) The ticker's watermarks. Loaded with one query if
+    not given.
+    :type marks: dict
     """
     ticker = ticker.lower()
+    if marks is None:
+        marks = watermarks.load(session, [ticker]).get(ticker, {})
     for calc in indicators:
-        calc.update(ticker, session, commit, check_all)
+        calc.update(ticker, session, commit, check_all, marks)
 
     if commit:
         session.commit()
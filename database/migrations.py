@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+""" migrations.py
+
+Schema migrations for existing stock databases.
+
+``create_all`` only creates missing tables, so databases created before an
+index or layout change need these to catch up. Every migration checks the
+current schema first and is safe to run twice.
+
+usage:
+    python migrations.py index                  # add the (Ticker, Date) index
+    python migrations.py watermarks             # create and backfill Watermarks
+    python migrations.py economic               # rename and add EconomicIndicators columns
+    python migrations.py partition year [--run] # print or run partitioning
+    python migrations.py partition hash 16 [--run]
+"""
+
+import sys
+
+from sqlalchemy import inspect, text
+
+from sqlalchemy.orm import sessionmaker
+
+from models import Quote, Indicator, Watermark, EconomicIndicator
+import watermarks
+
+
+TICKER_DATE_INDEX = 'ix_Quotes_Ticker_Date'
+
+# (table, name) of the foreign keys partitioning drops, as MySQL names them
+PARTITION_FOREIGN_KEYS = [('Indicators', 'Indicators_ibfk_1'),
+                          ('Quotes', 'Quotes_ibfk_1')]
+
+# Columns of EconomicIndicators renamed since it was first released
+ECONOMIC_RENAMES = {'civillian_unemployment_rate': 'civilian_unemployment_rate'}
+
+
+def has_index(engine, table, name):
+    return any(index['name'] == name for index in inspect(engine).get_indexes(table))
+
+
+def delete_duplicate_quotes(engine):
+    """ Delete all but the first stored quote of every (Ticker, Date) pair,
+    along with their indicator rows
+
+    :returns: Number of quotes deleted
+    """
+    duplicates = ('SELECT q.Id FROM Quotes q JOIN '
+                  '(SELECT Ticker, Date, MIN(Id) AS Id FROM Quotes '
+                  ' GROUP BY Ticker, Date HAVING COUNT(*) > 1) keep '
+                  'ON q.Ticker = keep.Ticker AND q.Date = keep.Date AND q.Id > keep.Id')
+    with engine.begin() as connection:
+        ids = [row[0] for row in connection.execute(text(duplicates))]
+        for start in range(0, len(ids), 1000):
+            chunk = ids[start:start + 1000]
+            connection.execute(Indicator.__table__.delete().where(Indicator.Id.in_(chunk)))
+            connection.execute(Quote.__table__.delete().where(Quote.Id.in_(chunk)))
+    return len(ids)
+
+
+def add_ticker_date_index(engine, dedupe=True):
+    """ Add the unique (Ticker, Date) index to Quotes
+
+    Duplicate quotes would make the unique index fail, so they are deleted
+    first unless dedupe is False.
+
+    :returns: True if the index was created, False if it already existed
+    """
+    if has_index(engine, Quote.__tablename__, TICKER_DATE_INDEX):
+        return False
+    if dedupe:
+        delete_duplicate_quotes(engine)
+    index = [i for i in Quote.__table__.indexes if i.name == TICKER_DATE_INDEX][0]
+    index.create(engine)
+    return True
+
+
+def create_watermarks(engine, names=None):
+    """ Create the Watermarks table and backfill it from Quotes and Indicators
+
+    :param names: (optional) Indicator columns to compute watermarks for.
+    Defaults to every indicator in ``indicators.indicators``.
+    :returns: Number of watermarks written
+    """
+    if names is None:
+        import indicators
+        names = [calc.name for calc in indicators.indicators]
+    Watermark.__table__.create(engine, checkfirst=True)
+    session = sessionmaker(bind=engine)()
+    try:
+        watermarks.rebuild(session, names)
+        session.commit()
+        return session.query(Watermark).count()
+    finally:
+        session.close()
+
+
+def economic_indicator_statements(engine):
+    """ Statements bringing an existing EconomicIndicators table up to the model
+
+    Renamed columns keep their data. Columns the table lacks, such as the
+    Wilshire indexes, are added empty and filled by the next FRED update.
+    """
+    table = EconomicIndicator.__table__
+    existing = set(column['name'] for column in inspect(engine).get_columns(table.name))
+    dialect = engine.dialect
+    statements = []
+    for old, new in sorted(ECONOMIC_RENAMES.iteritems()):
+        if old in existing and new not in existing:
+            if dialect.name == 'mysql':
+                statements.append('ALTER TABLE %s CHANGE %s %s %s' % (
+                    table.name, old, new, table.c[new].type.compile(dialect)))
+            else:
+                statements.append('ALTER TABLE %s RENAME COLUMN %s TO %s'
+                                  % (table.name, old, new))
+            existing.add(new)
+    for column in table.columns:
+        if column.name not in existing:
+            statements.append('ALTER TABLE %s ADD COLUMN %s %s' % (
+                table.name, column.name, column.type.compile(dialect)))
+    return statements
+
+
+def upgrade_economic_indicators(engine):
+    """ Rename and add EconomicIndicators columns to match the model
+
+    Creates the table if it doesn't exist.
+
+    :returns: List of statements run
+    """
+    table = EconomicIndicator.__table__
+    if not engine.has_table(table.name):
+        table.create(engine)
+        return []
+    statements = economic_indicator_statements(engine)
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+    return statements
+
+
+def partition_statements(scheme='year', partitions=16, first_year=1960, last_year=2040):
+    """ MySQL statements partitioning Quotes by year or by ticker hash
+
+    MySQL doesn't allow foreign keys on partitioned InnoDB tables, and every
+    unique key, the primary key included, must contain the partitioning
+    columns. So the statements drop the foreign keys between Quotes, Symbols
+    and Indicators, widen the primary key to (Id, Date) or (Id, Ticker), and
+    only then partition. Referential integrity is left to the application,
+    which already writes Quotes and Indicators together.
+
+    :param scheme: 'year' for RANGE partitions on YEAR(Date), or 'hash' for
+    KEY partitions on Ticker.
+    :param partitions: Number of partitions for the hash scheme.
+    :param first_year: First year with its own partition for the year scheme.
+    :param last_year: Last year with its own partition for the year scheme.
+    """
+    statements = ['ALTER TABLE %s DROP FOREIGN KEY %s' % key for key in PARTITION_FOREIGN_KEYS]
+    if scheme == 'year':
+        ranges = ['PARTITION p%d VALUES LESS THAN (%d)' % (year, year + 1)
+                  for year in range(first_year, last_year + 1)]
+        ranges.insert(0, 'PARTITION p_old VALUES LESS THAN (%d)' % first_year)
+        ranges.append('PARTITION p_future VALUES LESS THAN MAXVALUE')
+        statements += ['ALTER TABLE Quotes DROP PRIMARY KEY, ADD PRIMARY KEY (Id, Date)',
+                       'ALTER TABLE Quotes PARTITION BY RANGE (YEAR(Date)) (%s)'
+                       % ', '.join(ranges)]
+    elif scheme == 'hash':
+        statements += ['ALTER TABLE Quotes DROP PRIMARY KEY, ADD PRIMARY KEY (Id, Ticker)',
+                       'ALTER TABLE Quotes PARTITION BY KEY (Ticker) PARTITIONS %d'
+                       % partitions]
+    else:
+        raise ValueError('Unknown partitioning scheme %s' % scheme)
+    return statements
+
+
+def missing_foreign_keys(engine):
+    """ (table, name) of the foreign keys partitioning drops that don't exist
+    """
+    inspector = inspect(engine)
+    return [(table, name) for table, name in PARTITION_FOREIGN_KEYS
+            if name not in [key['name'] for key in inspector.get_foreign_keys(table)]]
+
+
+def partition_quotes(engine, scheme='year', partitions=16, dry_run=True, **kwargs):
+    """ Partition the Quotes table
+
+    MySQL commits every ALTER TABLE implicitly, so the statements can't run
+    in one transaction. If one fails, the ones before it stay applied and
+    the rest have to be run by hand from the dry run listing. To avoid
+    failing half way on a table that is already partitioned, or whose
+    foreign keys have other names, they are checked before anything runs.
+
+    :param dry_run: Only return the statements that would run.
+    :returns: List of statements
+    """
+    statements = partition_statements(scheme, partitions, **kwargs)
+    if not dry_run:
+        if engine.dialect.name != 'mysql':
+            raise ValueError('Partitioning is only supported on MySQL, not %s'
+                             % engine.dialect.name)
+        missing = missing_foreign_keys(engine)
+        if missing:
+            raise ValueError('Foreign keys %s not found, Quotes may already be partitioned'
+                             % ', '.join('%s.%s' % key for key in missing))
+        connection = engine.connect()
+        try:
+            for statement in statements:
+                connection.execute(text(statement))
+        finally:
+            connection.close()
+    return statements
+
+
+def explain(engine, statement, params=None):
+    """ Query plan of a statement as a list of rows
+    """
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    return [tuple(row) for row in engine.execute(text(prefix + statement), **(params or {}))]
+
+
+if __name__ == '__main__':
+    from database import Database
+    argv = [arg for arg in sys.argv[1:] if arg != '--run']
+    if not argv:
+        exit('No migration specified. Exiting.')
+    engine = Database().Engine
+
+    if argv[0] == 'index':
+        if add_ticker_date_index(engine):
+            print 'Created %s' % TICKER_DATE_INDEX
+        else:
+            print '%s already exists' % TICKER_DATE_INDEX
+
+    elif argv[0] == 'watermarks':
+        print 'Wrote %d watermarks' % create_watermarks(engine)
+
+    elif argv[0] == 'economic':
+        for statement in upgrade_economic_indicators(engine):
+            print statement + ';'
+
+    elif argv[0] == 'partition':
+        scheme = argv[1] if len(argv) > 1 else 'year'
+        partitions = int(argv[2]) if len(argv) > 2 else 16
+        for statement in partition_quotes(engine, scheme, partitions,
+                                          dry_run='--run' not in sys.argv):
+            print statement + ';'
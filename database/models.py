@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -39,6 +39,10 @@ class Quote(Base):
     Stock Quotes Table Model
     """
     __tablename__ = 'Quotes'
+    __table_args__ = (
+        # Every hot query filters by ticker and orders or ranges by date
+        Index('ix_Quotes_Ticker_Date', 'Ticker', 'Date', unique=True),
+    )
 
     Id = Column(Integer, primary_key=True)
     Ticker = Column(String(5), ForeignKey('Symbols.Ticker'))
@@ -50,13 +54,9 @@ class Quote(Base):
     Volume = Column(Float)
     AdjClose = Column(Float)
     Features = relationship('Indicator', uselist=False,
-                            backref='Quotes', lazy='lazy',
+                            backref='Quotes', lazy='select',
                             cascade='all, delete, delete-orphan',
                             order_by=Date)
-    EconomicIndicators = relationship('EconomicIndicator', uselist=False,
-                                    backref='Quotes', lazy='lazy',
-                                    cascade='all, delete, delete-orphan',
-                                    order_by=Date)
 
     def __init__(self, Ticker, Date, Open, High, Low, Close, Volume, AdjClose):
         self.Ticker = Ticker
@@ -222,12 +222,12 @@ class EconomicIndicator(Base):
     """
     __tablename__ = 'EconomicIndicators'
 
-    Date = Column(Date, ForeignKey('Quotes.Date'),primary_key=True)
+    Date = Column(Date, primary_key=True)
     bank_prime_loan_rate = Column(Float)
     primary_credit_rate = Column(Float)
     consumer_price_index = Column(Float)
     real_gdp = Column(Float)
-    civillian_unemployment_rate = Column(Float)
+    civilian_unemployment_rate = Column(Float)
     m2_money_stock = Column(Float)
     dow_jones_industrial = Column(Float)
     dow_jones_composite = Column(Float)
@@ -242,9 +242,69 @@ class EconomicIndicator(Base):
     libor_6mo = Column(Float)
     libor_12mo = Column(Float)
 
+    # Wilshire indexes, price (pi) and total market (tmi)
+    wilshire_2500_pi = Column(Float)
+    wilshire_2500_tmi = Column(Float)
+    wilshire_4500_pi = Column(Float)
+    wilshire_4500_tmi = Column(Float)
+    wilshire_5000_pi = Column(Float)
+    wilshire_5000_tmi = Column(Float)
+    wilshire_5000_full_cap_pi = Column(Float)
+    wilshire_5000_full_cap_tmi = Column(Float)
+    wilshire_internet_tmi = Column(Float)
+    wilshire_small_cap_250_pi = Column(Float)
+    wilshire_small_cap_250_tmi = Column(Float)
+    wilshire_us_micro_cap_pi = Column(Float)
+    wilshire_us_micro_cap_tmi = Column(Float)
+    wilshire_us_small_cap_pi = Column(Float)
+    wilshire_us_small_cap_tmi = Column(Float)
+    wilshire_us_small_cap_growth_pi = Column(Float)
+    wilshire_us_small_cap_growth_tmi = Column(Float)
+    wilshire_us_small_cap_value_pi = Column(Float)
+    wilshire_us_small_cap_value_tmi = Column(Float)
+    wilshire_us_mid_cap_pi = Column(Float)
+    wilshire_us_mid_cap_tmi = Column(Float)
+    wilshire_us_mid_cap_growth_pi = Column(Float)
+    wilshire_us_mid_cap_growth_tmi = Column(Float)
+    wilshire_us_mid_cap_value_pi = Column(Float)
+    wilshire_us_mid_cap_value_tmi = Column(Float)
+    wilshire_us_large_cap_pi = Column(Float)
+    wilshire_us_large_cap_tmi = Column(Float)
+    wilshire_us_large_cap_growth_pi = Column(Float)
+    wilshire_us_large_cap_growth_tmi = Column(Float)
+    wilshire_us_large_cap_value_pi = Column(Float)
+    wilshire_us_large_cap_value_tmi = Column(Float)
+    wilshire_us_reit_pi = Column(Float)
+    wilshire_us_reit_tmi = Column(Float)
+    wilshire_us_resi_pi = Column(Float)
+    wilshire_us_resi_tmi = Column(Float)
+
 
     def __init__(self, Date):
         self.Date = Date
 
     def __repr__(self):
         return "<Economic Indicators on %s>" % self.Date
+
+
+class Watermark(Base):
+    """
+    Freshness of each ticker's data
+
+    One row per ticker holds the date of its newest quote (Name 'quotes'),
+    and one row per indicator the newest quote date it has been computed
+    through.
+    """
+    __tablename__ = 'Watermarks'
+
+    Ticker = Column(String(5), primary_key=True)
+    Name = Column(String(32), primary_key=True)
+    Date = Column(Date)
+
+    def __init__(self, Ticker, Name, Date):
+        self.Ticker = Ticker
+        self.Name = Name
+        self.Date = Date
+
+    def __repr__(self):
+        return "<Watermark(%s, %s, %s)>" % (self.Ticker, self.Name, self.Date)
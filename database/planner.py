@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+""" planner.py
+
+Plan a sync of the whole universe up front.
+
+The last quote date of every symbol comes from its quotes watermark, and
+only symbols without one are looked up in Quotes. When gaps are checked, one
+grouped query gives the first and last quote date and the number of quotes
+of every symbol instead. Together with the exchange trading calendar that
+says exactly which days can be missing: trading days after the last quote,
+and, when gaps are checked, trading days between the first and last quote
+with no quote stored. Tails start at the ticker's unadjusted watermark
+instead when it has one, so quotes a fallback source stored unadjusted are
+replaced. Missing days of a ticker are coalesced into as few
+download requests as possible, since a request costs the same whatever its
+length, and the requests are ordered by priority. Gaps are only looked for
+after the ticker's gaps watermark, so days a source never had aren't
+requested on every sync.
+
+sample usage:
+>>> plan = planner.plan(session, date(2013, 6, 28))
+>>> print planner.format_plan(plan)
+>>> for item in plan.downloads:
+...     download(item.ticker, item.start, item.end)
+"""
+
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+from sqlalchemy import func
+
+from models import Symbol, Quote
+import tradingcalendar
+import watermarks
+
+
+# Start of the full history downloaded for symbols without quotes
+HISTORY_START = date(1900, 01, 01)
+
+# Kinds of downloads, in order of priority
+TAIL, NEW, GAP = 'tail', 'new', 'gap'
+_priority = {TAIL: 0, NEW: 1, GAP: 2}
+
+# A download request for one ticker
+#   missing: Trading days in [start, end] without a quote, or with one from a
+#   source of unadjusted prices, as M8[D]. None for symbols without any quotes.
+WorkItem = namedtuple('WorkItem', ['ticker', 'kind', 'start', 'end', 'missing'])
+
+# A sync plan
+#   downloads: WorkItems in the order they should run
+#   recompute: Tickers whose indicators need updating afterwards
+Plan = namedtuple('Plan', ['end_date', 'downloads', 'recompute'])
+
+
+def _day(value):
+    return np.datetime64(watermarks._to_date(value), 'D')
+
+
+def _default_calendar():
+    return tradingcalendar.get('NYSE').busdaycal
+
+
+def trading_days(start, end, calendar=None):
+    """ Business days in [start, end] as a sorted M8[D] array
+    """
+    calendar = calendar or _default_calendar()
+    days = np.arange(_day(start), _day(end) + 1, dtype='M8[D]')
+    return days[np.is_busday(days, busdaycal=calendar)]
+
+
+def coalesce(ticker, kind, missing, overlap=5, calendar=None):
+    """ Merge missing days into as few WorkItems as possible
+
+    Runs of missing days separated by at most overlap trading days that are
+    already stored are fetched by one request, downloading those days again.
+
+    :param missing: Sorted M8[D] array of missing trading days.
+    """
+    calendar = calendar or _default_calendar()
+    if not len(missing):
+        return []
+    # Stored trading days between consecutive missing days
+    between = np.busday_count(missing[:-1] + 1, missing[1:], busdaycal=calendar)
+    cuts = np.where(between > overlap)[0] + 1
+    return [WorkItem(ticker, kind, run[0].tolist(), run[-1].tolist(), run)
+            for run in np.split(missing, cuts)]
+
+
+def quote_ranges(session):
+    """ (ticker, first date, last date, count) of every symbol in one query
+
+    Symbols without quotes have None dates and a count of 0.
+    """
+    rows = (session.query(Symbol.Ticker, func.min(Quote.Date), func.max(Quote.Date),
+                          func.count(Quote.Id))
+                   .outerjoin(Quote, Quote.Ticker == Symbol.Ticker)
+                   .group_by(Symbol.Ticker))
+    return [(ticker, watermarks._to_date(first), watermarks._to_date(last), count)
+            for ticker, first, last, count in rows]
+
+
+def last_dates(session, marks):
+    """ (ticker, None, last date, None) of every symbol from the watermarks
+
+    Only symbols without a quotes watermark are looked up in Quotes, with one
+    grouped query. Symbols without quotes have a None last date.
+
+    :param marks: Watermarks of every ticker, as loaded by ``watermarks.load``.
+    """
+    last = dict((ticker, marks.get(ticker, {}).get(watermarks.QUOTES))
+                for (ticker,) in session.query(Symbol.Ticker))
+    unmarked = [ticker for ticker, day in last.iteritems() if day is None]
+    if unmarked:
+        for ticker, day in (session.query(Quote.Ticker, func.max(Quote.Date))
+                                   .filter(Quote.Ticker.in_(unmarked))
+                                   .group_by(Quote.Ticker)):
+            last[ticker] = watermarks._to_date(day)
+    return [(ticker, None, day, None) for ticker, day in sorted(last.iteritems())]
+
+
+def _stored_dates(session, tickers):
+    # Dates of the tickers with gaps, in one query
+    dates = dict((ticker, []) for ticker in tickers)
+    if tickers:
+        for ticker, day in (session.query(Quote.Ticker, Quote.Date)
+                                   .filter(Quote.Ticker.in_(tickers))
+                                   .order_by(Quote.Ticker, Quote.Date)):
+            dates[ticker].append(watermarks._to_date(day))
+    return dict((ticker, np.array(days, dtype='M8[D]')) for ticker, days in dates.iteritems())
+
+
+def plan(session, end_date, names=(), gaps=False, overlap=5, calendar=None):
+    """ Plan the downloads and recomputes that bring every ticker up to date
+
+    :param end_date: Last day quotes can exist for.
+    :param names: Indicator names whose watermarks decide what to recompute.
+    :param gaps: Also look for missing trading days inside each ticker's
+    history, after its ``watermarks.GAPS`` watermark. This needs the quote
+    ranges of every ticker and the stored dates of tickers whose quote count
+    is short of the calendar, read with two more queries.
+    :param overlap: Stored trading days a request may download again to
+    avoid a second request.
+    :param calendar: (optional) numpy busdaycalendar. Defaults to the NYSE
+    trading calendar.
+    """
+    calendar = calendar or _default_calendar()
+    end = _day(end_date)
+    marks = watermarks.load(session)
+    downloads = []
+    recompute = set()
+    short = []
+    ranges = quote_ranges(session) if gaps else last_dates(session, marks)
+    for ticker, first, last, count in ranges:
+        if last is None:
+            downloads.append(WorkItem(ticker, NEW, HISTORY_START, end.tolist(), None))
+            recompute.add(ticker)
+            continue
+        ticker_marks = marks.get(ticker, {})
+        start = _day(last) + 1
+        # Unadjusted quotes are downloaded again
+        if ticker_marks.get(watermarks.UNADJUSTED) is not None:
+            start = min(start, _day(ticker_marks[watermarks.UNADJUSTED]))
+        if start <= end:
+            tail = trading_days(start, end, calendar)
+            if len(tail):
+                downloads.append(WorkItem(ticker, TAIL, tail[0].tolist(), end.tolist(), tail))
+                recompute.add(ticker)
+        if gaps and count < np.busday_count(_day(first), _day(last) + 1, busdaycal=calendar):
+            short.append(ticker)
+        if not all(watermarks.is_fresh(ticker_marks, name) for name in names):
+            recompute.add(ticker)
+
+    for ticker, stored in _stored_dates(session, short).iteritems():
+        # Days up to the watermark were already requested and not found
+        tried = marks.get(ticker, {}).get(watermarks.GAPS)
+        start = stored[0] if tried is None else max(stored[0], _day(tried) + 1)
+        expected = trading_days(start, stored[-1], calendar)
+        missing = np.setdiff1d(expected, stored)
+        items = coalesce(ticker, GAP, missing, overlap, calendar)
+        downloads.extend(items)
+        if items:
+            recompute.add(ticker)
+
+    # Largest downloads of a kind first, except gaps, which run in date
+    # order per ticker so the gaps watermark never passes one not requested
+    downloads.sort(key=lambda item: (_priority[item.kind],
+                                     -(len(item.missing) if item.missing is not None
+                                       and item.kind != GAP else 0),
+                                     item.ticker, item.start))
+    return Plan(end.tolist(), downloads, sorted(recompute))
+
+
+def format_plan(plan):
+    """ Plain text listing of a plan for dry runs
+    """
+    lines = ['Sync through %s: %d downloads, %d tickers to recompute'
+             % (plan.end_date, len(plan.downloads), len(plan.recompute))]
+    for item in plan.downloads:
+        days = len(item.missing) if item.missing is not None else 'all'
+        lines.append('  %-6s %-5s %s .. %s  %s days' % (item.ticker, item.kind,
+                                                        item.start, item.end, days))
+    if plan.recompute:
+        lines.append('Recompute: %s' % ', '.join(plan.recompute))
+    return '\n'.join(lines)
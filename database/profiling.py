@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+""" profiling.py
+
+SQL query profiling for database engines.
+
+A QueryProfiler listens to an engine's cursor events and tallies statements,
+rows and time by statement shape and by the call site that issued them.
+Statements are reduced to a shape by replacing literals and bound
+parameters, so the same query run with different values counts as one shape.
+A shape issued many times from one call site is the signature of an N+1
+pattern, such as a query per indicator or a lazy load per row.
+
+sample usage:
+>>> profiler = QueryProfiler(engine).start()
+>>> manager.update_quotes('aapl')
+>>> print profiler.report()
+>>> with profiler.budget(50):     # raise if the block issues more
+...     client.get_quotes('aapl', start, end)
+
+Setting the STOCKS_PROFILE_SQL environment variable turns profiling on for
+every ``Database``.
+"""
+
+import os
+import re
+import threading
+import time
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+_literals = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),                  # quoted strings
+    (re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:e-?\d+)?\b', re.I), '?'),  # numbers
+    (re.compile(r'%\(\w+\)s|%s|:\w+|\?'), '?'),            # bound parameters
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),    # IN lists
+    (re.compile(r'\s+'), ' '),
+]
+
+_ignored_paths = (os.sep + 'sqlalchemy' + os.sep, __file__.rstrip('co'))
+
+
+def normalize(statement):
+    """ Reduce a SQL statement to its shape
+    """
+    for pattern, replacement in _literals:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def call_site():
+    """ The innermost frame outside SQLAlchemy and this module
+    """
+    for filename, line, function, text in reversed(traceback.extract_stack()):
+        if not any(path in filename for path in _ignored_paths) and 'contextlib' not in filename:
+            return '%s:%d in %s' % (os.path.basename(filename), line, function)
+    return 'unknown'
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class Tally(object):
+    """ Statement count, rows and seconds
+    """
+    __slots__ = ('count', 'rows', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+    def add(self, rows, seconds):
+        self.count += 1
+        self.rows += rows
+        self.seconds += seconds
+
+
+class QueryProfiler(object):
+    """ Count statements, rows and time per statement shape and call site
+
+    :param engine: SQLAlchemy engine to listen to.
+    :param n_plus_one: Executions of one shape from one call site that are
+    reported as an N+1 pattern.
+    """
+    def __init__(self, engine, n_plus_one=10):
+        self.engine = engine
+        self.n_plus_one_threshold = n_plus_one
+        self.active = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.shapes = defaultdict(Tally)
+            self.sites = defaultdict(Tally)
+            self.pairs = defaultdict(Tally)
+
+    def start(self):
+        if not self.active:
+            event.listen(self.engine, 'before_cursor_execute', self._before)
+            event.listen(self.engine, 'after_cursor_execute', self._after)
+            self.active = True
+        return self
+
+    def stop(self):
+        if self.active:
+            event.remove(self.engine, 'before_cursor_execute', self._before)
+            event.remove(self.engine, 'after_cursor_execute', self._after)
+            self.active = False
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def count(self):
+        """ Total statements executed
+        """
+        return sum(tally.count for tally in self.shapes.itervalues())
+
+    @property
+    def seconds(self):
+        return sum(tally.seconds for tally in self.shapes.itervalues())
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.start = time.time()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.time() - getattr(self._local, 'start', time.time())
+        rows = max(cursor.rowcount, 0)
+        shape = normalize(statement)
+        site = call_site()
+        with self._lock:
+            self.shapes[shape].add(rows, elapsed)
+            self.sites[site].add(rows, elapsed)
+            self.pairs[(shape, site)].add(rows, elapsed)
+
+    def n_plus_one(self, threshold=None):
+        """ Shapes executed at least threshold times from one call site
+
+        Returns a list of (count, shape, call site) tuples, most frequent
+        first.
+        """
+        threshold = threshold or self.n_plus_one_threshold
+        return sorted(((tally.count, shape, site)
+                       for (shape, site), tally in self.pairs.iteritems()
+                       if tally.count >= threshold), reverse=True)
+
+    def report(self, limit=10):
+        """ Plain text summary of the busiest shapes, call sites and N+1
+        patterns
+        """
+        lines = ['%d statements, %.3f s' % (self.count, self.seconds), '', 'Top statements:']
+        for shape, tally in sorted(self.shapes.iteritems(),
+                                   key=lambda item: -item[1].count)[:limit]:
+            lines.append('%8d %10.4f s %10d rows  %s' % (tally.count, tally.seconds,
+                                                         tally.rows, shape[:100]))
+        lines.extend(['', 'Top call sites:'])
+        for site, tally in sorted(self.sites.iteritems(),
+                                  key=lambda item: -item[1].count)[:limit]:
+            lines.append('%8d %10.4f s %10d rows  %s' % (tally.count, tally.seconds,
+                                                         tally.rows, site))
+        patterns = self.n_plus_one()
+        if patterns:
+            lines.extend(['', 'Possible N+1 patterns:'])
+            for count, shape, site in patterns[:limit]:
+                lines.append('%8d x %s  at %s' % (count, shape[:80], site))
+        return '\n'.join(lines)
+
+    @contextmanager
+    def budget(self, max_queries, max_repeats=None):
+        """ Raise QueryBudgetExceeded if the block issues more than
+        max_queries statements, or any one shape more than max_repeats times
+        """
+        was_active = self.active
+        self.start()
+        before = dict((shape, tally.count) for shape, tally in self.shapes.iteritems())
+        try:
+            yield self
+        finally:
+            if not was_active:
+                self.stop()
+        counts = dict((shape, tally.count - before.get(shape, 0))
+                      for shape, tally in self.shapes.iteritems())
+        total = sum(counts.itervalues())
+        if total > max_queries:
+            raise QueryBudgetExceeded('%d statements exceed the budget of %d'
+                                      % (total, max_queries))
+        if max_repeats is not None:
+            for shape, count in counts.iteritems():
+                if count > max_repeats:
+                    raise QueryBudgetExceeded('%d executions of "%s" exceed the budget of %d'
+                                              % (count, shape[:80], max_repeats))
+
+
+@contextmanager
+def query_budget(engine, max_queries, max_repeats=None):
+    """ Raise QueryBudgetExceeded if the block runs too many statements on
+    engine. Meant for tests.
+    """
+    profiler = QueryProfiler(engine)
+    with profiler.budget(max_queries, max_repeats):
+        yield profiler
@@ -0,0 +1,811 @@
+import os
+import shutil
+import tempfile
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import bars
+import database
+import economicindicators
+import migrations
+import models
+import planner
+import profiling
+import tickstore
+import tradingcalendar
+import upsert
+import timing
+import watermarks
+from router import SourceRouter #sources
+""" tests.py
+
+Unit tests for database module
+"""
+
+NS = 10 ** 9
+
+
+# ------------------------------------------------
+# Test Tick Store
+# ------------------------------------------------
+
+def _day_ticks(day, n, start_second=34200):
+    """ n ticks one second apart starting at 09:30 on day
+    """
+    base = np.datetime64(day, 'D').astype('M8[ns]').astype(np.int64)
+    timestamps = base + (start_second + np.arange(n)) * NS
+    return timestamps, np.arange(n) + 10.0, np.arange(n) + 100
+
+
+def test_tick_store_range():
+    """ [database.tickstore] Test range lookup across days
+    """
+    root = tempfile.mkdtemp()
+    try:
+        store = tickstore.TickStore(root)
+        for day in ['2013-01-02', '2013-01-03']:
+            store.append('test', *_day_ticks(day, 10))
+        ticks = store.get('test', datetime(2013, 1, 2, 9, 30, 5), date(2013, 1, 3))
+        np.testing.assert_equal(len(ticks), 15)
+        np.testing.assert_array_equal(ticks['price'][:5], [15, 16, 17, 18, 19])
+        np.testing.assert_equal(str(ticks['timestamp'][-1])[:19], '2013-01-03T09:30:09')
+        np.testing.assert_array_equal(store.days('test'),
+                                      np.array(['2013-01-02', '2013-01-03'], 'M8[D]'))
+    finally:
+        shutil.rmtree(root)
+
+
+def test_tick_store_append_only():
+    """ [database.tickstore] Test re-ingesting a day only appends new ticks
+    """
+    root = tempfile.mkdtemp()
+    try:
+        store = tickstore.TickStore(root)
+        timestamps, prices, sizes = _day_ticks('2013-01-02', 10)
+        np.testing.assert_equal(store.append('test', timestamps[:6], prices[:6], sizes[:6]), 6)
+        np.testing.assert_equal(store.append('test', timestamps, prices, sizes), 4)
+        data = store.read_day('test', date(2013, 1, 2))
+        np.testing.assert_array_equal(data['size'], sizes)
+    finally:
+        shutil.rmtree(root)
+
+
+def test_tick_store_same_timestamp():
+    """ [database.tickstore] Test new trades in the last stored second are kept
+    """
+    root = tempfile.mkdtemp()
+    try:
+        store = tickstore.TickStore(root)
+        base = np.datetime64('2013-01-02', 'D').astype('M8[ns]').astype(np.int64) + 34200 * NS
+        timestamps = base + np.array([0, 1, 1, 1, 2]) * NS
+        prices = np.array([10.0, 11.0, 11.0, 12.0, 13.0])
+        sizes = np.array([100, 100, 100, 200, 300])
+        np.testing.assert_equal(store.append('test', timestamps[:2], prices[:2], sizes[:2]), 2)
+        np.testing.assert_equal(store.append('test', timestamps, prices, sizes), 3)
+        np.testing.assert_equal(store.append('test', timestamps, prices, sizes), 0)
+        data = store.read_day('test', date(2013, 1, 2))
+        np.testing.assert_array_equal(data['price'], prices)
+        np.testing.assert_array_equal(data['size'], sizes)
+    finally:
+        shutil.rmtree(root)
+
+
+def test_tick_store_torn_append():
+    """ [database.tickstore] Test rows of an unfinished append are ignored and replaced
+    """
+    root = tempfile.mkdtemp()
+    try:
+        store = tickstore.TickStore(root)
+        timestamps, prices, sizes = _day_ticks('2013-01-02', 10)
+        store.append('test', timestamps[:6], prices[:6], sizes[:6])
+        # Simulate a crash after only the first column was appended
+        path = store.day_path('test', '2013-01-02')
+        with open(os.path.join(path, 'timestamp.i8'), 'ab') as column_file:
+            column_file.write(timestamps[6:].tostring())
+        data = store.read_day('test', date(2013, 1, 2))
+        np.testing.assert_equal([len(column) for column in data.values()], [6, 6, 6])
+        np.testing.assert_equal(store.append('test', timestamps, prices, sizes), 4)
+        data = store.read_day('test', date(2013, 1, 2))
+        np.testing.assert_array_equal(data['timestamp'], timestamps)
+        np.testing.assert_array_equal(data['size'], sizes)
+    finally:
+        shutil.rmtree(root)
+
+
+# ------------------------------------------------
+# Test Book Store
+# ------------------------------------------------
+
+def _book_store(root):
+    store = tickstore.BookStore(root)
+    base = np.datetime64('2013-01-02', 'D').astype('M8[ns]').astype(np.int64)
+    timestamps = base + np.array([34200, 34210, 34220]) * NS
+    store.append('test', timestamps, [10.0, 10.1, 10.2], [1, 2, 3],
+                 [10.5, 10.6, 10.7], [4, 5, 6])
+    return store, base
+
+
+def test_book_store_asof():
+    """ [database.tickstore] Test as-of lookup of prevailing book
+    """
+    root = tempfile.mkdtemp()
+    try:
+        store, base = _book_store(root)
+        trades = base + np.array([34100, 34200, 34215, 40000]) * NS
+        books = store.asof('test', trades)
+        np.testing.assert_(np.isnan(books['bid'][0]))
+        np.testing.assert_array_equal(books['bid'][1:], [10.0, 10.1, 10.2])
+        np.testing.assert_array_equal(books['offer_depth'][1:], [4, 5, 6])
+    finally:
+        shutil.rmtree(root)
+
+
+def test_book_store_replay():
+    """ [database.tickstore] Test book replay order
+    """
+    root = tempfile.mkdtemp()
+    try:
+        store, base = _book_store(root)
+        books = list(store.replay('test', date(2013, 1, 2), date(2013, 1, 2), chunk_size=2))
+        np.testing.assert_array_equal([book['bid'] for book in books], [10.0, 10.1, 10.2])
+        np.testing.assert_array_equal(store.get('test', date(2013, 1, 2), date(2013, 1, 2))['offer'],
+                                      [10.5, 10.6, 10.7])
+    finally:
+        shutil.rmtree(root)
+
+# ------------------------------------------------
+# Test Bars
+# ------------------------------------------------
+
+def test_time_bars():
+    """ [database.bars] Test OHLCV time bars
+    """
+    timestamps = np.array([0, 10, 59, 61, 130], dtype=np.int64) * NS
+    prices = np.array([5.0, 7.0, 6.0, 4.0, 8.0])
+    sizes = np.array([1, 2, 3, 4, 5])
+    result = bars.time_bars(timestamps, prices, sizes, '1m')
+    np.testing.assert_array_equal(result['timestamp'].astype(np.int64), [0, 60 * NS, 120 * NS])
+    np.testing.assert_array_equal(result['open'], [5, 4, 8])
+    np.testing.assert_array_equal(result['high'], [7, 4, 8])
+    np.testing.assert_array_equal(result['low'], [5, 4, 8])
+    np.testing.assert_array_equal(result['close'], [6, 4, 8])
+    np.testing.assert_array_equal(result['volume'], [6, 4, 5])
+
+
+def test_volume_bars():
+    """ [database.bars] Test volume bars
+    """
+    timestamps = np.arange(6, dtype=np.int64) * NS
+    prices = np.arange(6.0)
+    sizes = np.array([4, 4, 4, 4, 4, 4])
+    result = bars.volume_bars(timestamps, prices, sizes, 10)
+    np.testing.assert_array_equal(result['volume'], [12, 8, 4])
+    np.testing.assert_array_equal(result['close'], [2, 4, 5])
+
+
+def test_resample_bars():
+    """ [database.bars] Test resampled bars match bars built from ticks
+    """
+    timestamps, prices, sizes = _day_ticks('2013-01-02', 1000)
+    prices = np.sin(prices)
+    coarse = bars.resample_bars(bars.time_bars(timestamps, prices, sizes, '1s'), '5m')
+    direct = bars.time_bars(timestamps, prices, sizes, '5m')
+    np.testing.assert_array_equal(coarse, direct)
+
+
+def test_bar_cache():
+    """ [database.bars] Test cached pyramid range query and rebuild on append
+    """
+    root = tempfile.mkdtemp()
+    try:
+        store = tickstore.TickStore(root)
+        timestamps, prices, sizes = _day_ticks('2013-01-02', 600)
+        store.append('test', timestamps[:300], prices[:300], sizes[:300])
+        cache = bars.BarCache(store)
+        result = cache.get_bars('test', date(2013, 1, 2), date(2013, 1, 2), '1m')
+        np.testing.assert_equal(len(result), 5)
+        store.append('test', timestamps, prices, sizes)
+        result = bars.BarCache(store).get_bars('test', datetime(2013, 1, 2, 9, 32),
+                                               date(2013, 1, 2), '1m')
+        np.testing.assert_equal(len(result), 8)
+        np.testing.assert_equal(result['n_ticks'].sum(), 480)
+    finally:
+        shutil.rmtree(root)
+
+
+# ------------------------------------------------
+# Test Timing
+# ------------------------------------------------
+
+def test_timing_disabled():
+    """ [database.timing] Test disabled spans record nothing
+    """
+    timing.disable()
+    timing.reset()
+    with timing.span('noop'):
+        pass
+    timing.timed('noop')(lambda: None)()
+    np.testing.assert_equal(timing.snapshot(), [])
+
+
+def test_timing_spans():
+    """ [database.timing] Test spans aggregate by name and labels
+    """
+    timing.reset()
+    timing.enable()
+    try:
+        for i in range(3):
+            with timing.span('stage', indicator='ma_5_day'):
+                pass
+        timing.timed('call')(lambda: None)()
+        timing.record('stage', 2.0, indicator='macd')
+    finally:
+        timing.disable()
+    entries = dict(((e['name'], tuple(e['labels'].values())), e) for e in timing.snapshot())
+    np.testing.assert_equal(entries[('stage', ('ma_5_day',))]['count'], 3)
+    np.testing.assert_equal(entries[('call', ())]['count'], 1)
+    np.testing.assert_equal(entries[('stage', ('macd',))]['buckets']['5.0'], 1)
+    text = timing.to_prometheus()
+    assert '# TYPE stocks_stage_seconds histogram' in text
+    assert 'stocks_stage_seconds_bucket{indicator="macd",le="+Inf"} 1' in text
+    assert 'stocks_call_seconds_count 1' in text
+    timing.reset()
+
+
+# ------------------------------------------------
+# Test Query Profiling
+# ------------------------------------------------
+
+def _engine():
+    engine = create_engine('sqlite://')
+    engine.execute('CREATE TABLE quotes (id INTEGER PRIMARY KEY, ticker TEXT)')
+    engine.execute('INSERT INTO quotes (ticker) VALUES (?)', [('aapl',), ('goog',)])
+    return engine
+
+
+def test_normalize_statement():
+    """ [database.profiling] Test statements with different values share a shape
+    """
+    a = profiling.normalize("SELECT * FROM q WHERE id = 12 AND t = 'x' AND d IN (1, 2, 3)")
+    b = profiling.normalize("SELECT *  FROM q WHERE id = :id_1 AND t = 'y''z' AND d IN (?, ?)")
+    np.testing.assert_equal(a, b)
+    np.testing.assert_equal(a, 'SELECT * FROM q WHERE id = ? AND t = ? AND d IN (?)')
+
+
+def test_n_plus_one():
+    """ [database.profiling] Test repeated statements are reported as N+1
+    """
+    engine = _engine()
+    with profiling.QueryProfiler(engine, n_plus_one=5) as profiler:
+        for i in range(6):
+            engine.execute('SELECT ticker FROM quotes WHERE id = %d' % i).fetchall()
+        engine.execute('SELECT count(*) FROM quotes').fetchall()
+    np.testing.assert_equal(profiler.count, 7)
+    patterns = profiler.n_plus_one()
+    np.testing.assert_equal(len(patterns), 1)
+    np.testing.assert_equal(patterns[0][0], 6)
+    assert 'test_n_plus_one' in patterns[0][2]
+    assert 'Possible N+1 patterns' in profiler.report()
+
+
+def test_query_budget():
+    """ [database.profiling] Test query budgets are enforced
+    """
+    engine = _engine()
+    with profiling.query_budget(engine, 2):
+        engine.execute('SELECT 1')
+    def over_budget(max_queries, max_repeats=None):
+        with profiling.query_budget(engine, max_queries, max_repeats):
+            for i in range(3):
+                engine.execute('SELECT %d' % i)
+    np.testing.assert_raises(profiling.QueryBudgetExceeded, over_budget, 2)
+    np.testing.assert_raises(profiling.QueryBudgetExceeded, over_budget, 10, 2)
+
+
+# ------------------------------------------------
+# Test Migrations
+# ------------------------------------------------
+
+def test_add_ticker_date_index():
+    """ [database.migrations] Test duplicates are removed before indexing
+    """
+    engine = create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    engine.execute('DROP INDEX %s' % migrations.TICKER_DATE_INDEX)
+    quotes = models.Quote.__table__
+    engine.execute(quotes.insert(), [{'Ticker': 'aapl', 'Date': date(2013, 1, d)}
+                                     for d in (2, 3, 3, 4, 4, 4)])
+    engine.execute('INSERT INTO Indicators (Id) SELECT Id FROM Quotes')
+    assert migrations.add_ticker_date_index(engine)
+    assert not migrations.add_ticker_date_index(engine)
+    np.testing.assert_equal(engine.execute('SELECT Id FROM Quotes ORDER BY Id').fetchall(),
+                            [(1,), (2,), (4,)])
+    np.testing.assert_equal(engine.execute('SELECT COUNT(*) FROM Indicators').scalar(), 3)
+    plan = migrations.explain(engine, 'SELECT MAX(Date) FROM Quotes WHERE Ticker = :t', {'t': 'a'})
+    assert migrations.TICKER_DATE_INDEX in str(plan)
+
+
+def test_partition_statements():
+    """ [database.migrations] Test partitioning drops FKs and widens the key
+    """
+    statements = migrations.partition_statements('hash', 8)
+    assert 'FOREIGN KEY' in statements[0]
+    assert statements[-2].endswith('ADD PRIMARY KEY (Id, Ticker)')
+    assert statements[-1].endswith('PARTITIONS 8')
+    np.testing.assert_raises(ValueError, migrations.partition_quotes,
+                             create_engine('sqlite://'), 'year', dry_run=False)
+    # SQLite doesn't name foreign keys, so neither is found
+    engine, session = _session()
+    np.testing.assert_equal(migrations.missing_foreign_keys(engine),
+                            migrations.PARTITION_FOREIGN_KEYS)
+
+
+def test_upgrade_economic_indicators():
+    """ [database.migrations] Test EconomicIndicators columns are renamed and added
+    """
+    engine = create_engine('sqlite://')
+    engine.execute('CREATE TABLE EconomicIndicators (Date DATE PRIMARY KEY, '
+                   'sp_500 FLOAT, civillian_unemployment_rate FLOAT)')
+    engine.execute("INSERT INTO EconomicIndicators VALUES ('2013-01-01', 1400.0, 7.9)")
+    statements = migrations.upgrade_economic_indicators(engine)
+    assert 'RENAME COLUMN civillian_unemployment_rate' in statements[0]
+    np.testing.assert_equal(migrations.upgrade_economic_indicators(engine), [])
+    session = sessionmaker(bind=engine)()
+    row = session.query(models.EconomicIndicator).one()
+    np.testing.assert_equal((row.sp_500, row.civilian_unemployment_rate, row.wilshire_5000_pi),
+                            (1400.0, 7.9, None))
+
+
+# ------------------------------------------------
+# Test Economic Indicators
+# ------------------------------------------------
+
+def _observations(dates, values):
+    return np.array(dates, dtype='M8[D]'), np.array(values)
+
+
+def test_upsert_observations():
+    """ [database.economicindicators] Test observations merge into rows by date
+    """
+    engine, session = _session()
+    economicindicators.upsert_observations(session, {
+        'sp_500': _observations(['2013-01-02', '2013-01-03'], [1460.0, 1459.0]),
+        'libor_1mo': _observations(['2013-01-02'], [0.2])})
+    economicindicators.upsert_observations(session, {
+        'sp_500': _observations(['2013-01-03', '2013-01-04'], [1459.4, 1466.0])})
+    session.commit()
+    rows = engine.execute('SELECT Date, sp_500, libor_1mo FROM EconomicIndicators '
+                          'ORDER BY Date').fetchall()
+    np.testing.assert_equal(rows, [('2013-01-02', 1460.0, 0.2), ('2013-01-03', 1459.4, None),
+                                   ('2013-01-04', 1466.0, None)])
+    np.testing.assert_equal(economicindicators.watermarks(session, ['sp_500', 'libor_1mo',
+                                                                    'real_gdp']),
+                            {'sp_500': date(2013, 1, 4), 'libor_1mo': date(2013, 1, 2),
+                             'real_gdp': None})
+
+
+def test_update_economic_indicators():
+    """ [database.economicindicators] Test updates only ask for observations after the watermark
+    """
+    engine, session = _session()
+    economicindicators.upsert_observations(session, {
+        'sp_500': _observations(['2013-01-02'], [1460.0])})
+    requests = []
+
+    def get_many(names, observation_start, previous):
+        requests.append((names, observation_start, previous))
+        return {'sp_500': _observations(['2013-01-03'], [1459.0]),
+                'real_gdp': _observations(['2013-01-01'], [15.5])}
+
+    original = economicindicators.fred.get_many
+    economicindicators.fred.get_many = get_many
+    try:
+        np.testing.assert_equal(economicindicators.update_all(session, ['sp_500', 'real_gdp']), 2)
+    finally:
+        economicindicators.fred.get_many = original
+    np.testing.assert_equal(requests, [(['real_gdp', 'sp_500'], {'sp_500': date(2013, 1, 3)},
+                                        {'sp_500': 1460.0})])
+    np.testing.assert_equal(economicindicators.watermarks(session, ['sp_500', 'real_gdp']),
+                            {'sp_500': date(2013, 1, 3), 'real_gdp': date(2013, 1, 1)})
+
+
+def test_client_get_economic_indicators():
+    """ [database.database] Test indicators come back as date aligned arrays with NaN gaps
+    """
+    db = database.Database('sqlite://')
+    models.Base.metadata.create_all(db.Engine)
+    session = db.Session()
+    economicindicators.upsert_observations(session, {
+        'sp_500': _observations(['2013-01-02', '2013-01-03'], [1460.0, 1459.0]),
+        'real_gdp': _observations(['2013-01-01'], [15.5])})
+    session.commit()
+    client = database.Client(db)
+    dates, values = client.get_economic_indicators(['sp_500', 'real_gdp'])
+    np.testing.assert_array_equal(dates, np.array(['2013-01-01', '2013-01-02', '2013-01-03'],
+                                                  dtype='M8[D]'))
+    np.testing.assert_array_equal(values['sp_500'], [np.nan, 1460.0, 1459.0])
+    np.testing.assert_array_equal(values['real_gdp'], [15.5, np.nan, np.nan])
+    dates, values = client.get_economic_indicators(['sp_500'], date(2013, 1, 2))
+    np.testing.assert_array_equal(values['sp_500'], [np.nan, 1460.0])
+    db.Engine.execute('DELETE FROM EconomicIndicators')
+    dates, values = client.get_economic_indicators(['sp_500'])
+    np.testing.assert_equal((len(dates), len(values['sp_500'])), (0, 0))
+
+
+
+# ------------------------------------------------
+# Test Watermarks
+# ------------------------------------------------
+
+def _session():
+    engine = create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+def test_watermarks_save_load():
+    """ [database.watermarks] Test watermarks are replaced and loaded per ticker
+    """
+    engine, session = _session()
+    watermarks.save(session, 'AAPL', {'quotes': date(2013, 1, 3), 'ma_5_day': date(2013, 1, 2)})
+    watermarks.save(session, 'aapl', {'ma_5_day': date(2013, 1, 3)})
+    watermarks.save(session, 'goog', {'quotes': date(2013, 1, 4)})
+    session.commit()
+    marks = watermarks.load(session)
+    np.testing.assert_equal(sorted(marks), ['aapl', 'goog'])
+    np.testing.assert_equal(marks['aapl'], {'quotes': date(2013, 1, 3),
+                                            'ma_5_day': date(2013, 1, 3)})
+    np.testing.assert_equal(list(watermarks.load(session, ['GOOG'])), ['goog'])
+    assert watermarks.is_fresh(marks['aapl'], 'ma_5_day')
+    assert not watermarks.is_fresh(marks['goog'], 'ma_5_day')
+
+
+def test_create_watermarks():
+    """ [database.migrations] Test watermarks are backfilled from existing quotes
+    """
+    engine, session = _session()
+    engine.execute(models.Quote.__table__.insert(),
+                   [{'Ticker': ticker, 'Date': date(2013, 1, d)}
+                    for ticker in ('aapl', 'goog') for d in (2, 3, 4)])
+    engine.execute('INSERT INTO Indicators (Id) SELECT Id FROM Quotes')
+    engine.execute('UPDATE Indicators SET ma_5_day = 1.0 WHERE Id IN (1, 2, 4)')
+    np.testing.assert_equal(migrations.create_watermarks(engine, ['ma_5_day']), 4)
+    marks = watermarks.load(session)
+    np.testing.assert_equal(marks['aapl'], {'quotes': date(2013, 1, 4),
+                                            'ma_5_day': date(2013, 1, 3)})
+    np.testing.assert_equal(marks['goog'], {'quotes': date(2013, 1, 4),
+                                            'ma_5_day': date(2013, 1, 2)})
+
+
+# ------------------------------------------------
+# Test Sync Planner
+# ------------------------------------------------
+
+def test_coalesce():
+    """ [database.planner] Test nearby missing days share a request
+    """
+    missing = np.array(['2013-01-02', '2013-01-04', '2013-01-07', '2013-02-01'], dtype='M8[D]')
+    items = planner.coalesce('aapl', planner.GAP, missing, overlap=2)
+    np.testing.assert_equal([(item.start, item.end) for item in items],
+                            [(date(2013, 1, 2), date(2013, 1, 7)),
+                             (date(2013, 2, 1), date(2013, 2, 1))])
+    np.testing.assert_equal(len(items[0].missing), 3)
+
+
+def test_plan():
+    """ [database.planner] Test tails, gaps and new symbols are planned
+    """
+    engine, session = _session()
+    for ticker in ('aapl', 'goog', 'msft', 'new'):
+        session.add(models.Symbol(ticker, ticker))
+    session.commit()
+    days = planner.trading_days(date(2013, 1, 1), date(2013, 1, 11))
+    stored = {'aapl': days, 'goog': days[:-3], 'msft': np.delete(days, [2, 3])}
+    engine.execute(models.Quote.__table__.insert(),
+                   [{'Ticker': ticker, 'Date': day.tolist()}
+                    for ticker, dates in sorted(stored.iteritems()) for day in dates])
+
+    # Friday to Sunday has nothing new
+    plan = planner.plan(session, date(2013, 1, 13))
+    np.testing.assert_equal([(item.ticker, item.kind) for item in plan.downloads],
+                            [('goog', 'tail'), ('new', 'new')])
+    np.testing.assert_equal(plan.downloads[0].start, date(2013, 1, 9))
+    np.testing.assert_equal(plan.recompute, ['goog', 'new'])
+
+    plan = planner.plan(session, date(2013, 1, 14), gaps=True)
+    np.testing.assert_equal([(item.ticker, item.kind) for item in plan.downloads],
+                            [('goog', 'tail'), ('aapl', 'tail'), ('msft', 'tail'),
+                             ('new', 'new'), ('msft', 'gap')])
+    np.testing.assert_equal(plan.downloads[-1].missing, days[2:4])
+
+    # Quotes watermarks replace the stored dates when gaps aren't checked
+    watermarks.save(session, 'goog', {watermarks.QUOTES: date(2013, 1, 14)})
+    np.testing.assert_equal([item.ticker for item in planner.plan(session, date(2013, 1, 14))
+                             .downloads], ['aapl', 'msft', 'new'])
+
+    # Gaps already requested through the watermark aren't planned again
+    watermarks.save(session, 'msft', {watermarks.GAPS: days[3].tolist()})
+    plan = planner.plan(session, date(2013, 1, 14), gaps=True)
+    np.testing.assert_equal([item.kind for item in plan.downloads if item.ticker == 'msft'],
+                            ['tail'])
+
+
+# ------------------------------------------------
+# Test Trading Calendar
+# ------------------------------------------------
+
+def test_holidays():
+    """ [database.tradingcalendar] Test holiday rules against the NYSE 2013 and 2022 schedules
+    """
+    calendar = tradingcalendar.get('nasdaq')
+    holidays = [day.tolist() for day in calendar.holidays
+                if date(2013, 1, 1) <= day.tolist() <= date(2013, 12, 31)]
+    np.testing.assert_equal(holidays, [date(2013, 1, 1), date(2013, 1, 21), date(2013, 2, 18),
+                                       date(2013, 3, 29), date(2013, 5, 27), date(2013, 7, 4),
+                                       date(2013, 9, 2), date(2013, 11, 28), date(2013, 12, 25)])
+    np.testing.assert_equal(calendar.count(date(2013, 1, 1), date(2013, 12, 31)), 252)
+    # New Year's Day on a Saturday isn't observed, Juneteenth on a Sunday is
+    assert calendar.is_trading_day(date(2021, 12, 31))
+    assert not calendar.is_trading_day(date(2022, 6, 20))
+    assert not calendar.is_trading_day(date(2012, 10, 29))
+    np.testing.assert_raises(KeyError, tradingcalendar.get, 'LSE')
+    # Election Day every year through 1968, then in presidential years through 1980
+    for day, closed in ((date(1966, 11, 8), True), (date(1970, 11, 3), False),
+                        (date(1976, 11, 2), True), (date(1984, 11, 6), False)):
+        np.testing.assert_equal(calendar.is_trading_day(day), not closed)
+    # Paperwork crisis Wednesdays of 1968, skipping weeks with a holiday
+    wednesdays = [day.tolist() for day in calendar.holidays
+                  if day.tolist().year == 1968 and day.tolist().weekday() == 2]
+    np.testing.assert_equal(len(wednesdays), 24 + 1)  # and Christmas
+    np.testing.assert_equal(wednesdays[:4], [date(1968, 6, 12), date(1968, 6, 19),
+                                             date(1968, 6, 26), date(1968, 7, 10)])
+    assert date(1968, 11, 6) not in wednesdays
+
+
+def test_last_complete_day():
+    """ [database.tradingcalendar] Test early closes, weekends and holidays
+    """
+    calendar = tradingcalendar.get()
+    np.testing.assert_equal(calendar.close_time(date(2013, 7, 3)), tradingcalendar.EARLY_CLOSE)
+    np.testing.assert_equal(calendar.close_time(date(2013, 7, 4)), None)
+    np.testing.assert_equal(calendar.last_complete_day(datetime(2013, 7, 3, 15)), date(2013, 7, 2))
+    np.testing.assert_equal(calendar.last_complete_day(datetime(2013, 7, 3, 17)), date(2013, 7, 3))
+    np.testing.assert_equal(calendar.last_complete_day(datetime(2013, 7, 5, 18)), date(2013, 7, 3))
+    np.testing.assert_equal(calendar.last_complete_day(datetime(2013, 7, 7, 12)), date(2013, 7, 5))
+    np.testing.assert_equal(calendar.next_trading_day(date(2013, 7, 3)), date(2013, 7, 5))
+
+
+# ------------------------------------------------
+# Test Upserts
+# ------------------------------------------------
+
+def test_upsert_quotes():
+    """ [database.upsert] Test overlapping quote batches are written blindly
+    """
+    engine, session = _session()
+    table = models.Quote.__table__
+    first = [{'Ticker': 'aapl', 'Date': date(2013, 1, d), 'Close': float(d)} for d in (2, 3, 4)]
+    again = [{'Ticker': 'aapl', 'Date': date(2013, 1, d), 'Close': 10.0 * d} for d in (4, 7)]
+    np.testing.assert_equal(upsert.upsert(session, table, ['Ticker', 'Date'], first), 3)
+    upsert.upsert(session, table, ['Ticker', 'Date'], again, batch_size=1)
+    upsert.upsert(session, table, ['Ticker', 'Date'], again)
+    session.commit()
+    np.testing.assert_equal(engine.execute('SELECT Id, Date, Close FROM Quotes ORDER BY Date').fetchall(),
+                            [(1, '2013-01-02', 2.0), (2, '2013-01-03', 3.0),
+                             (3, '2013-01-04', 40.0), (4, '2013-01-07', 70.0)])
+
+
+def test_upsert_statement():
+    """ [database.upsert] Test MySQL statements update on duplicate keys
+    """
+    sql = str(upsert.upsert_statement('mysql', 'Indicators', ['Id'], ['ma_5_day']))
+    np.testing.assert_equal(sql, 'INSERT INTO Indicators (Id, ma_5_day) VALUES (:Id, :ma_5_day) '
+                                 'ON DUPLICATE KEY UPDATE ma_5_day = VALUES(ma_5_day)')
+
+
+# ------------------------------------------------
+# Test Manager
+# ------------------------------------------------
+
+class FakeSource(object):
+    """ Quote source module serving a deterministic history through as_of
+    """
+    __name__ = 'fake'
+
+    def __init__(self, as_of, first=date(2013, 1, 2), skip=()):
+        self.as_of = as_of
+        self.first = first
+        self.skip = np.array(skip, dtype='M8[D]')
+        # Ticker to a day requests covering it fail on
+        self.fail = {}
+        self.requests = []
+
+    def get_historical_price_array(self, symbol, start_date, end_date):
+        self.requests.append((symbol, start_date, end_date))
+        if start_date <= self.fail.get(symbol, date.max) <= end_date:
+            raise IOError('%s unavailable' % symbol)
+        days = planner.trading_days(max(start_date, self.first), min(end_date, self.as_of))
+        days = np.setdiff1d(days, self.skip)
+        close = 100.0 + (days - np.datetime64('2013-01-01')).astype(float)
+        prices = np.empty(len(days), dtype=database.quotes.price_dtype)
+        prices['Date'] = days
+        for name in ('Open', 'High', 'Low', 'Close', 'AdjClose'):
+            prices[name] = close
+        prices['Volume'] = 1000.0
+        return prices
+
+
+class FixedCalendar(tradingcalendar.TradingCalendar):
+    """ Trading calendar whose last complete day is set by the test
+    """
+    def __init__(self, last):
+        super(FixedCalendar, self).__init__(first_year=2012, last_year=2014)
+        self.last = last
+
+    def last_complete_day(self, now=None):
+        return self.last
+
+
+def _manager(as_of, **kwargs):
+    db = database.Database('sqlite://')
+    source = FakeSource(as_of, **kwargs)
+    manager = database.Manager(db, source, request_delay=0, calendar=FixedCalendar(as_of))
+    manager.create_database()
+    return manager, source
+
+
+def _count(manager, table, ticker='aapl'):
+    return manager.db.Engine.execute('SELECT COUNT(*) FROM %s WHERE Ticker = :t' % table,
+                                     t=ticker).scalar()
+
+
+def test_manager_update_quotes():
+    """ [database.database] Test updates start after the quotes watermark and advance every watermark
+    """
+    manager, source = _manager(date(2013, 3, 1))
+    manager.add_stock('AAPL', 'Apple', 'NASDAQ', 'Technology', 'Computers')
+    session = manager.db.Session()
+    marks = watermarks.load(session, ['aapl'])['aapl']
+    names = [calc.name for calc in database.indicators.indicators]
+    np.testing.assert_equal(set(marks.values()), set([date(2013, 3, 1)]))
+    np.testing.assert_equal(sorted(marks), sorted(names + [watermarks.QUOTES]))
+    calc = database.indicators.indicators[0]
+    assert calc._is_up_to_date('aapl', session, marks)
+    session.close()
+
+    source.as_of = manager.calendar.last = date(2013, 3, 8)
+    manager.update_quotes('aapl', marks=marks)
+    np.testing.assert_equal(source.requests[-1], ('aapl', date(2013, 3, 2), date(2013, 3, 8)))
+    # The marks passed in follow the update, as do the stored ones
+    np.testing.assert_equal(set(marks.values()), set([date(2013, 3, 8)]))
+    session = manager.db.Session()
+    np.testing.assert_equal(watermarks.load(session, ['aapl'])['aapl'], marks)
+    stale = dict(marks, **{watermarks.QUOTES: date(2013, 3, 11)})
+    assert not calc._is_up_to_date('aapl', session, stale)
+    session.close()
+
+
+def test_manager_sync_quotes():
+    """ [database.database] Test a sync downloads only the tail after the stored quotes
+    """
+    manager, source = _manager(date(2013, 3, 1))
+    manager.add_stock('AAPL', 'Apple', 'NASDAQ', 'Technology', 'Computers')
+    requests = len(source.requests)
+    source.as_of = manager.calendar.last = date(2013, 3, 8)
+    plan = manager.sync_quotes()
+    np.testing.assert_equal([(item.ticker, item.kind) for item in plan.downloads],
+                            [('aapl', planner.TAIL)])
+    np.testing.assert_equal(source.requests[requests:],
+                            [('aapl', date(2013, 3, 4), date(2013, 3, 8))])
+    session = manager.db.Session()
+    marks = watermarks.load(session, ['aapl'])['aapl']
+    session.close()
+    np.testing.assert_equal(set(marks.values()), set([date(2013, 3, 8)]))
+    np.testing.assert_equal(manager.sync_quotes().downloads, [])
+
+
+def test_delete_symbol():
+    """ [database.database] Test deleting a symbol deletes its quotes and watermarks
+    """
+    manager, source = _manager(date(2013, 3, 1))
+    manager.add_stock('AAPL', 'Apple', 'NASDAQ', 'Technology', 'Computers')
+    manager.add_stock('GOOG', 'Google', 'NASDAQ', 'Technology', 'Internet')
+    assert _count(manager, 'Watermarks') > 0
+    manager.delete_symbol('aapl')
+    np.testing.assert_equal(_count(manager, 'Quotes'), 0)
+    np.testing.assert_equal(_count(manager, 'Watermarks'), 0)
+    assert _count(manager, 'Watermarks', 'goog') > 0
+
+
+def test_manager_sync_gaps():
+    """ [database.database] Test gaps the source doesn't have are requested once
+    """
+    missing = [date(2013, 2, 5), date(2013, 2, 6)]
+    manager, source = _manager(date(2013, 3, 1), skip=missing)
+    manager.add_stock('AAPL', 'Apple', 'NASDAQ', 'Technology', 'Computers')
+    requests = len(source.requests)
+    plan = manager.sync_quotes(check_all=True)
+    np.testing.assert_equal([(item.kind, item.start, item.end) for item in plan.downloads],
+                            [(planner.GAP, date(2013, 2, 5), date(2013, 2, 6))])
+    np.testing.assert_equal(source.requests[requests:],
+                            [('aapl', date(2013, 2, 5), date(2013, 2, 6))])
+    np.testing.assert_equal(manager.sync_quotes(check_all=True).downloads, [])
+
+    # Filling a gap leaves the quotes watermark where it was
+    source.skip = source.skip[:0]
+    session = manager.db.Session()
+    item = planner.WorkItem('aapl', planner.GAP, date(2013, 2, 4), date(2013, 2, 6), None)
+    manager._run_download(item, session)
+    marks = watermarks.load(session, ['aapl'])['aapl']
+    session.close()
+    np.testing.assert_equal(marks[watermarks.QUOTES], date(2013, 3, 1))
+    np.testing.assert_equal(marks[watermarks.GAPS], date(2013, 2, 6))
+    np.testing.assert_equal(_count(manager, 'Quotes'), len(planner.trading_days(date(2013, 1, 2),
+                                                                                  date(2013, 3, 1))))
+
+
+def test_manager_sync_failures():
+    """ [database.database] Test a failed download skips the ticker's later gaps but not the sync
+    """
+    missing = [date(2013, 1, 10), date(2013, 2, 5), date(2013, 2, 6)]
+    manager, source = _manager(date(2013, 3, 1), skip=missing)
+    for ticker in ('AAPL', 'GOOG'):
+        manager.add_stock(ticker, ticker, 'NASDAQ', 'Technology', 'Computers')
+    source.fail['aapl'] = date(2013, 1, 10)
+    source.as_of = manager.calendar.last = date(2013, 3, 8)
+    requests = len(source.requests)
+    manager.sync_quotes(check_all=True)
+    # The gaps of each ticker run oldest first, and aapl stops at the failure
+    np.testing.assert_equal([request for request in source.requests[requests:]
+                             if request[1] < date(2013, 3, 1)],
+                            [('aapl', date(2013, 1, 10), date(2013, 1, 10)),
+                             ('goog', date(2013, 1, 10), date(2013, 1, 10)),
+                             ('goog', date(2013, 2, 5), date(2013, 2, 6))])
+    session = manager.db.Session()
+    marks = watermarks.load(session)
+    session.close()
+    np.testing.assert_(watermarks.GAPS not in marks['aapl'])
+    np.testing.assert_equal(marks['goog'][watermarks.GAPS], date(2013, 2, 6))
+    # Both tails were stored and their indicators recomputed
+    for ticker in ('aapl', 'goog'):
+        np.testing.assert_equal(marks[ticker][watermarks.QUOTES], date(2013, 3, 8))
+        assert all(watermarks.is_fresh(marks[ticker], calc.name)
+                   for calc in database.indicators.indicators)
+    np.testing.assert_equal([(item.ticker, item.start) for item in manager.plan_sync(True).downloads],
+                            [('aapl', date(2013, 1, 10)), ('aapl', date(2013, 2, 5))])
+
+
+def test_manager_failover():
+    """ [database.database] Test unadjusted fallback quotes are stored, marked and replaced
+    """
+    manager, primary = _manager(date(2013, 3, 1))
+    backup = FakeSource(date(2013, 3, 8))
+    manager.router = SourceRouter([('primary', primary.get_historical_price_array),
+                                   ('backup', backup.get_historical_price_array)],
+                                  unadjusted=['backup'])
+    manager.add_stock('AAPL', 'Apple', 'NASDAQ', 'Technology', 'Computers')
+    np.testing.assert_equal(backup.requests, [])
+
+    primary.fail['aapl'] = date(2013, 3, 4)
+    primary.as_of = manager.calendar.last = date(2013, 3, 8)
+    manager.sync_quotes()
+    np.testing.assert_equal(backup.requests, [('aapl', date(2013, 3, 4), date(2013, 3, 8))])
+    session = manager.db.Session()
+    marks = watermarks.load(session, ['aapl'])['aapl']
+    session.close()
+    np.testing.assert_equal(marks[watermarks.QUOTES], date(2013, 3, 8))
+    np.testing.assert_equal(marks[watermarks.UNADJUSTED], date(2013, 3, 4))
+
+    # Once the adjusted source is back the unadjusted quotes are replaced
+    del primary.fail['aapl']
+    plan = manager.sync_quotes()
+    np.testing.assert_equal([(item.kind, item.start) for item in plan.downloads],
+                            [(planner.TAIL, date(2013, 3, 4))])
+    np.testing.assert_equal(primary.requests[-1], ('aapl', date(2013, 3, 4), date(2013, 3, 8)))
+    session = manager.db.Session()
+    np.testing.assert_(watermarks.UNADJUSTED not in watermarks.load(session, ['aapl'])['aapl'])
+    session.close()
+    np.testing.assert_equal(manager.sync_quotes().downloads, [])
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+""" tickstore.py
+Columnar on-disk storage for tick-by-tick trade and order book data
+
+Data is stored per symbol per day as one raw binary file per column under
+``<root>/<symbol>/<YYYYMMDD>/``. Trades use:
+
+* ``timestamp.i8`` -- int64 nanoseconds since the epoch, naive exchange time
+* ``price.f8`` -- float64 trade price
+* ``size.i8`` -- int64 trade size
+
+Order book snapshots use ``book_timestamp.i8``, ``bid.f8``,
+``bid_depth.i8``, ``offer.f8`` and ``offer_depth.i8``.
+
+Files are only ever appended to and timestamps within a day are sorted, so
+reads memory-map the columns and find ranges by binary search.
+
+Each day also has a ``committed`` file holding the number of complete rows.
+It is replaced atomically after every column has been appended, so rows past
+it belong to an append that didn't finish. Reads ignore them and the next
+append truncates them away.
+"""
+
+import os
+from collections import Counter
+from datetime import date, datetime
+
+import numpy as np
+
+import config as cfg
+from ..sources import netfonds
+
+NS_PER_DAY = 86400 * 10 ** 9
+
+# Name of the file holding a day's committed row count
+COMMITTED = 'committed'
+
+# Layout of records returned by TickStore.get
+tick_dtype = np.dtype([('timestamp', 'M8[ns]'), ('price', np.float64),
+                       ('size', np.int64)])
+
+# Layout of records returned by BookStore.get
+book_dtype = np.dtype([('timestamp', 'M8[ns]'),
+                       ('bid', np.float64), ('bid_depth', np.int64),
+                       ('offer', np.float64), ('offer_depth', np.int64)])
+
+
+def to_ns(value, end=False):
+    """ Convert a date, datetime or datetime64 to integer nanoseconds
+
+    :param value: Time to convert.
+    :param end: (Optional) If True and value is a date without a time, return
+    the start of the following day so the whole day is included in a range.
+    """
+    ns = np.datetime64(value).astype('M8[ns]').astype(np.int64)
+    if end and isinstance(value, date) and not isinstance(value, datetime):
+        ns += NS_PER_DAY
+    return int(ns)
+
+
+def _netfonds_timestamps(data):
+    """ Integer nanosecond timestamps from a netfonds dump
+    """
+    return data['timestamps'].astype('M8[ns]').view(np.int64)
+
+
+def _read_column(path, dtype):
+    """ Memory-map a column file. Empty or missing files give empty arrays.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+class ColumnStore(object):
+    """ Append-only per-symbol per-day columnar store
+
+    Subclasses define ``columns``, a list of (name, type, file name) tuples
+    whose first entry is the int64 nanosecond timestamp, and ``dtype``, the
+    record layout returned by ``get``.
+    """
+    columns = []
+    dtype = None
+
+    def __init__(self, root=None):
+        """ Create a store
+
+        :param root: (Optional) Directory holding the store. Defaults to
+        ``config.STOCKS_TICK_STORE``.
+        """
+        self.root = cfg.STOCKS_TICK_STORE if root is None else root
+
+    def day_path(self, symbol, day):
+        """ Directory holding a day of data
+
+        :param symbol: Ticker symbol.
+        :param day: Day as a date, datetime64 or integer days since the epoch.
+        """
+        return os.path.join(self.root, symbol.lower(),
+                            str(np.datetime64(day, 'D')).replace('-', ''))
+
+    def days(self, symbol):
+        """ Days stored for a symbol
+
+        :param symbol: Ticker symbol.
+        :returns: Sorted datetime64[D] array of stored days.
+        """
+        path = os.path.join(self.root, symbol.lower())
+        if not os.path.isdir(path):
+            return np.empty(0, dtype='M8[D]')
+        names = sorted(name for name in os.listdir(path) if len(name) == 8)
+        return np.array(['%s-%s-%s' % (n[:4], n[4:6], n[6:]) for n in names],
+                        dtype='M8[D]')
+
+    def read_day(self, symbol, day):
+        """ Memory-map the committed rows of one day of data
+
+        :param symbol: Ticker symbol.
+        :param day: Day to read as a date or datetime64.
+        :returns: Dict of column arrays.
+        """
+        path = self.day_path(symbol, day)
+        columns = dict((name, _read_column(os.path.join(path, filename), dtype))
+                       for name, dtype, filename in self.columns)
+        n = self._committed(path, columns)
+        return dict((name, column[:n]) for name, column in columns.iteritems())
+
+    def _committed(self, path, columns):
+        """ Number of complete rows of a day
+
+        Days written before commit files existed count the rows every
+        column has.
+        """
+        try:
+            with open(os.path.join(path, COMMITTED)) as committed:
+                return int(committed.read())
+        except (IOError, ValueError):
+            return min(len(column) for column in columns.itervalues())
+
+    def _commit(self, path, n):
+        # Rename is atomic, so the count is either the old or the new one
+        temp = os.path.join(path, COMMITTED + '.tmp')
+        with open(temp, 'w') as committed:
+            committed.write(str(n))
+        os.rename(temp, os.path.join(path, COMMITTED))
+
+    def _truncate(self, path, n):
+        # Drop rows of an append that didn't finish
+        for name, dtype, filename in self.columns:
+            filename = os.path.join(path, filename)
+            size = n * np.dtype(dtype).itemsize
+            if os.path.exists(filename) and os.path.getsize(filename) > size:
+                with open(filename, 'r+b') as column_file:
+                    column_file.truncate(size)
+
+    def _unstored(self, data, start, end, stored):
+        """ Rows in [start, end) of data that aren't already stored
+
+        Rows are compared in full, and counted, so trades that share the last
+        stored timestamp are kept unless an identical row is already stored.
+        Rows before the last stored timestamp are never written again.
+
+        :returns: Array of row indices.
+        """
+        if not len(stored['timestamp']):
+            return np.arange(start, end)
+        last = stored['timestamp'][-1]
+        timestamps = data['timestamp'][start:end]
+        lo = start + np.searchsorted(timestamps, last, 'left')
+        hi = start + np.searchsorted(timestamps, last, 'right')
+        names = [name for name, _, _ in self.columns]
+        group = np.searchsorted(stored['timestamp'], last, 'left')
+        seen = Counter(zip(*[stored[name][group:].tolist() for name in names]))
+        keep = []
+        for i, row in enumerate(zip(*[data[name][lo:hi].tolist() for name in names])):
+            if seen[row]:
+                seen[row] -= 1
+            else:
+                keep.append(lo + i)
+        return np.append(np.array(keep, dtype=np.int64), np.arange(hi, end))
+
+    def _append(self, symbol, data):
+        """ Append sorted column arrays for a symbol
+
+        Rows before the last stored timestamp of their day are skipped, as
+        are rows at that timestamp that are already stored, so a day's dump
+        can be ingested again to pick up only the new rows.
+
+        :returns: Number of rows written.
+        """
+        timestamps = data['timestamp']
+        if len(timestamps) and np.any(np.diff(timestamps) < 0):
+            raise ValueError('Rows must be sorted by timestamp')
+
+        # Split on day boundaries
+        days = timestamps // NS_PER_DAY
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        written = 0
+        for start, end in zip(np.append(0, bounds), np.append(bounds, len(days))):
+            if start == end:
+                continue
+            day = days[start]
+            stored = self.read_day(symbol, day)
+            rows = self._unstored(data, start, end, stored)
+            if not len(rows):
+                continue
+
+            path = self.day_path(symbol, day)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            n = len(stored['timestamp'])
+            self._truncate(path, n)
+            for name, _, filename in self.columns:
+                with open(os.path.join(path, filename), 'ab') as column_file:
+                    column_file.write(data[name][rows].tostring())
+            self._commit(path, n + len(rows))
+            written += len(rows)
+        return written
+
+    def get(self, symbol, start, end):
+        """ Get the rows for a symbol in a time range
+
+        :param symbol: Ticker symbol.
+        :param start: Start of the range (inclusive).
+        :param end: End of the range (exclusive). A date without a time
+        includes that whole day.
+        :returns: Structured array of ``dtype`` records.
+        """
+        start = to_ns(start)
+        end = to_ns(end, end=True)
+        days = self.days(symbol).astype(np.int64)
+        days = days[(days >= start // NS_PER_DAY) & (days <= (end - 1) // NS_PER_DAY)]
+
+        chunks = []
+        for day in days:
+            data = self.read_day(symbol, day)
+            lo, hi = np.searchsorted(data['timestamp'], [start, end])
+            if hi > lo:
+                chunks.append(dict((name, data[name][lo:hi]) for name, _, _ in self.columns))
+
+        records = np.empty(sum(len(chunk['timestamp']) for chunk in chunks), dtype=self.dtype)
+        offset = 0
+        for chunk in chunks:
+            n = len(chunk['timestamp'])
+            for name, _, _ in self.columns:
+                records[name][offset:offset + n] = chunk[name].view(self.dtype[name])
+            offset += n
+        return records
+
+
+class TickStore(ColumnStore):
+    """ Append-only per-symbol per-day columnar tick store
+    """
+    columns = [('timestamp', np.int64, 'timestamp.i8'),
+               ('price', np.float64, 'price.f8'),
+               ('size', np.int64, 'size.i8')]
+    dtype = tick_dtype
+
+    def append(self, symbol, timestamps, prices, sizes):
+        """ Append ticks for a symbol
+
+        Ticks must be sorted by timestamp. Ticks before the last stored
+        timestamp of their day, and ticks at it that are already stored, are
+        skipped.
+
+        :param symbol: Ticker symbol.
+        :param timestamps: Array of int64 nanosecond timestamps.
+        :param prices: Array of trade prices.
+        :param sizes: Array of trade sizes.
+        :returns: Number of ticks written.
+        """
+        return self._append(symbol, {
+            'timestamp': np.asarray(timestamps, dtype=np.int64),
+            'price': np.asarray(prices, dtype=np.float64),
+            'size': np.asarray(sizes, dtype=np.int64)})
+
+    def ingest(self, symbol, exchange, tickdate):
+        """ Download a day of Netfonds trades and append them to the store
+
+        :param symbol: Ticker symbol.
+        :param exchange: Exchange the symbol trades on.
+        :param tickdate: Day to download.
+        :returns: Number of ticks written.
+        """
+        ticks = netfonds.get(symbol, exchange, tickdate, 'tick')
+        timestamps = _netfonds_timestamps(ticks)
+        order = np.argsort(timestamps, kind='mergesort')
+        return self.append(symbol, timestamps[order],
+                           np.asarray(ticks['prices'])[order],
+                           np.asarray(ticks['quantities'])[order])
+
+
+class BookStore(ColumnStore):
+    """ Append-only per-symbol per-day order book snapshot store
+
+    Snapshots hold the best bid and offer and their depths. Besides range
+    reads, the store replays snapshots in time order and looks up the book
+    prevailing at arbitrary (e.g. trade) timestamps.
+    """
+    columns = [('timestamp', np.int64, 'book_timestamp.i8'),
+               ('bid', np.float64, 'bid.f8'),
+               ('bid_depth', np.int64, 'bid_depth.i8'),
+               ('offer', np.float64, 'offer.f8'),
+               ('offer_depth', np.int64, 'offer_depth.i8')]
+    dtype = book_dtype
+
+    def append(self, symbol, timestamps, bids, bid_depths, offers, offer_depths):
+        """ Append order book snapshots for a symbol
+
+        Snapshots must be sorted by timestamp. Snapshots before the last
+        stored timestamp of their day, and snapshots at it that are already
+        stored, are skipped.
+
+        :returns: Number of snapshots written.
+        """
+        return self._append(symbol, {
+            'timestamp': np.asarray(timestamps, dtype=np.int64),
+            'bid': np.asarray(bids, dtype=np.float64),
+            'bid_depth': np.asarray(bid_depths, dtype=np.int64),
+            'offer': np.asarray(offers, dtype=np.float64),
+            'offer_depth': np.asarray(offer_depths, dtype=np.int64)})
+
+    def ingest(self, symbol, exchange, tickdate):
+        """ Download a day of Netfonds book snapshots and append them
+
+        :param symbol: Ticker symbol.
+        :param exchange: Exchange the symbol trades on.
+        :param tickdate: Day to download.
+        :returns: Number of snapshots written.
+        """
+        books = netfonds.get(symbol, exchange, tickdate, 'book')
+        timestamps = _netfonds_timestamps(books)
+        order = np.argsort(timestamps, kind='mergesort')
+        return self.append(symbol, timestamps[order],
+                           np.asarray(books['bids'])[order],
+                           np.asarray(books['bid_depths'])[order],
+                           np.asarray(books['offers'])[order],
+                           np.asarray(books['offer_depths'])[order])
+
+    def replay(self, symbol, start, end, chunk_size=65536):
+        """ Iterate over book states in time order
+
+        Snapshots are read a chunk at a time from the memory-mapped columns.
+
+        :param symbol: Ticker symbol.
+        :param start: Start of the range (inclusive).
+        :param end: End of the range (exclusive).
+        :param chunk_size: (Optional) Number of snapshots read at once.
+        :returns: Generator of ``book_dtype`` records.
+        """
+        start = to_ns(start)
+        end = to_ns(end, end=True)
+        days = self.days(symbol).astype(np.int64)
+        days = days[(days >= start // NS_PER_DAY) & (days <= (end - 1) // NS_PER_DAY)]
+        for day in days:
+            data = self.read_day(symbol, day)
+            lo, hi = np.searchsorted(data['timestamp'], [start, end])
+            for offset in xrange(lo, hi, chunk_size):
+                chunk = np.empty(min(chunk_size, hi - offset), dtype=self.dtype)
+                for name, _, _ in self.columns:
+                    chunk[name] = data[name][offset:offset + len(chunk)].view(self.dtype[name])
+                for book in chunk:
+                    yield book
+
+    def asof(self, symbol, timestamps):
+        """ Look up the book prevailing at each timestamp
+
+        The prevailing book is the last snapshot at or before the timestamp
+        on the same day.
+
+        :param symbol: Ticker symbol.
+        :param timestamps: Sorted array of datetime64[ns] or int64 ns
+        timestamps, e.g. trade times from ``TickStore.get``.
+        :returns: ``book_dtype`` array aligned with timestamps. Timestamps
+        without a prevailing book get a NaT timestamp and NaN prices.
+        """
+        timestamps = np.asarray(timestamps).view(np.int64)
+        books = np.zeros(len(timestamps), dtype=self.dtype)
+        books['timestamp'] = np.datetime64('NaT')
+        books['bid'] = np.nan
+        books['offer'] = np.nan
+
+        days = timestamps // NS_PER_DAY
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        for start, end in zip(np.append(0, bounds), np.append(bounds, len(days))):
+            if start == end:
+                continue
+            data = self.read_day(symbol, days[start])
+            rows = np.searchsorted(data['timestamp'], timestamps[start:end], 'right') - 1
+            found = rows >= 0
+            target = np.arange(start, end)[found]
+            for name, _, _ in self.columns:
+                books[name][target] = data[name][rows[found]].view(self.dtype[name])
+        return books
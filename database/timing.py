@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+""" timing.py
+
+Lightweight timing instrumentation for hot paths.
+
+Code is instrumented with spans, either as a context manager or a
+decorator. Durations are aggregated into histograms keyed by span name and
+labels. Instrumentation is off unless enabled, and a disabled span does
+nothing but return a shared no-op object, so it can stay in place on hot
+paths.
+
+sample usage:
+>>> import timing
+>>> timing.enable()
+>>> with timing.span('download', ticker='aapl'):
+...     pass
+>>> @timing.timed('calculate')
+... def calculate():
+...     pass
+>>> print timing.to_prometheus()
+
+Setting the STOCKS_TIMING environment variable enables instrumentation at
+import time. ``python database.py`` then prints a summary when it finishes,
+or writes JSON or Prometheus text to STOCKS_TIMING_OUTPUT if that is set.
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+enabled = bool(os.environ.get('STOCKS_TIMING'))
+
+_histograms = {}
+_lock = threading.Lock()
+
+
+class Histogram(object):
+    """ Count, sum, extremes and bucket counts of durations
+    """
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def to_dict(self):
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'min': self.min if self.count else 0.0,
+                'max': self.max,
+                'buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'], self.buckets))}
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """ Discard everything recorded so far
+    """
+    with _lock:
+        _histograms.clear()
+
+
+def record(name, seconds, **labels):
+    """ Add a duration to the histogram for name and labels
+    """
+    key = (name, tuple(sorted(labels.iteritems())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.add(seconds)
+
+
+class _Span(object):
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.time() - self.start, **self.labels)
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_null_span = _NullSpan()
+
+
+def span(name, **labels):
+    """ Context manager timing its block under name and labels
+    """
+    if not enabled:
+        return _null_span
+    return _Span(name, labels)
+
+
+def timed(name=None, **labels):
+    """ Decorator timing every call of a function
+
+    :param name: (optional) Span name. Defaults to the function name.
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(span_name, time.time() - start, **labels)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """ Recorded histograms as a list of dicts with name and labels
+    """
+    with _lock:
+        items = sorted(_histograms.items())
+    return [dict(histogram.to_dict(), name=name, labels=dict(labels))
+            for (name, labels), histogram in items]
+
+
+def to_json(**kwargs):
+    return json.dumps(snapshot(), sort_keys=True, **kwargs)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(prefix='stocks_'):
+    """ Recorded histograms in the Prometheus text exposition format
+    """
+    lines = []
+    typed = set()
+    for entry in snapshot():
+        metric = prefix + entry['name'] + '_seconds'
+        if metric not in typed:
+            lines.append('# TYPE %s histogram' % metric)
+            typed.add(metric)
+        labels = ['%s="%s"' % (key, _escape(value))
+                  for key, value in sorted(entry['labels'].iteritems())]
+        cumulative = 0
+        for bound in [str(b) for b in BUCKETS] + ['+Inf']:
+            cumulative += entry['buckets'][bound]
+            lines.append('%s_bucket{%s} %d' % (metric, ','.join(labels + ['le="%s"' % bound]),
+                                               cumulative))
+        label_text = '{%s}' % ','.join(labels) if labels else ''
+        lines.append('%s_sum%s %r' % (metric, label_text, entry['total']))
+        lines.append('%s_count%s %d' % (metric, label_text, entry['count']))
+    return '\n'.join(lines) + '\n'
+
+
+def dump(path):
+    """ Write recorded histograms to path, as JSON if it ends with .json and
+    Prometheus text otherwise
+    """
+    with open(path, 'w') as f:
+        if path.endswith('.json'):
+            f.write(to_json(indent=1))
+        else:
+            f.write(to_prometheus())
+
+
+def summary():
+    """ Plain text table of recorded spans, slowest total first
+    """
+    entries = sorted(snapshot(), key=lambda entry: -entry['total'])
+    lines = ['%-48s %8s %12s %12s %12s' % ('span', 'count', 'total (s)', 'mean (s)', 'max (s)')]
+    for entry in entries:
+        labels = ','.join('%s=%s' % item for item in sorted(entry['labels'].iteritems()))
+        name = entry['name'] + ('{%s}' % labels if labels else '')
+        lines.append('%-48s %8d %12.4f %12.4f %12.4f' % (name, entry['count'], entry['total'],
+                                                        entry['mean'], entry['max']))
+    return '\n'.join(lines)
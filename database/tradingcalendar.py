@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+""" tradingcalendar.py
+
+Offline exchange trading calendar.
+
+Holidays and early closes are generated from the exchange's rules instead
+of being looked up, and kept as sorted M8[D] arrays so membership tests and
+trading day counts are numpy searches. NYSE, NASDAQ and AMEX share one
+holiday schedule. The rules follow the current NYSE schedule along with
+the major rule changes since 1954, including Election Day closures and the
+1968 paperwork crisis, and the unscheduled closures listed below. Earlier
+years miss the Lincoln's Birthday, Columbus Day and Veterans Day closures
+and are approximate.
+
+sample usage:
+>>> nyse = tradingcalendar.get('NYSE')
+>>> nyse.is_trading_day(date(2013, 7, 4))
+False
+>>> nyse.trading_days(date(2013, 12, 23), date(2013, 12, 31))
+>>> nyse.last_complete_day()
+"""
+
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+
+
+# Closures outside the regular rules
+SPECIAL_CLOSURES = [date(1963, 11, 25),  # Kennedy funeral
+                    date(1968, 4, 9),    # Day of mourning for Martin Luther King
+                    date(1968, 7, 5),    # Day after Independence Day
+                    date(1969, 2, 10),   # Snowstorm
+                    date(1969, 3, 31),   # Eisenhower funeral
+                    date(1969, 7, 21),   # First lunar landing
+                    date(1972, 12, 28),  # Truman funeral
+                    date(1973, 1, 25),   # Johnson funeral
+                    date(1977, 7, 14),   # New York City blackout
+                    date(1985, 9, 27),   # Hurricane Gloria
+                    date(1994, 4, 27),   # Nixon funeral
+                    date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13),
+                    date(2001, 9, 14),   # September 11th
+                    date(2004, 6, 11),   # Reagan funeral
+                    date(2007, 1, 2),    # Ford funeral
+                    date(2012, 10, 29), date(2012, 10, 30),  # Hurricane Sandy
+                    date(2018, 12, 5),   # G. H. W. Bush funeral
+                    date(2025, 1, 9)]    # Carter funeral
+
+# Regular and early closing times, exchange local time
+CLOSE = time(16)
+EARLY_CLOSE = time(13)
+
+# Hours after the close before the day's quotes are published by the sources
+PUBLISH_DELAY = 3
+
+
+def easter(year):
+    """ Gregorian Easter Sunday, anonymous algorithm
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year, month, weekday, n):
+    # n-th given weekday of a month, counting from the end if n is negative
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7 + 7 * (-n - 1))
+
+
+def _observed(day):
+    # Saturday holidays are observed on Friday, Sunday holidays on Monday
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def _paperwork_crisis(holidays):
+    # Wednesdays from June 12th 1968 to the end of the year, when the NYSE
+    # closed to clear its paperwork backlog, except in weeks with a holiday
+    weeks = set(day.isocalendar()[:2] for day in holidays)
+    closed = []
+    day = date(1968, 6, 12)
+    while day.year == 1968:
+        if day.isocalendar()[:2] not in weeks:
+            closed.append(day)
+        day += timedelta(days=7)
+    return closed
+
+
+def nyse_holidays(year):
+    """ NYSE full day holidays of a year
+    """
+    days = []
+    # New Year's Day falling on a Saturday isn't observed on the Friday before
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.append(_observed(new_year))
+    if year >= 1998:
+        days.append(_nth_weekday(year, 1, 0, 3))       # Martin Luther King Jr. Day
+    if year >= 1971:
+        days.append(_nth_weekday(year, 2, 0, 3))       # Washington's Birthday
+    else:
+        days.append(_observed(date(year, 2, 22)))
+    days.append(easter(year) - timedelta(days=2))      # Good Friday
+    if year >= 1971:
+        days.append(_nth_weekday(year, 5, 0, -1))      # Memorial Day
+    else:
+        days.append(_observed(date(year, 5, 30)))
+    if year >= 2022:
+        days.append(_observed(date(year, 6, 19)))      # Juneteenth
+    days.append(_observed(date(year, 7, 4)))           # Independence Day
+    days.append(_nth_weekday(year, 9, 0, 1))           # Labor Day
+    if year <= 1968 or year in (1972, 1976, 1980):
+        # Election Day, every year and then presidential elections only
+        days.append(_nth_weekday(year, 11, 0, 1) + timedelta(days=1))
+    days.append(_nth_weekday(year, 11, 3, 4))          # Thanksgiving
+    days.append(_observed(date(year, 12, 25)))         # Christmas
+    if year == 1968:
+        days.extend(_paperwork_crisis(days))
+    return [day for day in days if day.weekday() < 5]
+
+
+def nyse_early_closes(year):
+    """ NYSE 13:00 closes of a year, before removing holidays
+    """
+    return [date(year, 7, 3),                                      # Before Independence Day
+            _nth_weekday(year, 11, 3, 4) + timedelta(days=1),      # After Thanksgiving
+            date(year, 12, 24)]                                    # Christmas Eve
+
+
+class TradingCalendar(object):
+    """ Trading days of an exchange between first_year and last_year
+
+    :param holidays: Function of a year returning its holidays.
+    :param early_closes: Function of a year returning candidate early close
+    days. Days that aren't trading days are dropped.
+    :param special: Extra closures.
+    """
+    def __init__(self, holidays=nyse_holidays, early_closes=nyse_early_closes,
+                 special=SPECIAL_CLOSURES, first_year=1900, last_year=2100):
+        years = range(first_year, last_year + 1)
+        closed = [day for year in years for day in holidays(year)] + list(special)
+        self.holidays = np.unique(np.array(closed, dtype='M8[D]'))
+        self.busdaycal = np.busdaycalendar(holidays=self.holidays)
+        early = np.array([day for year in years for day in early_closes(year)], dtype='M8[D]')
+        self.early_closes = np.unique(early[np.is_busday(early, busdaycal=self.busdaycal)])
+
+    def is_trading_day(self, day):
+        return bool(np.is_busday(np.datetime64(day, 'D'), busdaycal=self.busdaycal))
+
+    def is_early_close(self, day):
+        day = np.datetime64(day, 'D')
+        index = np.searchsorted(self.early_closes, day)
+        return index < len(self.early_closes) and self.early_closes[index] == day
+
+    def close_time(self, day):
+        """ Closing time of a day, None if the exchange is closed
+        """
+        if not self.is_trading_day(day):
+            return None
+        return EARLY_CLOSE if self.is_early_close(day) else CLOSE
+
+    def trading_days(self, start, end):
+        """ Trading days in [start, end] as a sorted M8[D] array
+        """
+        days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1, dtype='M8[D]')
+        return days[np.is_busday(days, busdaycal=self.busdaycal)]
+
+    def count(self, start, end):
+        """ Number of trading days in [start, end]
+        """
+        return int(np.busday_count(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1,
+                                   busdaycal=self.busdaycal))
+
+    def previous_trading_day(self, day):
+        """ Last trading day strictly before day
+        """
+        return np.busday_offset(np.datetime64(day, 'D') - 1, 0, roll='backward',
+                                busdaycal=self.busdaycal).tolist()
+
+    def next_trading_day(self, day):
+        """ First trading day strictly after day
+        """
+        return np.busday_offset(np.datetime64(day, 'D') + 1, 0, roll='forward',
+                                busdaycal=self.busdaycal).tolist()
+
+    def last_complete_day(self, now=None):
+        """ Newest day whose quotes should be published by now
+
+        :param now: (optional) Local datetime. Defaults to the current time.
+        """
+        now = now or datetime.now()
+        today = now.date()
+        close = self.close_time(today)
+        if close is not None and now.time() >= time(close.hour + PUBLISH_DELAY, close.minute):
+            return today
+        return self.previous_trading_day(today)
+
+
+# Exchanges sharing the NYSE holiday schedule
+EXCHANGES = ('NYSE', 'NASDAQ', 'AMEX')
+
+_calendars = {}
+
+
+def get(exchange='NYSE'):
+    """ Cached calendar of an exchange
+
+    Raises KeyError for unknown exchanges.
+    """
+    exchange = exchange.upper()
+    if exchange not in EXCHANGES:
+        raise KeyError('No trading calendar for %s' % exchange)
+    if 'NYSE' not in _calendars:
+        _calendars['NYSE'] = TradingCalendar()
+    return _calendars['NYSE']
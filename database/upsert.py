@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+""" upsert.py
+
+Idempotent bulk writes.
+
+Rows are written with INSERT ... ON DUPLICATE KEY UPDATE on MySQL and
+INSERT ... ON CONFLICT DO UPDATE elsewhere (SQLite 3.24+ and PostgreSQL),
+in executemany batches. A row whose key is already stored overwrites it
+instead of failing or being duplicated, so overlapping or repeated
+downloads can be written blindly without checking what exists first.
+
+The key columns must carry a primary key or unique index. On MySQL a
+missing index means duplicates are inserted silently, so databases created
+before the (Ticker, Date) index need ``python migrations.py index`` first.
+"""
+
+from sqlalchemy import text
+
+
+def upsert_statement(dialect, table, keys, columns):
+    """ Upsert statement for a table
+
+    :param dialect: SQLAlchemy dialect name.
+    :param table: Table name.
+    :param keys: Columns of the unique key rows are matched on.
+    :param columns: Other columns written, and overwritten on a match.
+    """
+    names = list(keys) + list(columns)
+    values = ', '.join(':' + name for name in names)
+    if dialect == 'mysql':
+        updates = ', '.join('%s = VALUES(%s)' % (c, c) for c in columns)
+        sql = 'INSERT INTO %s (%s) VALUES (%s) ON DUPLICATE KEY UPDATE %s' % (
+            table, ', '.join(names), values, updates)
+    else:
+        updates = ', '.join('%s = excluded.%s' % (c, c) for c in columns)
+        sql = 'INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) DO UPDATE SET %s' % (
+            table, ', '.join(names), values, ', '.join(keys), updates)
+    return text(sql)
+
+
+def upsert(session, table, keys, rows, batch_size=1000):
+    """ Insert or overwrite rows in batches
+
+    :param table: SQLAlchemy Table.
+    :param keys: Columns of the unique key rows are matched on.
+    :param rows: List of dicts with the same columns, keys included.
+    :param batch_size: Rows per executemany.
+    :returns: Number of rows written
+    """
+    if not rows:
+        return 0
+    columns = [name for name in rows[0] if name not in keys]
+    # Column order doesn't matter to the database, keep statements stable
+    columns.sort(key=[c.name for c in table.columns].index)
+    statement = upsert_statement(session.bind.dialect.name, table.name, keys, columns)
+    for start in range(0, len(rows), batch_size):
+        session.execute(statement, rows[start:start + batch_size])
+    return len(rows)
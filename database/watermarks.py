@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+""" watermarks.py
+
+Per-ticker freshness watermarks.
+
+The Watermarks table records, for every ticker, the date of its newest
+quote and the newest quote date each indicator has been computed through.
+Writers update watermarks in the same transaction as the data they
+describe, so a sync can plan the whole universe from one small query
+instead of probing Quotes and Indicators ticker by ticker.
+"""
+
+from datetime import date
+
+from sqlalchemy import and_, func, literal, select
+
+from models import Quote, Indicator, Watermark
+
+
+# Watermark name of a ticker's newest quote
+QUOTES = 'quotes'
+
+# Watermark name of the oldest quote stored from a source whose AdjClose
+# isn't adjusted for splits and dividends. Quotes are downloaded again from
+# there until an adjusted source answers.
+UNADJUSTED = 'unadjusted'
+
+# Watermark name of the newest day missing quotes inside a ticker's history
+# were requested through. Days the source doesn't have stay missing, and
+# aren't requested again.
+GAPS = 'gaps'
+
+
+def _to_date(value):
+    # SQLite hands back aggregate dates as strings
+    if value is None or isinstance(value, date):
+        return value
+    return date(*map(int, str(value)[:10].split('-')))
+
+
+def load(session, tickers=None):
+    """ Get watermarks with a single query
+
+    :param tickers: (optional) Tickers to load. Defaults to all of them.
+    :returns: Dict of ticker to a dict of watermark name to date
+    """
+    query = session.query(Watermark.Ticker, Watermark.Name, Watermark.Date)
+    if tickers is not None:
+        query = query.filter(Watermark.Ticker.in_([t.lower() for t in tickers]))
+    marks = {}
+    for ticker, name, mark in query:
+        marks.setdefault(ticker, {})[name] = _to_date(mark)
+    return marks
+
+
+def save(session, ticker, marks):
+    """ Replace watermarks of a ticker inside the session's transaction
+
+    :param marks: Dict of watermark name to date.
+    """
+    if not marks:
+        return
+    table = Watermark.__table__
+    ticker = ticker.lower()
+    session.execute(table.delete().where(and_(table.c.Ticker == ticker,
+                                              table.c.Name.in_(list(marks)))))
+    session.execute(table.insert(), [{'Ticker': ticker, 'Name': name, 'Date': mark}
+                                     for name, mark in marks.iteritems()])
+
+
+def delete(session, ticker, names=None):
+    """ Delete watermarks of a ticker inside the session's transaction
+
+    :param names: (optional) Watermark names to delete. Defaults to all of
+    them.
+    """
+    table = Watermark.__table__
+    where = table.c.Ticker == ticker.lower()
+    if names is not None:
+        where = and_(where, table.c.Name.in_(list(names)))
+    session.execute(table.delete().where(where))
+
+
+def is_fresh(marks, name):
+    """ True if the named watermark has caught up with the ticker's quotes
+    """
+    quotes = marks.get(QUOTES)
+    mark = marks.get(name)
+    return quotes is not None and mark is not None and mark >= quotes
+
+
+def rebuild(session, names):
+    """ Recompute every watermark from the Quotes and Indicators tables
+
+    This scans the big tables once per indicator and is meant for backfilling
+    databases created before watermarks existed.
+
+    :param names: Indicator column names to compute watermarks for.
+    """
+    table = Watermark.__table__
+    session.execute(table.delete())
+    session.execute(table.insert().from_select(
+            ['Ticker', 'Name', 'Date'],
+            select([Quote.Ticker, literal(QUOTES), func.max(Quote.Date)])
+            .group_by(Quote.Ticker)))
+    for name in names:
+        session.execute(table.insert().from_select(
+                ['Ticker', 'Name', 'Date'],
+                select([Quote.Ticker, literal(name), func.max(Quote.Date)])
+                .select_from(Quote.__table__.join(Indicator.__table__,
+                                                  Indicator.Id == Quote.Id))
+                .where(getattr(Indicator, name) != None)
+                .group_by(Quote.Ticker)))
@@ -5,10 +5,13 @@ Python interface to the St.Louis Fed's Federal Reserve Economic Data
 """
 
 from .config import FRED_API_KEY
+import threading
+import time
 import urllib
+from multiprocessing.pool import ThreadPool
 from xml.etree import ElementTree
-from datetime import date
-from time import mktime, strptime
+
+import numpy as np
 
 indicators = {'bank_prime_loan_rate': 'DPRIME',
               'primary_credit_rate': 'DPCREDIT',
@@ -64,36 +67,137 @@ indicators = {'bank_prime_loan_rate': 'DPRIME',
               'wilshire_us_resi_tmi': 'WILLRESIND'
               }
 
-
-
-def _get_url(fname):
-    return 'http://api.stlouisfed.org/fred/series/observations?series_id=' + fname + '&api_key=' + FRED_API_KEY
-
-def _get_raw(fname):
-    tree = ElementTree.fromstring(urllib.urlopen(_get_url(fname)).read())
-    observations = tree.iter('observation')
-    # Get dates
-    dates = [date.fromtimestamp(mktime(strptime(obs.get('date'), '%Y-%m-%d'))) for obs in tree.iter('observation')]
-    # Get values
-    values = [obs.get('value') for obs in tree.iter('observation')]
-    # FRED uses a "." to indicate that there is no data for a given date,
-    # so we just do a zero-order interpolation here
-    for i in range(len(values)):
-        if values[i] == '.':
-            values[i] = values[i-1]
-
-    # Return dates and values in a nested list
-    data = []
-    for i in range(len(dates)):
-        data.append[dates[i], float(values[i])]
-
-    return data
-
-def get(indicator):
-    return _get_raw(indicators[indicator])
-
-
-
-
-
-
+# Approximate days between an observation's date and its public release.
+# FRED dates monthly and quarterly observations at the start of the period,
+# so their values can't be known until well after that date. Series not
+# listed are daily and published the next day.
+release_lags = {'consumer_price_index': 45,
+                'real_gdp': 120,
+                'civilian_unemployment_rate': 35,
+                'm2_money_stock': 35}
+
+def release_lag(indicator):
+    return release_lags.get(indicator, 1)
+
+
+
+def _get_url(fname, observation_start=None):
+    url = 'http://api.stlouisfed.org/fred/series/observations?series_id=' + fname + '&api_key=' + FRED_API_KEY
+    if observation_start is not None:
+        url += '&observation_start=' + observation_start.strftime('%Y-%m-%d')
+    return url
+
+def _iter_observations(stream):
+    """ Yield (date, value) strings from a FRED observations response
+
+    Elements are cleared as soon as they are read so memory use stays
+    bounded regardless of series length.
+    """
+    for event, elem in ElementTree.iterparse(stream):
+        if elem.tag == 'observation':
+            yield elem.get('date'), elem.get('value')
+            elem.clear()
+
+
+def _to_arrays(observations, previous=None):
+    """ Convert (date, value) strings into date and value arrays
+
+    FRED uses a "." to indicate that there is no data for a given date, so
+    we do a zero-order interpolation here. Leading missing values carry
+    previous forward, the last value stored before an incremental fetch. On
+    full fetches they have nothing to carry and are dropped.
+    """
+    pairs = list(observations)
+    if not pairs:
+        return np.array([], dtype='M8[D]'), np.array([], dtype=np.float64)
+    dates, raw = zip(*pairs)
+    dates = np.array(dates, dtype='M8[D]')
+    raw = np.array(raw)
+    present = raw != '.'
+    values = np.full(len(raw) + 1, np.nan)
+    values[0] = np.nan if previous is None else previous
+    values[1:][present] = raw[present].astype(np.float64)
+    # Index into values of the latest observation, 0 being previous
+    last = np.maximum.accumulate(np.where(present, np.arange(1, len(raw) + 1), 0))
+    filled = values[last]
+    keep = ~np.isnan(filled)
+    return dates[keep], filled[keep]
+
+
+def _get_arrays(fname, observation_start=None, previous=None):
+    stream = urllib.urlopen(_get_url(fname, observation_start))
+    try:
+        return _to_arrays(_iter_observations(stream), previous)
+    finally:
+        stream.close()
+
+
+def get(indicator, observation_start=None, previous=None):
+    """ Get observations for an indicator as (dates, values) arrays
+
+    :param indicator: Key into ``indicators``.
+    :param observation_start: (optional) Only return observations on or after
+    this date.
+    :param previous: (optional) Value before observation_start, carried into
+    leading dates without data.
+    """
+    return _get_arrays(indicators[indicator], observation_start, previous)
+
+
+class RateLimiter(object):
+    """ Thread safe limiter spacing calls evenly at rate calls per period
+    seconds
+
+    :param clock: (optional) Function returning the time in seconds.
+    :param sleep: (optional) Function sleeping for a number of seconds.
+    """
+    def __init__(self, rate=120, period=60.0, clock=time.time, sleep=time.sleep):
+        self.interval = float(period) / rate
+        self.clock = clock
+        self.sleep = sleep
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = self.clock()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            self.sleep(start - now)
+
+
+def get_many(names=None, observation_start=None, previous=None, threads=8,
+             rate=120, limiter=None):
+    """ Download several series concurrently
+
+    :param names: (optional) Indicators to download, defaults to all of
+    ``indicators``.
+    :param observation_start: (optional) A date applied to every series, or a
+    dict of indicator name to date.
+    :param previous: (optional) Dict of indicator name to the value before
+    its observation_start.
+    :param threads: Number of concurrent downloads.
+    :param rate: Maximum requests per minute. FRED allows 120.
+    :param limiter: (optional) ``RateLimiter`` to use instead of one
+    allowing rate requests per minute.
+
+    Returns a dict of indicator name to (dates, values) arrays.
+    """
+    names = sorted(names or indicators)
+    if not isinstance(observation_start, dict):
+        observation_start = dict.fromkeys(names, observation_start)
+    previous = previous or {}
+    limiter = limiter or RateLimiter(rate)
+
+    def download(name):
+        limiter.wait()
+        return get(name, observation_start.get(name), previous.get(name))
+
+    pool = ThreadPool(min(threads, len(names)) or 1)
+    try:
+        results = pool.map(download, names)
+    finally:
+        pool.close()
+        pool.join()
+    return dict(zip(names, results))
@@ -7,11 +7,18 @@
 import urllib
 from datetime import date, datetime
 
+import numpy as np
+
+from yahoofinance import parse_price_rows
+
 """ googlefinance
 
 This module provides a Python API for retrieving stock data from Google Finance.
 
 """
+# AdjClose is a copy of Close, Google doesn't adjust for splits and dividends
+ADJUSTED = False
+
 _month_dict = {
         'Jan': 1,
         'Feb': 2,
@@ -48,6 +55,42 @@ def get_historical_prices(symbol, start_date=None, end_date=None):
         quote[0] = _format_date(quote[0])
     return price_data
 
+def get_historical_price_array(symbol, start_date=None, end_date=None):
+    """
+    Get historical prices for the given ticker symbol as a structured array
+    in the same format as ``yahoofinance.get_historical_price_array``.
+    """
+    return parse_historical_prices(__request(symbol), start_date, end_date)
+
+def parse_historical_prices(body, start_date=None, end_date=None):
+    """
+    Normalize a historical prices CSV response to ``yahoofinance.price_dtype``
+    records in ascending date order. Google doesn't adjust closing prices, so
+    AdjClose is a copy of Close. Dates may either be a date object or a
+    string with the format 'YYYYMMDD'.
+    """
+    rows = []
+    for line in body.split('\n')[1:]:
+        fields = line.strip().split(',')
+        if len(fields) != 6:
+            continue
+        try:
+            fields[0] = _format_date(fields[0])
+        except (ValueError, KeyError, IndexError):
+            continue
+        rows.append(fields + fields[4:5])
+    prices = parse_price_rows(rows)
+    if start_date is not None:
+        prices = prices[prices['Date'] >= _to_datetime64(start_date)]
+    if end_date is not None:
+        prices = prices[prices['Date'] <= _to_datetime64(end_date)]
+    return prices
+
+def _to_datetime64(value):
+    if not isinstance(value, date):
+        value = date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    return np.datetime64(value, 'D')
+
 def _format_date(datestr):
     """ Change datestr from google format ('20-Jul-12') to the format yahoo uses ('2012-07-20')
     """
@@ -5,8 +5,8 @@ Python interface for accessing Netfronds tick data
 """
 
 import urllib
-from datetime import date, datetime, timedelta
-from time import mktime, strptime
+
+import numpy as np
 
 _exchange_code = {
         'NYSE':'N',
@@ -23,43 +23,75 @@ def _get_url(symbol, exchange, tickdate, data_type='tick'):
     return url
 
 
-def _get_ticks(symbol, exchange, tickdate):
-    raw = [row.split() for row in urllib.urlopen(_get_url(symbol, exchange, tickdate)).read().split('\n')][1:]
-    data = []
-    for row in raw:
-        if len(row) >= 3:
-            data.append(row)
-    timestamps = [datetime.strptime(row[0], '%Y%m%dT%H%M%S') for row in data]
-    dates = [timestamp.date() for timestamp in timestamps]
-    times = [(timestamp + timedelta(hours=-6)).time()  for timestamp in timestamps]
-    prices = [float(row[1]) for row in data]
-    quantities = [int(row[2]) for row in data]
-    return {
-            'dates': dates,
-            'times': times,
-            'prices': prices,
-            'quantities': quantities}
+def _parse_timestamps(stamps, shift_hours=-6):
+    """ Convert netfonds 'YYYYMMDDTHHMMSS' timestamps in one vectorized step
 
+    The fixed-width strings are viewed as a byte matrix and each field is
+    assembled from its digit columns, so no per-row datetime objects are
+    created.
+
+    :param stamps: Sequence of timestamp strings.
+    :param shift_hours: (Optional) Timezone shift applied to the timestamps.
+    :returns: Tuple of (raw, shifted) datetime64[s] arrays.
+    """
+    stamps = np.asarray(stamps, dtype='S15')
+    digits = stamps.view(np.uint8).reshape(len(stamps), 15).astype(np.int64) - ord('0')
+
+    def field(first, last):
+        value = np.zeros(len(stamps), dtype=np.int64)
+        for column in range(first, last):
+            value = value * 10 + digits[:, column]
+        return value
+
+    months = (field(0, 4) - 1970) * 12 + field(4, 6) - 1
+    days = months.astype('M8[M]').astype('M8[D]') + (field(6, 8) - 1).astype('m8[D]')
+    seconds = field(9, 11) * 3600 + field(11, 13) * 60 + field(13, 15)
+    raw = days.astype('M8[s]') + seconds.astype('m8[s]')
+    return raw, raw + np.timedelta64(shift_hours * 3600, 's')
+
+
+def _parse_columns(body, n_columns):
+    """ Split a netfonds dump into columns of strings
+
+    The header row and rows with fewer than n_columns fields are skipped.
+    """
+    rows = [row.split() for row in body.split('\n')[1:]]
+    rows = [row[:n_columns] for row in rows if len(row) >= n_columns]
+    if not rows:
+        return [np.empty(0, dtype='S1')] * n_columns
+    return [np.array(column) for column in zip(*rows)]
 
-def _get_books(symbol, exchange, tickdate):
-    raw = [row.split() for row in urllib.urlopen(_get_url(symbol, exchange,tickdate,'book')).read().split('\n')][1:]
-    data = []
-    for row in raw:
-        if len(row) >= 7:
-            data.append(row)
-    timestamps = [datetime.strptime(row[0], '%Y%m%dT%H%M%S') for row in data]
-    dates = [timestamp.date() for timestamp in timestamps]
-    times = [(timestamp + timedelta(hours=-6)).time()  for timestamp in timestamps]
-    bids = [float(row[1]) for row in data]
-    bid_depths = [int(row[2]) for row in data]
-    offers = [float(row[4]) for row in data]
-    offer_depths = [int(row[5]) for row in data]
 
+def _parse_ticks(body):
+    columns = _parse_columns(body, 3)
+    raw, timestamps = _parse_timestamps(columns[0])
     return {
-            'bids': bids,
-            'bid_depths': bid_depths,
-            'offers': offers,
-            'offer_depths': offer_depths}
+            'timestamps': timestamps,
+            'dates': raw.astype('M8[D]'),
+            'times': timestamps - timestamps.astype('M8[D]'),
+            'prices': columns[1].astype(np.float64),
+            'quantities': columns[2].astype(np.int64)}
+
+
+def _parse_books(body):
+    columns = _parse_columns(body, 7)
+    raw, timestamps = _parse_timestamps(columns[0])
+    return {
+            'timestamps': timestamps,
+            'dates': raw.astype('M8[D]'),
+            'times': timestamps - timestamps.astype('M8[D]'),
+            'bids': columns[1].astype(np.float64),
+            'bid_depths': columns[2].astype(np.int64),
+            'offers': columns[4].astype(np.float64),
+            'offer_depths': columns[5].astype(np.int64)}
+
+
+def _get_ticks(symbol, exchange, tickdate):
+    return _parse_ticks(urllib.urlopen(_get_url(symbol, exchange, tickdate)).read())
+
+
+def _get_books(symbol, exchange, tickdate):
+    return _parse_books(urllib.urlopen(_get_url(symbol, exchange, tickdate, 'book')).read())
 
 def get(symbol, exchange, tickdate, data_type='tick'):
     if data_type == 'tick':
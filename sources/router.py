@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+""" router.py
+
+Route historical price requests across several sources.
+
+The primary source is asked first. If it hasn't answered within a
+percentile of its recent latencies, a hedged request goes to the next
+source and whichever answers first wins. Sources that fail are skipped in
+favor of the next one, and sources are ranked by their recent error rate so
+a provider that keeps failing stops being asked first.
+
+Sources whose AdjClose isn't adjusted for splits and dividends, like Google
+Finance, are only asked when unadjusted prices are acceptable, and then
+after the adjusted sources. ``route`` tells the caller which source
+answered.
+
+sample usage:
+>>> from router import SourceRouter
+>>> router = SourceRouter.default()
+>>> prices = router.get_historical_prices('goog', '20130101', '20130201')
+"""
+
+import threading
+import time
+import Queue
+from collections import deque
+
+import numpy as np
+
+import googlefinance
+import yahoofinance
+
+
+class SourceStats(object):
+    """ Rolling latency and error statistics for a source
+    """
+    def __init__(self, window=100):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency, error=False):
+        with self._lock:
+            self.requests += 1
+            self.outcomes.append(error)
+            if error:
+                self.errors += 1
+            else:
+                self.latencies.append(latency)
+
+    def percentile(self, q):
+        """ Latency percentile of recent successful requests in seconds
+        """
+        with self._lock:
+            if not self.latencies:
+                return None
+            return np.percentile(list(self.latencies), q)
+
+    @property
+    def error_rate(self):
+        with self._lock:
+            return float(sum(self.outcomes)) / len(self.outcomes) if self.outcomes else 0.0
+
+    def summary(self):
+        return {'requests': self.requests,
+                'errors': self.errors,
+                'error_rate': self.error_rate,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95)}
+
+
+class SourceRouter(object):
+    """ Hedged, failover routing of historical price requests
+
+    :param sources: List of (name, function) pairs in order of preference.
+    Each function takes (symbol, start_date, end_date) and returns an array
+    of ``yahoofinance.price_dtype`` records.
+    :param hedge_percentile: Latency percentile of the primary after which a
+    hedged request is sent to the next source.
+    :param min_samples: Latencies needed before the percentile is trusted.
+    Until then ``hedge_delay`` is used.
+    :param hedge_delay: Seconds to wait before hedging without enough samples.
+    :param window: Number of recent requests statistics are kept for.
+    :param observer: (optional) Function called with (name, seconds, error)
+    after every request, error being None on success. Exceptions it raises
+    are ignored.
+    :param unadjusted: (optional) Names of sources whose AdjClose is a copy of
+    the unadjusted close.
+    """
+    def __init__(self, sources, hedge_percentile=95, min_samples=20,
+                 hedge_delay=5.0, window=100, observer=None, unadjusted=()):
+        self.sources = list(sources)
+        self.unadjusted = set(unadjusted)
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.hedge_delay = hedge_delay
+        self.stats = dict((name, SourceStats(window)) for name, fetch in self.sources)
+        self.observer = observer
+
+    @classmethod
+    def default(cls, **kwargs):
+        """ Yahoo! Finance first, Google Finance as the fallback for
+        unadjusted prices
+        """
+        modules = [('yahoo', yahoofinance), ('google', googlefinance)]
+        kwargs.setdefault('unadjusted', [name for name, module in modules
+                                         if not module.ADJUSTED])
+        return cls([(name, module.get_historical_price_array) for name, module in modules],
+                   **kwargs)
+
+    def get_historical_prices(self, symbol, start_date, end_date, adjusted=True):
+        """ Get historical prices from the first source to answer
+
+        :param adjusted: (optional) Only ask sources whose AdjClose is
+        adjusted for splits and dividends.
+
+        Raises IOError if every source fails.
+        """
+        return self.route(symbol, start_date, end_date, adjusted)[1]
+
+    def route(self, symbol, start_date, end_date, adjusted=True):
+        """ Get historical prices along with the name of the source answering
+
+        :param adjusted: (optional) Only ask sources whose AdjClose is
+        adjusted for splits and dividends. Otherwise unadjusted sources are
+        asked after all the adjusted ones.
+        :returns: (source name, prices)
+
+        Raises IOError if every source fails.
+        """
+        # Stable sort keeps the ranking within adjusted and unadjusted sources
+        candidates = sorted(self._ranked(), key=lambda source: source[0] in self.unadjusted)
+        if adjusted:
+            candidates = [source for source in candidates if source[0] not in self.unadjusted]
+        if not candidates:
+            raise IOError('No source of adjusted prices for %s' % symbol)
+        results = Queue.Queue()
+        errors = []
+        pending = 0
+        current = None
+        while candidates or pending:
+            if not pending:
+                current = candidates.pop(0)
+                self._launch(current, results, symbol, start_date, end_date)
+                pending += 1
+            timeout = self._hedge_timeout(current[0]) if candidates else None
+            try:
+                name, value, error = results.get(timeout=timeout)
+            except Queue.Empty:
+                # Primary is slower than usual, hedge with the next source
+                current = candidates.pop(0)
+                self._launch(current, results, symbol, start_date, end_date)
+                pending += 1
+                continue
+            pending -= 1
+            if error is None:
+                return name, value
+            errors.append('%s: %s' % (name, error))
+        raise IOError('All sources failed for %s (%s)' % (symbol, '; '.join(errors)))
+
+    def summary(self):
+        """ Statistics for every source keyed by name
+        """
+        return dict((name, stats.summary()) for name, stats in self.stats.iteritems())
+
+    def _ranked(self):
+        # Stable sort keeps the preference order between equally healthy sources
+        return sorted(self.sources, key=lambda source: self.stats[source[0]].error_rate)
+
+    def _hedge_timeout(self, name):
+        stats = self.stats[name]
+        if len(stats.latencies) < self.min_samples:
+            return self.hedge_delay
+        return stats.percentile(self.hedge_percentile)
+
+    def _launch(self, source, results, symbol, start_date, end_date):
+        name, fetch = source
+        stats = self.stats[name]
+
+        def run():
+            start = time.time()
+            value, error = None, None
+            try:
+                value = fetch(symbol, start_date, end_date)
+            except Exception, e:
+                error = e
+            elapsed = time.time() - start
+            stats.record(elapsed, error=error is not None)
+            if self.observer is not None:
+                # A failing observer mustn't lose the result and hang the request
+                try:
+                    self.observer(name, elapsed, error)
+                except Exception:
+                    pass
+            results.put((name, value, error))
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
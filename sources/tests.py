@@ -0,0 +1,299 @@
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from StringIO import StringIO
+
+import fred
+import googlefinance
+import netfonds
+import yahoofinance
+from router import SourceRouter
+""" tests.py
+
+Unit tests for sources module
+"""
+
+tick_dump = '\n'.join(
+    ['time price quantity board source buyer seller initiator'] +
+    ['20130102T%02d%02d%02d %.2f %d Auto NYSE' % (15 + i // 3600, (i // 60) % 60, i % 60,
+                                                  20 + 0.01 * i, 100 + i)
+     for i in range(0, 7200, 7)] +
+    [''])
+
+book_dump = '\n'.join(
+    ['time bid bid_depth bid_depth_total offer offer_depth offer_depth_total'] +
+    ['20130102T%02d%02d%02d %.2f %d %d %.2f %d %d' % (15 + i // 3600, (i // 60) % 60, i % 60,
+                                                      20.0, i, 5 * i, 20.05, i + 1, 5 * i + 1)
+     for i in range(0, 7200, 11)] +
+    [''])
+
+
+def _legacy_parse_ticks(body):
+    """ Reference per-row implementation netfonds used before vectorizing
+    """
+    data = [row for row in [row.split() for row in body.split('\n')][1:] if len(row) >= 3]
+    timestamps = [datetime.strptime(row[0], '%Y%m%dT%H%M%S') for row in data]
+    dates = [timestamp.date() for timestamp in timestamps]
+    times = [(timestamp + timedelta(hours=-6)).time() for timestamp in timestamps]
+    prices = [float(row[1]) for row in data]
+    quantities = [int(row[2]) for row in data]
+    return {
+            'dates': dates,
+            'times': times,
+            'prices': prices,
+            'quantities': quantities}
+
+
+# ------------------------------------------------
+# Test Netfonds
+# ------------------------------------------------
+
+def test_parse_ticks():
+    """ [sources.netfonds] Test vectorized tick parsing against per-row parsing
+    """
+    result = netfonds._parse_ticks(tick_dump)
+    expected = _legacy_parse_ticks(tick_dump)
+    np.testing.assert_array_equal(result['dates'], np.array(expected['dates'], dtype='M8[D]'))
+    np.testing.assert_array_equal(
+        result['times'].astype(np.int64),
+        [t.hour * 3600 + t.minute * 60 + t.second for t in expected['times']])
+    np.testing.assert_array_equal(result['prices'], expected['prices'])
+    np.testing.assert_array_equal(result['quantities'], expected['quantities'])
+    np.testing.assert_equal(str(result['timestamps'][0]), '2013-01-02T09:00:00')
+
+
+def test_parse_books():
+    """ [sources.netfonds] Test vectorized book parsing keeps timestamps
+    """
+    result = netfonds._parse_books(book_dump)
+    np.testing.assert_equal(len(result['timestamps']), len(book_dump.split('\n')) - 2)
+    np.testing.assert_array_equal(result['bid_depths'][:3], [0, 11, 22])
+    np.testing.assert_array_equal(result['offers'][:2], [20.05, 20.05])
+
+
+def test_parse_empty():
+    """ [sources.netfonds] Test parsing a dump with no rows
+    """
+    result = netfonds._parse_ticks('time price quantity\n')
+    np.testing.assert_equal(len(result['timestamps']), 0)
+
+
+# ------------------------------------------------
+# Test Yahoo! Finance
+# ------------------------------------------------
+
+price_csv = ('Date,Open,High,Low,Close,Volume,Adj Close\r\n'
+             '2013-01-04,10.00,10.50,9.50,10.25,1200,10.20\r\n'
+             '2013-01-03,9.80,10.10,9.70,10.00,1100,9.95\r\n'
+             '2013-01-02,9.50,9.90,9.40,9.80,1000,9.75\r\n')
+
+
+def test_parse_historical_prices():
+    """ [sources.yahoofinance] Test parsing historical prices into an array
+    """
+    prices = yahoofinance.parse_historical_prices(price_csv)
+    np.testing.assert_equal(prices.dtype, yahoofinance.price_dtype)
+    np.testing.assert_array_equal(prices['Date'],
+                                  np.array(['2013-01-02', '2013-01-03', '2013-01-04'],
+                                           dtype='M8[D]'))
+    np.testing.assert_array_equal(prices['Close'], [9.80, 10.00, 10.25])
+    np.testing.assert_array_equal(prices['AdjClose'], [9.75, 9.95, 10.20])
+
+
+def test_parse_historical_prices_malformed():
+    """ [sources.yahoofinance] Test malformed rows are dropped or raise
+    """
+    body = price_csv + '2012-12-31,9.40,9.60\r\n2012-12-28,9.30,x,9.20,9.35,900,9.30\r\n'
+    prices = yahoofinance.parse_historical_prices(body)
+    np.testing.assert_equal(len(prices), 3)
+    np.testing.assert_raises(ValueError, yahoofinance.parse_historical_prices,
+                             body, True)
+    np.testing.assert_equal(len(yahoofinance.parse_historical_prices('')), 0)
+
+
+def test_parse_google_prices():
+    """ [sources.googlefinance] Test normalizing prices to the Yahoo! format
+    """
+    body = ('Date,Open,High,Low,Close,Volume\n'
+            '4-Jan-13,10.00,10.50,9.50,10.25,1200\n'
+            '3-Jan-13,9.80,10.10,9.70,10.00,1100\n'
+            '2-Jan-13,-,9.90,9.40,9.80,1000\n')
+    prices = googlefinance.parse_historical_prices(body, '20130103', date(2013, 1, 4))
+    np.testing.assert_equal(prices.dtype, yahoofinance.price_dtype)
+    np.testing.assert_array_equal(prices['Date'],
+                                  np.array(['2013-01-03', '2013-01-04'], dtype='M8[D]'))
+    np.testing.assert_array_equal(prices['AdjClose'], prices['Close'])
+
+
+# ------------------------------------------------
+# Test Source Router
+# ------------------------------------------------
+
+def _source(result, delay=0.0):
+    def fetch(symbol, start_date, end_date):
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fetch
+
+
+def test_router_failover():
+    """ [sources.router] Test a failing source falls over to the next
+    """
+    router = SourceRouter([('a', _source(IOError('down'))), ('b', _source('b'))])
+    np.testing.assert_equal(router.get_historical_prices('x', None, None), 'b')
+    np.testing.assert_equal(router.stats['a'].errors, 1)
+    # The failing source is no longer asked first
+    np.testing.assert_equal(router._ranked()[0][0], 'b')
+    router = SourceRouter([('a', _source(IOError('down')))])
+    np.testing.assert_raises(IOError, router.get_historical_prices, 'x', None, None)
+
+
+def test_router_hedge():
+    """ [sources.router] Test a slow primary is hedged by the secondary
+    """
+    router = SourceRouter([('a', _source('a', 0.5)), ('b', _source('b'))],
+                          hedge_delay=0.05)
+    start = time.time()
+    np.testing.assert_equal(router.get_historical_prices('x', None, None), 'b')
+    assert time.time() - start < 0.4
+    router = SourceRouter([('a', _source('a')), ('b', _source('b'))], hedge_delay=0.5)
+    np.testing.assert_equal(router.get_historical_prices('x', None, None), 'a')
+    np.testing.assert_equal(router.summary()['b']['requests'], 0)
+
+
+def test_router_unadjusted():
+    """ [sources.router] Test unadjusted sources only answer requests for unadjusted prices
+    """
+    router = SourceRouter([('a', _source(IOError('down'))), ('b', _source('b'))],
+                          unadjusted=['b'])
+    np.testing.assert_raises(IOError, router.get_historical_prices, 'x', None, None)
+    np.testing.assert_equal(router.summary()['b']['requests'], 0)
+    np.testing.assert_equal(router.get_historical_prices('x', None, None, adjusted=False), 'b')
+    router = SourceRouter.default()
+    np.testing.assert_equal(router.unadjusted, set(['google']))
+    # Unadjusted sources are only asked once every adjusted one failed
+    router = SourceRouter([('b', _source('b')), ('a', _source(IOError('down'))),
+                           ('c', _source('c'))], unadjusted=['b'])
+    np.testing.assert_equal(router.route('x', None, None, adjusted=False), ('c', 'c'))
+    router.sources[2] = ('c', _source(IOError('down')))
+    np.testing.assert_equal(router.route('x', None, None, adjusted=False), ('b', 'b'))
+
+
+def test_router_observer_error():
+    """ [sources.router] Test a failing observer doesn't lose the result
+    """
+    def observer(name, seconds, error):
+        raise ValueError('observer')
+
+    router = SourceRouter([('a', _source('a'))], observer=observer)
+    np.testing.assert_equal(router.get_historical_prices('x', None, None), 'a')
+    np.testing.assert_equal(router.stats['a'].requests, 1)
+
+
+# ------------------------------------------------
+# Test FRED
+# ------------------------------------------------
+
+observations_xml = """<?xml version="1.0" encoding="utf-8" ?>
+<observations realtime_start="2013-01-07" realtime_end="2013-01-07" count="4">
+  <observation realtime_start="2013-01-07" realtime_end="2013-01-07" date="2013-01-01" value="."/>
+  <observation realtime_start="2013-01-07" realtime_end="2013-01-07" date="2013-01-02" value="1462.42"/>
+  <observation realtime_start="2013-01-07" realtime_end="2013-01-07" date="2013-01-03" value="."/>
+  <observation realtime_start="2013-01-07" realtime_end="2013-01-07" date="2013-01-04" value="1466.47"/>
+</observations>"""
+
+
+def test_fred_to_arrays():
+    """ [sources.fred] Test missing values carry the last observation forward
+    """
+    observations = list(fred._iter_observations(StringIO(observations_xml)))
+    np.testing.assert_equal(observations[:2], [('2013-01-01', '.'), ('2013-01-02', '1462.42')])
+    dates, values = fred._to_arrays(observations)
+    np.testing.assert_array_equal(dates, np.array(['2013-01-02', '2013-01-03', '2013-01-04'],
+                                                  dtype='M8[D]'))
+    np.testing.assert_array_equal(values, [1462.42, 1462.42, 1466.47])
+    # Incremental fetches fill leading missing values from the stored value
+    dates, values = fred._to_arrays(observations, previous=1459.37)
+    np.testing.assert_equal(len(dates), 4)
+    np.testing.assert_array_equal(values, [1459.37, 1462.42, 1462.42, 1466.47])
+    dates, values = fred._to_arrays([])
+    np.testing.assert_equal((len(dates), len(values)), (0, 0))
+
+
+class FakeClock(object):
+    """ Clock that only moves when slept on
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_fred_rate_limiter():
+    """ [sources.fred] Test calls are spaced period / rate seconds apart
+    """
+    clock = FakeClock()
+    limiter = fred.RateLimiter(4, 1.0, clock=clock.time, sleep=clock.sleep)
+    for _ in range(3):
+        limiter.wait()
+    np.testing.assert_equal(clock.sleeps, [0.25, 0.25])
+    # Time spent elsewhere counts towards the interval
+    clock.now += 0.1
+    limiter.wait()
+    np.testing.assert_almost_equal(clock.sleeps[-1], 0.15)
+    clock.now += 10
+    limiter.wait()
+    np.testing.assert_equal(len(clock.sleeps), 3)
+
+
+def test_fred_get_many():
+    """ [sources.fred] Test every series is downloaded with its own start and previous value
+    """
+    requests = []
+
+    def urlopen(url):
+        requests.append(url)
+        return StringIO(observations_xml)
+
+    clock = FakeClock()
+    original, key = fred.urllib.urlopen, fred.FRED_API_KEY
+    fred.urllib.urlopen, fred.FRED_API_KEY = urlopen, 'key'
+    try:
+        results = fred.get_many(['sp_500', 'real_gdp'], {'sp_500': date(2013, 1, 1)},
+                                {'sp_500': 1459.37}, threads=2,
+                                limiter=fred.RateLimiter(120, clock=clock.time, sleep=clock.sleep))
+    finally:
+        fred.urllib.urlopen, fred.FRED_API_KEY = original, key
+    np.testing.assert_equal(sorted(results), ['real_gdp', 'sp_500'])
+    np.testing.assert_array_equal(results['sp_500'][1], [1459.37, 1462.42, 1462.42, 1466.47])
+    np.testing.assert_array_equal(results['real_gdp'][1], [1462.42, 1462.42, 1466.47])
+    np.testing.assert_equal(len(requests), 2)
+    assert any('SP500' in url and 'observation_start=2013-01-01' in url for url in requests)
+    assert any('GDPC1' in url and 'observation_start' not in url for url in requests)
+    np.testing.assert_equal(len(clock.sleeps), 1)
+
+
+if __name__ == '__main__':
+    test_parse_ticks()
+    test_parse_books()
+    test_parse_empty()
+    test_parse_historical_prices()
+    test_parse_historical_prices_malformed()
+    test_parse_google_prices()
+    test_router_failover()
+    test_router_hedge()
+    test_router_unadjusted()
+    test_router_observer_error()
+    test_fred_to_arrays()
+    test_fred_rate_limiter()
+    test_fred_get_many()
@@ -16,6 +16,8 @@
 
 import urllib
 from datetime import date
+
+import numpy as np
 from bs4 import BeautifulSoup
 
 """ yahoofinance
@@ -28,6 +30,18 @@ sample usage:
 529.46
 """
 
+# AdjClose is adjusted for splits and dividends
+ADJUSTED = True
+
+# Layout of historical price records
+price_dtype = np.dtype([('Date', 'M8[D]'),
+                        ('Open', np.float64),
+                        ('High', np.float64),
+                        ('Low', np.float64),
+                        ('Close', np.float64),
+                        ('Volume', np.float64),
+                        ('AdjClose', np.float64)])
+
 
 def __request(symbol, stat):
     url = 'http://finance.yahoo.com/d/quotes.csv?s=%s&f=%s' % (symbol, stat)
@@ -177,14 +191,7 @@ def get_industry(symbol):
     return industry
 
 
-def get_historical_prices(symbol, start_date, end_date):
-    """
-    Get historical prices for the given ticker symbol.
-    Dates may either be a date object or a string with the following format:
-    'YYYYMMDD'
-
-    Returns a nested list. Fields are Date, Open, High, Low, Close, Volume.
-    """
+def _historical_prices_url(symbol, start_date, end_date):
     if type(start_date) is date:
         # Months are zero-based
         start_m = str(start_date.month - 1)
@@ -216,7 +223,86 @@ def get_historical_prices(symbol, start_date, end_date):
           'b=%s&' % start_d + \
           'c=%s&' % start_y + \
           'ignore=.csv'
-    days = urllib.urlopen(url).readlines()
+    return url
+
+
+def get_historical_prices(symbol, start_date, end_date):
+    """
+    Get historical prices for the given ticker symbol.
+    Dates may either be a date object or a string with the following format:
+    'YYYYMMDD'
+
+    Returns a nested list. Fields are Date, Open, High, Low, Close, Volume.
+    """
+    days = urllib.urlopen(_historical_prices_url(symbol, start_date, end_date)).readlines()
     data = [day[:-2].split(',') for day in days]
     return data
 
+
+def get_historical_price_array(symbol, start_date, end_date):
+    """
+    Get historical prices for the given ticker symbol as a structured array.
+    Dates may either be a date object or a string with the following format:
+    'YYYYMMDD'
+
+    Returns an array of ``price_dtype`` records in ascending date order.
+    """
+    body = urllib.urlopen(_historical_prices_url(symbol, start_date, end_date)).read()
+    return parse_historical_prices(body)
+
+
+def parse_historical_prices(body, strict=False):
+    """
+    Parse a historical prices CSV response into a structured array.
+
+    Fields are converted a column at a time. Rows without exactly seven
+    fields or with an unparseable date or number are dropped, or raise a
+    ValueError if strict is True.
+
+    Returns an array of ``price_dtype`` records in ascending date order.
+    """
+    lines = body.splitlines()
+    if lines and lines[0].startswith('Date'):
+        lines = lines[1:]
+    return parse_price_rows([line.split(',') for line in lines if line], strict)
+
+
+def parse_price_rows(rows, strict=False):
+    """
+    Convert rows of Date, Open, High, Low, Close, Volume, AdjClose strings
+    into a structured array. Other sources use this to normalize their
+    quotes to the same format.
+
+    Returns an array of ``price_dtype`` records in ascending date order.
+    """
+    malformed = [i for i, row in enumerate(rows) if len(row) != len(price_dtype)]
+    rows = [row for row in rows if len(row) == len(price_dtype)]
+
+    try:
+        prices = _convert_rows(rows)
+    except ValueError:
+        # Find the bad rows one at a time. This only happens for malformed
+        # responses.
+        good = []
+        for i, row in enumerate(rows):
+            try:
+                _convert_rows([row])
+                good.append(row)
+            except ValueError:
+                malformed.append(i)
+        prices = _convert_rows(good)
+
+    if malformed and strict:
+        raise ValueError('%d malformed rows in historical prices' % len(malformed))
+    return prices[np.argsort(prices['Date'], kind='mergesort')]
+
+
+def _convert_rows(rows):
+    prices = np.empty(len(rows), dtype=price_dtype)
+    if not rows:
+        return prices
+    columns = zip(*rows)
+    prices['Date'] = np.array(columns[0], dtype='M8[D]')
+    for name, column in zip(price_dtype.names[1:], columns[1:]):
+        prices[name] = np.array(column).astype(np.float64)
+    return prices
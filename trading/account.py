@@ -2,80 +2,224 @@
 
 from datetime import date
 
+import numpy as np
+
 import actions
 
 
+# Record layouts for the account ledger
+position_dtype = np.dtype([('n_shares', np.float64),
+                           ('share_price', np.float64)])
+
+transaction_dtype = np.dtype([('timestamp', 'M8[us]'),
+                              ('action', np.int8),
+                              ('security', np.int32),
+                              ('n_shares', np.float64),
+                              ('share_price', np.float64),
+                              ('commission', np.float64)])
+
+value_dtype = np.dtype([('timestamp', 'M8[us]'),
+                        ('value', np.float64)])
+
+
+def _grow(records, needed):
+    """ Return a copy of records with room for at least needed rows
+
+    Capacity is doubled so appending n records costs O(n) amortized.
+    """
+    capacity = max(needed, 2 * len(records), 16)
+    grown = np.zeros(capacity, dtype=records.dtype)
+    grown[:len(records)] = records
+    return grown
+
+
 class Account(object):
-    def __init__(self, initial_value=100000, commission=0.00):
+    """ Brokerage account ledger
+
+    Positions, transactions and account value history are kept in
+    preallocated NumPy structured arrays that grow geometrically as needed.
+    The market value of all held securities is maintained incrementally as
+    prices change, so ``account_value`` is O(1) regardless of the number of
+    positions held.
+    """
+    def __init__(self, initial_value=100000, commission=0.00, capacity=1024,
+                 securities=None):
         self.cash_value = initial_value
         self.commission = commission
-        self.positions = {}
-        self.transactions = []
-        self.value = []
-        self.percent_change= []
+        self.timestamp = None
+
+        # Securities are assigned a row in the positions array the first time
+        # they are seen.
+        self.securities = []
+        self._index = {}
+        self._positions = np.zeros(16, dtype=position_dtype)
+        self._securities_value = 0.0
+        self.traded_value = 0.0
+        for security in (securities or ()):
+            self._row(security)
+
+        self._transactions = np.zeros(capacity, dtype=transaction_dtype)
+        self._n_transactions = 0
+        self._values = np.zeros(capacity, dtype=value_dtype)
+        self._n_values = 0
+
         self.trade_types = {
                 actions.BUY_LONG: self._buy,
                 actions.SELL_LONG: self._sell,
                 actions.SHORT: self._short,
                 actions.COVER: self._cover}
 
+    @property
+    def positions(self):
+        """ Open positions as a dict of ``Position`` objects keyed by security
+        """
+        return dict((security, Position(security, *self._positions[row]))
+                    for security, row in self._index.iteritems()
+                    if self._positions['n_shares'][row] != 0)
+
+    @property
+    def transactions(self):
+        """ Transaction records as a structured array
+        """
+        return self._transactions[:self._n_transactions]
+
+    @property
+    def value(self):
+        """ Account value history as a structured array of
+        (timestamp, value) records
+        """
+        return self._values[:self._n_values]
+
+    @property
+    def percent_change(self):
+        """ Percent change in account value between recorded ticks
+        """
+        values = self.value['value']
+        return np.diff(values) / values[:-1]
 
     def account_value(self):
-        securities_value = 0
-        for k in self.positions.keys():
-            securities_value += self.positions[k].value()
-        return self.cash_value + securities_value
+        return self.cash_value + self._securities_value
+
+    def securities_value(self):
+        return self._securities_value
 
 
     def trade(self, action, security, n_shares, share_price):
         self.trade_types[action](security, n_shares, share_price)
 
 
+    def update_price(self, security, share_price):
+        """ Mark a single security to market
+
+        :param security: Ticker symbol of the security.
+        :param share_price: Latest share price.
+        """
+        row = self._index.get(security)
+        if row is None:
+            return
+        positions = self._positions[row]
+        n_shares = positions['n_shares']
+        if n_shares:
+            self._securities_value += n_shares * (share_price - positions['share_price'])
+        positions['share_price'] = share_price
+
+
+    def tick(self, timestamp, quotes):
+        """ Update position prices
+
+        :param timestamp:   The timestamp for the tick.
+        :param quotes:      A dict of quotes with ticker symbols as keys. The
+        values may be quote objects with a ``Close`` attribute or prices.
+        """
+        for security in self._index:
+            quote = quotes.get(security)
+            if quote is not None:
+                self.update_price(security, getattr(quote, 'Close', quote))
+        self.record(timestamp)
+
+
+    def mark(self, prices):
+        """ Mark every security to market from a price vector
+
+        :param prices:      Array of prices ordered like ``securities``. NaN
+        prices leave the last known price in place.
+        """
+        share_prices = self._positions['share_price'][:len(prices)]
+        np.copyto(share_prices, prices, where=~np.isnan(prices))
+        self._securities_value = np.dot(self._positions['n_shares'],
+                                        self._positions['share_price'])
+
+
+    def record(self, timestamp):
+        """ Append the current account value to the value history
+
+        :param timestamp: The timestamp for the record.
+        """
+        self.timestamp = timestamp
+        n = self._n_values
+        if n == len(self._values):
+            self._values = _grow(self._values, n + 1)
+        self._values[n] = (timestamp, self.account_value())
+        self._n_values = n + 1
+
+
+    def _row(self, security):
+        """ Get the positions row for a security, allocating one if needed
+        """
+        row = self._index.get(security)
+        if row is None:
+            row = len(self.securities)
+            if row == len(self._positions):
+                self._positions = _grow(self._positions, row + 1)
+            self.securities.append(security)
+            self._index[security] = row
+        return row
+
+
+    def _record_transaction(self, action, row, n_shares, share_price):
+        n = self._n_transactions
+        if n == len(self._transactions):
+            self._transactions = _grow(self._transactions, n + 1)
+        self._transactions[n] = (self.timestamp, action, row, n_shares,
+                                 share_price, self.commission)
+        self._n_transactions = n + 1
+
+
     def _buy(self, security, n_shares, share_price):
+        # Nothing to trade, so nothing to charge commission for
+        if n_shares == 0:
+            return
+        row = self._row(security)
+
         # Create transaction record
-        transaction = {
-            'action': actions.BUY_LONG,
-            'security': security,
-            'n_shares': n_shares,
-            'share_price': share_price,
-            'commission': self.commission
-        }
-        self.transactions.append(transaction)
+        self._record_transaction(actions.BUY_LONG, row, n_shares, share_price)
 
-        # Update positions
-        if security in self.positions.keys():
-            # Add to position if it exists
-            self.positions[security].n_shares += n_shares
-            self.positions[security].tick()
-        else:
-            # Otherwise create a new one
-            position = Position(security, n_shares, share_price)
-            self.positions[security] = position
+        # Mark existing shares to the trade price, then add to the position
+        self.update_price(security, share_price)
+        self._positions['n_shares'][row] += n_shares
+        self._securities_value += n_shares * share_price
+        self.traded_value += n_shares * share_price
 
         # Update account value
         self.cash_value -= (n_shares * share_price + self.commission)
 
 
     def _sell(self, security, n_shares, share_price):
+        row = self._row(security)
+
+        # Can't sell more than we hold
+        n_shares = min(n_shares, self._positions['n_shares'][row])
+        if n_shares == 0:
+            return
 
         # Create transaction record
-        transaction = {
-            'action': actions.SELL_LONG,
-            'security': security,
-            'n_shares': n_shares,
-            'share_price': share_price,
-            'commission': self.commission
-        }
-        self.transactions.append(transaction)
+        self._record_transaction(actions.SELL_LONG, row, n_shares, share_price)
 
         # Update positions
-        self.positions[security].tick(share_price)
-        shares_held = self.positions[security].n_shares
-        if shares_held >= n_shares:
-            # Delete position if we sold all our shares
-            self.positions.pop(security, None)
-        else:
-            self.positions[security].n_shares -= n_shares
+        self.update_price(security, share_price)
+        self._positions['n_shares'][row] -= n_shares
+        self._securities_value -= n_shares * share_price
+        self.traded_value += n_shares * share_price
 
         # Update account value
         self.cash_value += share_price * n_shares - self.commission
@@ -87,20 +231,12 @@ class Account(object):
     def _cover(self, security, n_shares, share_price):
         pass
 
-    def tick(self, timestamp, quotes):
-        """ Update position prices
-
-        :param timestamp:   The timestamp for the tick.
-        :param quotes:      A dict of quotes with ticker symbols as keys
-        """
-        for k in self.positions.keys():
-            self.positions[k].tick(tick_quotes[k].Close)
-        self.value.append((tick_date, self.account_value()))
-
 
 
 
 class Position(object):
+    __slots__ = ('security', 'n_shares', 'share_price')
+
     def __init__(self, security, n_shares, share_price):
         self.security = security
         self.n_shares = n_shares
@@ -116,8 +252,9 @@ class Position(object):
 if __name__ == '__main__':
     from datetime import date
     account = Account()
-    account.buy('aapl', 50, 530.00)
-    account.tick(date(2013,01,02))
-    account.tick(date(2013,01,03))
-    account.tick(date(2013,01,04))
+    account.timestamp = date(2013, 01, 02)
+    account.trade(actions.BUY_LONG, 'aapl', 50, 530.00)
+    account.tick(date(2013,01,02), {'aapl': 530.00})
+    account.tick(date(2013,01,03), {'aapl': 535.25})
+    account.tick(date(2013,01,04), {'aapl': 528.10})
     print account.value
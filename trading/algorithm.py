@@ -1,8 +1,15 @@
 #!/usr/bin/env python
 
 class Algorithm(object):
+    """ Trading algorithm base class
+
+    The backtester sets ``account`` to the account being traded before the
+    first tick. ``tick`` is called once per tick with that tick's data row and
+    may return an iterable of ``(action, security, n_shares)`` orders, which
+    are filled at the tick's price. Returning ``None`` places no orders.
+    """
     def __init__(self):
-        pass
+        self.account = None
 
     def tick(self, data):
         pass
@@ -1,25 +1,205 @@
 #!/usr/bin/env python
 
+import numpy as np
+
 from .account import Account
+from .metrics import PerformanceMetrics
 from . import actions
 
 
 class Backtester(object):
-    def __init__(self, algorithm, dataset, initial_value=100000):
-        self.account = Account(initial_value)
+    """ Event-driven single-security backtester
+
+    Prices, timestamps and per-tick data are unpacked from the dataset into
+    arrays once, so the per-tick cost of the loop is one call to the
+    algorithm plus O(1) account and metrics bookkeeping.
+    """
+    def __init__(self, algorithm, dataset=None, initial_value=100000,
+                 commission=0.00, security=None, benchmark=None,
+                 keep_history=True, periods_per_year=252):
+        """ Create an instance of the Backtester class
+
+        :param algorithm: ``Algorithm`` instance to backtest.
+        :param dataset: ``Dataset`` to run the algorithm over.
+        :param initial_value: (Optional) Starting account value.
+        :param commission: (Optional) Commission charged per trade.
+        :param security: (Optional) Ticker to trade if the dataset contains
+        more than one symbol. Defaults to the first symbol in the dataset.
+        :param benchmark: (Optional) Array of benchmark levels, one per tick,
+        e.g. the ``sp_500`` economic indicator. Defaults to the security's
+        own price.
+        :param keep_history: (Optional) Record the account value at every
+        tick. If False only the streaming ``metrics`` are kept.
+        :param periods_per_year: (Optional) Number of ticks per year.
+        """
+        self.algorithm = algorithm
+        self.account = Account(initial_value, commission)
+        self.metrics = PerformanceMetrics(periods_per_year)
         self.initial_value = initial_value
-        self.dataset = dataset
-        self.value = []
-        self.benchmark = []
-        self.first = True
+        self.security = security
+        self.keep_history = keep_history
+        self.timestamps = None
+        self.prices = None
+        self.data = None
+        self.benchmark = benchmark
+        if dataset is not None:
+            self._load(dataset)
+
+    @classmethod
+    def from_arrays(cls, algorithm, security, timestamps, prices, data=None,
+                    initial_value=100000, commission=0.00, benchmark=None,
+                    keep_history=True):
+        """ Create a Backtester from preloaded arrays
+
+        :param algorithm: ``Algorithm`` instance to backtest.
+        :param security: Ticker symbol of the security being traded.
+        :param timestamps: Array of tick timestamps.
+        :param prices: Array of tick prices.
+        :param data: (Optional) 2D array of per-tick data passed to the
+        algorithm. Defaults to the prices.
+        :param benchmark: (Optional) Array of benchmark levels, one per tick.
+        :param keep_history: (Optional) Record the account value at every
+        tick.
+        """
+        backtester = cls(algorithm, None, initial_value, commission, security,
+                         benchmark, keep_history)
+        backtester.timestamps = np.asarray(timestamps)
+        backtester.prices = np.asarray(prices, dtype=float)
+        backtester.data = backtester.prices if data is None else data
+        return backtester
+
+    @property
+    def value(self):
+        """ Account value history
+        """
+        return self.account.value
 
     def backtest(self):
-        for tick_data in self.dataset:
-            action = self.algorithm.tick(tick_data)
-            if self.first:
-                self.benchmark.append()
+        """ Run the algorithm over every tick
+
+        :returns: Account value history as a structured array.
+        """
+        account = self.account
+        security = self.security
+        timestamps = self.timestamps
+        prices = self.prices
+        data = self.data
+        benchmark = prices if self.benchmark is None else self.benchmark
+        tick = self.algorithm.tick
+        trade = account.trade
+        update_price = account.update_price
+        record = account.record if self.keep_history else None
+        update_metrics = self.metrics.update
 
+        self.algorithm.account = account
+        traded = account.traded_value
+        for i in xrange(len(prices)):
+            price = prices[i]
+            account.timestamp = timestamps[i]
+            update_price(security, price)
+            orders = tick(data[i])
+            if orders:
+                for action, order_security, n_shares in orders:
+                    trade(action, order_security, n_shares, price)
+            if record is not None:
+                record(timestamps[i])
+            update_metrics(account.account_value(), benchmark[i],
+                           account.traded_value - traded,
+                           account.securities_value())
+            traded = account.traded_value
+        return account.value
 
+    def _load(self, dataset):
+        """ Unpack a ``Dataset`` into arrays
+        """
+        if self.security is None:
+            self.security = dataset.symbols[0]
+        frame = dataset.pretty_data.loc[self.security]
+        self.timestamps = np.array(list(frame.index), dtype='M8[D]')
+        self.prices = frame['adj_close'].values.astype(float)
+        self.data = frame.values.astype(float)
 
 
+class PortfolioBacktester(object):
+    """ Event-driven multi-security backtester
+
+    Runs over a calendar-aligned ``PriceMatrix`` from
+    ``data.utilities.get_price_matrix``. The account's securities are
+    registered in the matrix column order, so each date is marked to market
+    with a single vector operation on the matrix row. Orders for a security
+    with no price on a date, because it isn't listed yet or was delisted, are
+    skipped and counted in ``rejected``.
+    """
+    def __init__(self, algorithm, matrix, initial_value=100000,
+                 commission=0.00, benchmark=None, keep_history=True,
+                 periods_per_year=252):
+        """ Create an instance of the PortfolioBacktester class
+
+        :param algorithm: ``Algorithm`` instance to backtest. ``tick`` is
+        called with the row of prices for each date, ordered like
+        ``matrix.tickers``.
+        :param matrix: ``PriceMatrix`` to run the algorithm over.
+        :param initial_value: (Optional) Starting account value.
+        :param commission: (Optional) Commission charged per trade.
+        :param benchmark: (Optional) Array of benchmark levels, one per date.
+        :param keep_history: (Optional) Record the account value at every
+        date. If False only the streaming ``metrics`` are kept.
+        :param periods_per_year: (Optional) Number of dates per year.
+        """
+        self.algorithm = algorithm
+        self.matrix = matrix
+        self.initial_value = initial_value
+        self.benchmark = benchmark
+        self.keep_history = keep_history
+        self.account = Account(initial_value, commission,
+                               securities=list(matrix.tickers))
+        self.metrics = PerformanceMetrics(periods_per_year)
+        # Orders skipped because the security had no price that date
+        self.rejected = 0
+
+    @property
+    def value(self):
+        """ Account value history
+        """
+        return self.account.value
+
+    def backtest(self):
+        """ Run the algorithm over every date
+
+        :returns: Account value history as a structured array.
+        """
+        account = self.account
+        columns = account._index
+        dates = self.matrix.dates
+        prices = self.matrix.prices
+        benchmark = self.benchmark
+        tick = self.algorithm.tick
+        trade = account.trade
+        mark = account.mark
+        isfinite = np.isfinite
+        record = account.record if self.keep_history else None
+        update_metrics = self.metrics.update
 
+        self.algorithm.account = account
+        traded = account.traded_value
+        for i in xrange(len(dates)):
+            row = prices[i]
+            account.timestamp = dates[i]
+            mark(row)
+            orders = tick(row)
+            if orders:
+                for action, security, n_shares in orders:
+                    price = row[columns[security]]
+                    # Securities not listed yet, or delisted, have no price
+                    if not isfinite(price):
+                        self.rejected += 1
+                        continue
+                    trade(action, security, n_shares, price)
+            if record is not None:
+                record(dates[i])
+            update_metrics(account.account_value(),
+                           None if benchmark is None else benchmark[i],
+                           account.traded_value - traded,
+                           account.securities_value())
+            traded = account.traded_value
+        return account.value
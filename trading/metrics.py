@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+""" metrics.py
+Online performance metrics
+"""
+
+from math import isinf, isnan, sqrt
+
+import numpy as np
+
+
+def _finite(x):
+    return not (isnan(x) or isinf(x))
+
+
+class PerformanceMetrics(object):
+    """ Streaming backtest performance metrics
+
+    Each call to ``update`` is O(1) in time and memory. Return moments and the
+    return/benchmark co-moment are accumulated with Welford's method, so a
+    backtest can produce its summary without retaining the value history.
+    """
+    def __init__(self, periods_per_year=252):
+        """ Create an instance of the PerformanceMetrics class
+
+        :param periods_per_year: (Optional) Number of ticks per year, used to
+        annualize volatility, Sharpe ratio and alpha.
+        """
+        self.periods_per_year = periods_per_year
+        self.first_value = None
+        self.last_value = None
+        self.last_benchmark = None
+        self.n = 0
+        self.n_benchmark = 0
+
+        # Return moments
+        self._mean = 0.0
+        self._m2 = 0.0
+
+        # Benchmark moments and co-moment
+        self._benchmark_mean = 0.0
+        self._benchmark_m2 = 0.0
+        self._return_mean = 0.0
+        self._comoment = 0.0
+
+        # Drawdown
+        self.peak = None
+        self.max_drawdown = 0.0
+        self.drawdown_duration = 0
+        self.max_drawdown_duration = 0
+
+        # Trading activity
+        self.n_ticks = 0
+        self._value_sum = 0.0
+        self._traded_sum = 0.0
+        self._exposure_sum = 0.0
+
+    def update(self, value, benchmark=None, traded=0.0, exposure=0.0):
+        """ Add a tick to the metrics
+
+        :param value: Account value at the tick.
+        :param benchmark: (Optional) Benchmark level at the tick, e.g. the
+        S&P 500 close.
+        :param traded: (Optional) Notional value traded during the tick.
+        :param exposure: (Optional) Market value of positions held at the
+        tick.
+        """
+        value = float(value)
+        self.n_ticks += 1
+        self._value_sum += value
+        self._traded_sum += traded
+        if value:
+            self._exposure_sum += abs(exposure) / value
+
+        if self.first_value is None:
+            self.first_value = value
+            self.peak = value
+        else:
+            ret = value / self.last_value - 1.0
+            self.n += 1
+            delta = ret - self._mean
+            self._mean += delta / self.n
+            self._m2 += delta * (ret - self._mean)
+
+            if benchmark is not None and self.last_benchmark is not None:
+                benchmark_ret = float(benchmark) / self.last_benchmark - 1.0
+            else:
+                benchmark_ret = np.nan
+            # A missing benchmark level leaves this tick and the next out of
+            # the co-moments instead of poisoning them
+            if _finite(benchmark_ret) and _finite(ret):
+                self.n_benchmark += 1
+                n = self.n_benchmark
+                delta_benchmark = benchmark_ret - self._benchmark_mean
+                self._benchmark_mean += delta_benchmark / n
+                self._benchmark_m2 += delta_benchmark * (benchmark_ret - self._benchmark_mean)
+                self._return_mean += (ret - self._return_mean) / n
+                self._comoment += delta_benchmark * (ret - self._return_mean)
+        self.last_value = value
+        if benchmark is not None:
+            self.last_benchmark = float(benchmark)
+
+        # Drawdown
+        if value >= self.peak:
+            self.peak = value
+            self.drawdown_duration = 0
+        else:
+            self.drawdown_duration += 1
+            self.max_drawdown = max(self.max_drawdown, 1.0 - value / self.peak)
+            self.max_drawdown_duration = max(self.max_drawdown_duration,
+                                             self.drawdown_duration)
+
+    @property
+    def total_return(self):
+        if self.first_value is None:
+            return np.nan
+        return self.last_value / self.first_value - 1.0
+
+    @property
+    def volatility(self):
+        """ Annualized standard deviation of returns
+        """
+        if not self.n:
+            return 0.0
+        return sqrt(self._m2 / self.n) * sqrt(self.periods_per_year)
+
+    @property
+    def sharpe(self):
+        """ Annualized Sharpe ratio, assuming a zero risk-free rate
+        """
+        volatility = self.volatility
+        if volatility <= 0:
+            return np.nan
+        return self._mean * self.periods_per_year / volatility
+
+    @property
+    def beta(self):
+        if not self._benchmark_m2:
+            return np.nan
+        return self._comoment / self._benchmark_m2
+
+    @property
+    def alpha(self):
+        """ Annualized return not explained by the benchmark
+        """
+        beta = self.beta
+        if np.isnan(beta):
+            return np.nan
+        return (self._return_mean - beta * self._benchmark_mean) * self.periods_per_year
+
+    @property
+    def turnover(self):
+        """ Total notional traded as a multiple of the mean account value
+        """
+        if not self._value_sum:
+            return 0.0
+        return self._traded_sum * self.n_ticks / self._value_sum
+
+    @property
+    def exposure(self):
+        """ Mean fraction of the account value held in positions
+        """
+        if not self.n_ticks:
+            return 0.0
+        return self._exposure_sum / self.n_ticks
+
+    def summary(self):
+        """ Get the metrics as a dict
+        """
+        return {
+            'total_return': self.total_return,
+            'volatility': self.volatility,
+            'sharpe': self.sharpe,
+            'max_drawdown': self.max_drawdown,
+            'max_drawdown_duration': self.max_drawdown_duration,
+            'turnover': self.turnover,
+            'exposure': self.exposure,
+            'alpha': self.alpha,
+            'beta': self.beta}
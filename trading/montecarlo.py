@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+""" montecarlo.py
+Monte Carlo robustness testing of backtest results
+"""
+
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+from pandas import DataFrame
+
+
+def block_bootstrap_indices(n, n_paths, block_size, random_state):
+    """ Draw moving block bootstrap indices
+
+    Each path is built from randomly placed blocks of consecutive indices,
+    which preserves short-range autocorrelation in the resampled series.
+
+    :param n: Length of the original series and of each path.
+    :param n_paths: Number of paths to draw.
+    :param block_size: Length of each block.
+    :param random_state: ``numpy.random.RandomState`` to draw from.
+    :returns: (n_paths x n) array of indices into the original series.
+    """
+    block_size = max(1, min(block_size, n))
+    n_blocks = -(-n // block_size)
+    starts = random_state.randint(0, n - block_size + 1, (n_paths, n_blocks))
+    indices = starts[:, :, np.newaxis] + np.arange(block_size)
+    return indices.reshape(n_paths, -1)[:, :n]
+
+
+def path_metrics(returns, periods_per_year=252):
+    """ Calculate performance metrics for many return paths at once
+
+    :param returns: (paths x time) array of per-period returns.
+    :param periods_per_year: (Optional) Number of periods per year.
+    :returns: Dict of metric arrays with one element per path.
+    """
+    equity = np.cumprod(1.0 + returns, axis=1)
+    peaks = np.maximum(np.maximum.accumulate(equity, axis=1), 1.0)
+    volatility = returns.std(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(volatility > 0,
+                          returns.mean(axis=1) / volatility * np.sqrt(periods_per_year),
+                          np.nan)
+    return {
+        'total_return': equity[:, -1] - 1.0,
+        'volatility': volatility * np.sqrt(periods_per_year),
+        'sharpe': sharpe,
+        'max_drawdown': (1.0 - equity / peaks).max(axis=1)}
+
+
+def _simulate(job):
+    """ Evaluate one chunk of resampled paths
+    """
+    returns, n_paths, block_size, periods_per_year, seed = job
+    indices = block_bootstrap_indices(len(returns), n_paths, block_size,
+                                      np.random.RandomState(seed))
+    return path_metrics(returns[indices], periods_per_year)
+
+
+class MonteCarlo(object):
+    """ Block bootstrap Monte Carlo over backtest returns
+
+    Resampled paths are evaluated a chunk at a time as a single vectorized
+    (paths x time) computation, and chunks are distributed across a process
+    pool. To resample a trade sequence instead of a return path, pass the
+    per-trade returns with a block size of 1.
+    """
+    def __init__(self, returns, block_size=20, periods_per_year=252):
+        """ Create an instance of the MonteCarlo class
+
+        :param returns: Array of per-period (or per-trade) returns.
+        :param block_size: (Optional) Number of consecutive returns in each
+        bootstrap block.
+        :param periods_per_year: (Optional) Number of periods per year.
+        """
+        self.returns = np.asarray(returns, dtype=float)
+        self.block_size = block_size
+        self.periods_per_year = periods_per_year
+        self.metrics = None
+
+    @classmethod
+    def from_values(cls, values, block_size=20, periods_per_year=252):
+        """ Create a MonteCarlo from an equity curve
+
+        :param values: Array of account values, e.g. ``Backtester.value['value']``.
+        """
+        values = np.asarray(values, dtype=float)
+        return cls(np.diff(values) / values[:-1], block_size, periods_per_year)
+
+    def run(self, n_paths=1000, seed=None, processes=None, chunk_size=250):
+        """ Resample and evaluate n_paths return paths
+
+        :param n_paths: (Optional) Number of paths to simulate.
+        :param seed: (Optional) Random seed. Results are reproducible for a
+        given seed and chunk size regardless of the number of processes.
+        :param processes: (Optional) Number of worker processes. Defaults to
+        the number of CPUs.
+        :param chunk_size: (Optional) Number of paths evaluated together.
+        :returns: DataFrame with one row per metric giving the mean and
+        percentiles of its distribution. The per-path values are stored in
+        ``metrics``.
+
+        Raises ValueError if n_paths is less than 1.
+        """
+        if n_paths < 1:
+            raise ValueError('n_paths must be at least 1, got %d' % n_paths)
+        processes = cpu_count() if processes is None else processes
+        seeds = np.random.RandomState(seed).randint(0, 2 ** 31 - 1,
+                                                    -(-n_paths // chunk_size))
+        jobs = [(self.returns, min(chunk_size, n_paths - i * chunk_size),
+                 self.block_size, self.periods_per_year, chunk_seed)
+                for i, chunk_seed in enumerate(seeds)]
+        if processes > 1 and len(jobs) > 1:
+            pool = Pool(min(processes, len(jobs)))
+            try:
+                chunks = pool.map(_simulate, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            chunks = [_simulate(job) for job in jobs]
+
+        self.metrics = dict((name, np.concatenate([chunk[name] for chunk in chunks]))
+                            for name in chunks[0])
+        return self.summary()
+
+    def summary(self, percentiles=(5, 25, 50, 75, 95)):
+        """ Summarize the simulated metric distributions
+
+        :param percentiles: (Optional) Percentiles to report.
+        :returns: DataFrame with one row per metric.
+        """
+        rows = []
+        names = sorted(self.metrics)
+        for name in names:
+            values = self.metrics[name]
+            values = values[~np.isnan(values)]
+            row = {'mean': values.mean() if len(values) else np.nan}
+            for p in percentiles:
+                row['p%d' % p] = np.percentile(values, p) if len(values) else np.nan
+            rows.append(row)
+        return DataFrame(rows, index=names,
+                         columns=['mean'] + ['p%d' % p for p in percentiles])
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+""" sweep.py
+Parallel parameter sweeps
+"""
+
+import ctypes
+from itertools import product
+from multiprocessing import Pool, cpu_count
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+from pandas import DataFrame
+
+from .backtest import Backtester
+
+
+# Price data attached by each worker process
+_shared = {}
+
+
+def _to_shared(array):
+    """ Copy an array into a shared memory buffer
+
+    :returns: Tuple of (buffer, dtype, shape) from which the array can be
+    rebuilt without copying.
+    """
+    array = np.ascontiguousarray(array)
+    raw = RawArray(ctypes.c_char, max(array.nbytes, 1))
+    view = np.frombuffer(raw, dtype=array.dtype, count=array.size)
+    view[:] = array.ravel()
+    return raw, array.dtype.str, array.shape
+
+
+def _from_shared(raw, dtype, shape):
+    """ Get an array view of a shared memory buffer
+    """
+    return np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def _attach(timestamps, prices, data):
+    """ Worker initializer. Attach to the shared price data
+    """
+    _shared['timestamps'] = _from_shared(*timestamps)
+    _shared['prices'] = _from_shared(*prices)
+    _shared['data'] = _from_shared(*data)
+
+
+def _run(job):
+    """ Backtest a single parameter combination against the shared data
+
+    Jobs are tuples of (algorithm_class, params, security, initial_value,
+    commission, start, end). The backtest runs over rows start:end of the
+    shared arrays, which are sliced as views rather than copied.
+    """
+    algorithm_class, params, security, initial_value, commission, start, end = job
+    window = slice(start, end)
+    backtester = Backtester.from_arrays(algorithm_class(**params), security,
+                                        _shared['timestamps'][window],
+                                        _shared['prices'][window],
+                                        _shared['data'][window],
+                                        initial_value, commission)
+    values = backtester.backtest()['value']
+    return values.copy(), backtester.metrics.summary()
+
+
+def _map(jobs, shared, processes):
+    """ Run backtest jobs across a pool of workers attached to shared data
+
+    :param jobs: List of job tuples for ``_run``.
+    :param shared: Tuple of shared (timestamps, prices, data) buffers.
+    :param processes: Number of worker processes. Jobs are run in this
+    process if less than 2.
+    :returns: List of (equity curve, summary) tuples in job order.
+    """
+    if processes > 1:
+        pool = Pool(processes, _attach, shared)
+        try:
+            return pool.map(_run, jobs, max(1, len(jobs) // (4 * processes)))
+        finally:
+            pool.close()
+            pool.join()
+    _attach(*shared)
+    return [_run(job) for job in jobs]
+
+
+def parameter_grid(grid):
+    """ Expand a dict of parameter value lists into a list of parameter dicts
+
+    :param grid: Dict mapping parameter names to lists of values.
+    :returns: List of dicts, one for each combination of values.
+    """
+    names = sorted(grid.keys())
+    return [dict(zip(names, values))
+            for values in product(*[grid[name] for name in names])]
+
+
+class Sweep(object):
+    """ Parameter sweep over a single dataset
+
+    The dataset is unpacked once into shared memory. Worker processes attach
+    to the shared buffers at startup, so each backtest reads the same price
+    and feature arrays without reloading or copying them.
+    """
+    def __init__(self, algorithm_class, dataset, grid, initial_value=100000,
+                 commission=0.00, security=None, processes=None):
+        """ Create an instance of the Sweep class
+
+        :param algorithm_class: ``Algorithm`` subclass to backtest. It is
+        instantiated with each parameter combination as keyword arguments and
+        must be importable by the worker processes.
+        :param dataset: ``Dataset`` to backtest against.
+        :param grid: Dict mapping parameter names to lists of values.
+        :param initial_value: (Optional) Starting account value.
+        :param commission: (Optional) Commission charged per trade.
+        :param security: (Optional) Ticker to trade. Defaults to the first
+        symbol in the dataset.
+        :param processes: (Optional) Number of worker processes. Defaults to
+        the number of CPUs.
+        """
+        data = Backtester(None, dataset, security=security)
+        self._initialize(algorithm_class, data, grid, initial_value,
+                         commission, processes)
+
+    @classmethod
+    def from_arrays(cls, algorithm_class, security, timestamps, prices, grid,
+                    data=None, initial_value=100000, commission=0.00,
+                    processes=None):
+        """ Create a Sweep from preloaded arrays
+        """
+        sweep = cls.__new__(cls)
+        data = Backtester.from_arrays(None, security, timestamps, prices, data)
+        sweep._initialize(algorithm_class, data, grid, initial_value,
+                          commission, processes)
+        return sweep
+
+    def _initialize(self, algorithm_class, data, grid, initial_value,
+                    commission, processes):
+        """ Copy the unpacked data into shared memory
+        """
+        self.algorithm_class = algorithm_class
+        self.params = parameter_grid(grid)
+        self.initial_value = initial_value
+        self.commission = commission
+        self.processes = cpu_count() if processes is None else processes
+        self.equity_curves = None
+        self.results = None
+        self.security = data.security
+        self.timestamps = data.timestamps
+        self._shared = (_to_shared(data.timestamps),
+                        _to_shared(data.prices),
+                        _to_shared(data.data))
+
+    def run(self):
+        """ Backtest every parameter combination
+
+        :returns: DataFrame with one row per parameter combination containing
+        the parameters and summary metrics. Equity curves are stored in
+        ``equity_curves`` with one column per row of the result table.
+        """
+        jobs = [(self.algorithm_class, params, self.security, self.initial_value,
+                 self.commission, 0, None) for params in self.params]
+        outputs = _map(jobs, self._shared, self.processes)
+
+        self.equity_curves = DataFrame(np.column_stack([curve for curve, _ in outputs]),
+                                       index=self.timestamps)
+        rows = []
+        for params, (_, summary) in zip(self.params, outputs):
+            row = dict(params)
+            row.update(summary)
+            rows.append(row)
+        self.results = DataFrame(rows)
+        return self.results
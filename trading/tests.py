@@ -1,7 +1,14 @@
 import numpy as np
 import account
 import actions
+import algorithm
 import utilities
+from metrics import PerformanceMetrics
+from montecarlo import MonteCarlo, block_bootstrap_indices, path_metrics
+from backtest import Backtester, PortfolioBacktester
+from sweep import Sweep
+from walkforward import WalkForward, walk_forward_windows
+from ..data.utilities import PriceMatrix, align_prices
 """ tests.py
 
 Unit tests for trading module
@@ -63,6 +70,16 @@ def test_commission():
 
 
 
+def test_zero_share_trade():
+    """ [trading.account] Test zero share trades aren't charged commission
+    """
+    theAccount = account.Account(commission=10.0)
+    theAccount._buy('test_security', 0, 1)
+    theAccount._sell('test_security', 100, 1)
+    np.testing.assert_equal(theAccount.account_value(), 100000.0)
+    np.testing.assert_equal(len(theAccount.transactions), 0)
+
+
 def test_trade():
     """ [trading.account] Test buy using trade method
     """
@@ -71,6 +88,252 @@ def test_trade():
     value = theAccount.account_value()
     np.testing.assert_equal(value, 99990.0)
 
+
+def test_partial_sell():
+    """ [trading.account] Test selling part of a position
+    """
+    theAccount = account.Account()
+    theAccount._buy('test_security', 100, 1)
+    theAccount._sell('test_security', 40, 2)
+    value = theAccount.positions['test_security'].n_shares
+    np.testing.assert_equal(value, 60)
+    np.testing.assert_equal(theAccount.account_value(), 100100.0)
+
+
+def test_incremental_account_value():
+    """ [trading.account] Test incremental mark-to-market against full revaluation
+    """
+    theAccount = account.Account()
+    theAccount._buy('a', 10, 5.0)
+    theAccount._buy('b', 20, 2.0)
+    theAccount.tick(1, {'a': 6.0, 'b': 1.5})
+    theAccount.tick(2, {'a': 7.0})
+    expected = theAccount.cash_value + sum(
+        position.value() for position in theAccount.positions.values())
+    np.testing.assert_almost_equal(theAccount.account_value(), expected)
+
+
+def test_ledger_growth():
+    """ [trading.account] Test transaction and value ledgers grow past capacity
+    """
+    theAccount = account.Account(capacity=2)
+    for i in range(10):
+        theAccount._buy('test_security', 1, 1)
+        theAccount.record(None)
+    np.testing.assert_equal(len(theAccount.transactions), 10)
+    np.testing.assert_equal(len(theAccount.value), 10)
+    np.testing.assert_equal(theAccount.positions['test_security'].n_shares, 10)
+
+
+# ------------------------------------------------
+# Test Backtester
+# ------------------------------------------------
+
+class BuyOnce(algorithm.Algorithm):
+    def tick(self, data):
+        if not self.account.positions:
+            return [(actions.BUY_LONG, 'test_security', 100)]
+
+
+def test_backtest():
+    """ [trading.backtest] Test event loop account value
+    """
+    timestamps = np.arange('2013-01-01', '2013-01-06', dtype='M8[D]')
+    prices = np.array([1.0, 2.0, 3.0, 2.0, 4.0])
+    tester = Backtester.from_arrays(BuyOnce(), 'test_security', timestamps, prices)
+    value = tester.backtest()['value']
+    np.testing.assert_array_almost_equal(value, 99900.0 + 100 * prices)
+
+
+def test_mark():
+    """ [trading.account] Test vector mark-to-market
+    """
+    theAccount = account.Account(securities=['a', 'b', 'c'])
+    theAccount._buy('a', 10, 1.0)
+    theAccount._buy('c', 10, 1.0)
+    theAccount.mark(np.array([2.0, 5.0, np.nan]))
+    np.testing.assert_equal(theAccount.account_value(), 100010.0)
+
+
+class BuyEqual(algorithm.Algorithm):
+    def tick(self, prices):
+        if not self.account.positions:
+            return [(actions.BUY_LONG, 'a', 10), (actions.BUY_LONG, 'b', 10)]
+
+
+def test_portfolio_backtest():
+    """ [trading.backtest] Test portfolio event loop account value
+    """
+    prices = np.array([[1.0, 2.0], [2.0, 2.0], [3.0, np.nan], [2.0, 4.0]])
+    matrix = PriceMatrix(np.arange('2013-01-01', '2013-01-05', dtype='M8[D]'),
+                         np.array(['a', 'b'], dtype=object), prices, None, None)
+    tester = PortfolioBacktester(BuyEqual(), matrix)
+    value = tester.backtest()['value']
+    np.testing.assert_array_almost_equal(value, [100000, 100010, 100020, 100030])
+
+
+class BuyEachDay(algorithm.Algorithm):
+    def tick(self, prices):
+        return [(actions.BUY_LONG, 'a', 1), (actions.BUY_LONG, 'b', 1)]
+
+
+def test_portfolio_backtest_listing():
+    """ [trading.backtest] Test orders for a security before it lists are skipped
+    """
+    dates = np.array(['2013-01-01', '2013-01-02', '2013-01-03', '2013-01-04',
+                      '2013-01-03', '2013-01-04'], dtype='M8[D]')
+    matrix = align_prices(['a', 'a', 'a', 'a', 'b', 'b'], dates,
+                          [1.0, 1.0, 1.0, 1.0, 2.0, 3.0])
+    tester = PortfolioBacktester(BuyEachDay(), matrix)
+    value = tester.backtest()['value']
+    np.testing.assert_equal(tester.rejected, 2)
+    np.testing.assert_(np.isfinite(value).all())
+    np.testing.assert_array_almost_equal(value, [100000, 100000, 100000, 100001])
+    np.testing.assert_equal(tester.account.positions['b'].n_shares, 2)
+
+
+# ------------------------------------------------
+# Test Sweep
+# ------------------------------------------------
+
+class BuyShares(algorithm.Algorithm):
+    def __init__(self, n_shares):
+        super(BuyShares, self).__init__()
+        self.n_shares = n_shares
+
+    def tick(self, data):
+        if not self.account.positions:
+            return [(actions.BUY_LONG, 'test_security', self.n_shares)]
+
+
+def test_sweep():
+    """ [trading.sweep] Test parallel sweep result table
+    """
+    timestamps = np.arange('2013-01-01', '2013-01-06', dtype='M8[D]')
+    prices = np.array([1.0, 2.0, 3.0, 2.0, 4.0])
+    sweep = Sweep.from_arrays(BuyShares, 'test_security', timestamps, prices,
+                              {'n_shares': [10, 100, 1000]}, processes=2)
+    results = sweep.run()
+    np.testing.assert_array_equal(results['n_shares'].values, [10, 100, 1000])
+    np.testing.assert_array_almost_equal(results['total_return'].values,
+                                         [0.0003, 0.003, 0.03])
+    np.testing.assert_array_almost_equal(sweep.equity_curves[1].values,
+                                         99900.0 + 100 * prices)
+
+
+def test_walk_forward_windows():
+    """ [trading.walkforward] Test window bounds
+    """
+    windows = walk_forward_windows(10, 4, 3)
+    np.testing.assert_equal(windows, [(0, 4, 4, 7), (3, 7, 7, 10)])
+    windows = walk_forward_windows(10, 4, 3, anchored=True)
+    np.testing.assert_equal(windows, [(0, 4, 4, 7), (0, 7, 7, 10)])
+
+
+def test_walk_forward():
+    """ [trading.walkforward] Test stitched out-of-sample equity curve
+    """
+    timestamps = np.arange('2013-01-01', '2013-01-09', dtype='M8[D]')
+    prices = np.array([1.0, 2.0, 3.0, 2.0, 4.0, 5.0, 4.0, 8.0])
+    sweep = Sweep.from_arrays(BuyShares, 'test_security', timestamps, prices,
+                              {'n_shares': [10, 100]}, processes=2)
+    walk = WalkForward(sweep, 4, 2, metric='total_return')
+    results = walk.run()
+    np.testing.assert_array_equal(results['n_shares'].values, [100, 100])
+    np.testing.assert_array_almost_equal(walk.equity_curve.values,
+                                         99600.0 + 100 * prices[4:])
+    np.testing.assert_raises(ValueError, WalkForward, sweep, 4, 2, 1)
+    np.testing.assert_raises(ValueError, WalkForward, sweep, 4, 2, 3)
+
+
+# ------------------------------------------------
+# Test Metrics
+# ------------------------------------------------
+
+def test_streaming_metrics():
+    """ [trading.metrics] Test streaming metrics against full history summary
+    """
+    values = 100 + np.cumsum(np.sin(np.arange(50.0)))
+    metrics = PerformanceMetrics()
+    for value in values:
+        metrics.update(value)
+    summary = metrics.summary()
+    expected = utilities.summarize(values)
+    for key in expected:
+        np.testing.assert_almost_equal(summary[key], expected[key])
+
+
+def test_drawdown_duration():
+    """ [trading.metrics] Test max drawdown and duration
+    """
+    metrics = PerformanceMetrics()
+    for value in [100, 110, 99, 105, 108, 111, 90, 111]:
+        metrics.update(value)
+    np.testing.assert_almost_equal(metrics.max_drawdown, 1 - 90.0 / 111)
+    np.testing.assert_equal(metrics.max_drawdown_duration, 3)
+
+
+def test_beta():
+    """ [trading.metrics] Test alpha and beta against a benchmark
+    """
+    benchmark = 100 * np.cumprod(1 + 0.01 * np.sin(np.arange(1, 30.0)))
+    returns = 0.001 + 2 * (benchmark[1:] / benchmark[:-1] - 1)
+    values = 100 * np.cumprod(np.append(1, 1 + returns))
+    metrics = PerformanceMetrics(periods_per_year=1)
+    for value, level in zip(values, benchmark):
+        metrics.update(value, level)
+    np.testing.assert_almost_equal(metrics.beta, 2)
+    np.testing.assert_almost_equal(metrics.alpha, 0.001)
+
+
+def test_beta_missing_benchmark():
+    """ [trading.metrics] Test a missing benchmark level doesn't poison alpha and beta
+    """
+    benchmark = 100 * np.cumprod(1 + 0.01 * np.sin(np.arange(1, 30.0)))
+    returns = 0.001 + 2 * (benchmark[1:] / benchmark[:-1] - 1)
+    values = 100 * np.cumprod(np.append(1, 1 + returns))
+    benchmark[10] = np.nan
+    metrics = PerformanceMetrics(periods_per_year=1)
+    for value, level in zip(values, benchmark):
+        metrics.update(value, level)
+    np.testing.assert_equal(metrics.n_benchmark, len(returns) - 2)
+    np.testing.assert_almost_equal(metrics.beta, 2)
+    np.testing.assert_almost_equal(metrics.alpha, 0.001)
+
+
+# ------------------------------------------------
+# Test Monte Carlo
+# ------------------------------------------------
+
+def test_block_bootstrap_indices():
+    """ [trading.montecarlo] Test block bootstrap indices are consecutive blocks
+    """
+    indices = block_bootstrap_indices(10, 5, 3, np.random.RandomState(0))
+    np.testing.assert_equal(indices.shape, (5, 10))
+    np.testing.assert_array_equal(np.diff(indices[:, :3], axis=1), 1)
+    np.testing.assert_(indices.max() < 10)
+
+
+def test_path_metrics():
+    """ [trading.montecarlo] Test vectorized path metrics against summarize
+    """
+    values = 100 + np.cumsum(np.sin(np.arange(50.0)))
+    returns = np.diff(values) / values[:-1]
+    metrics = path_metrics(returns[np.newaxis, :])
+    expected = utilities.summarize(values)
+    for key in expected:
+        np.testing.assert_almost_equal(metrics[key][0], expected[key])
+
+
+def test_monte_carlo_reproducible():
+    """ [trading.montecarlo] Test serial and parallel runs agree for a seed
+    """
+    returns = 0.01 * np.sin(np.arange(100.0))
+    serial = MonteCarlo(returns, 5).run(200, seed=1, processes=1, chunk_size=50)
+    parallel = MonteCarlo(returns, 5).run(200, seed=1, processes=2, chunk_size=50)
+    np.testing.assert_array_almost_equal(serial.values, parallel.values)
+    np.testing.assert_raises(ValueError, MonteCarlo(returns, 5).run, 0)
+
 # ------------------------------------------------
 # Test Utilities
 # ------------------------------------------------
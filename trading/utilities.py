@@ -2,6 +2,27 @@
 
 from math import floor
 
+import numpy as np
+
 def calc_number_of_shares(cash, price, commission=0.00):
     return floor((cash - commission) / price)
 
+
+def summarize(values, periods_per_year=252):
+    """ Calculate summary metrics for an equity curve
+
+    :param values: Array of account values.
+    :param periods_per_year: (Optional) Number of ticks per year, used to
+    annualize volatility and Sharpe ratio.
+    :returns: Dict of summary metrics.
+    """
+    values = np.asarray(values, dtype=float)
+    returns = np.diff(values) / values[:-1]
+    volatility = returns.std() if len(returns) else 0.0
+    drawdowns = 1.0 - values / np.maximum.accumulate(values)
+    return {
+        'total_return': values[-1] / values[0] - 1.0,
+        'volatility': volatility * np.sqrt(periods_per_year),
+        'sharpe': (returns.mean() / volatility * np.sqrt(periods_per_year)
+                   if volatility > 0 else np.nan),
+        'max_drawdown': drawdowns.max()}
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+""" walkforward.py
+Walk-forward optimization
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from pandas import DataFrame, Series
+
+from .backtest import Backtester
+from .sweep import _attach, _map, _shared
+from .utilities import summarize
+
+
+# Row bounds of an in-sample/out-of-sample window pair
+Window = namedtuple('Window', ['train_start', 'train_end', 'test_start', 'test_end'])
+
+
+def walk_forward_windows(n, train_size, test_size, step=None, anchored=False):
+    """ Slide in-sample/out-of-sample windows across n rows
+
+    :param n: Number of rows in the date index.
+    :param train_size: Number of rows in each in-sample window.
+    :param test_size: Number of rows in each out-of-sample window.
+    :param step: (Optional) Rows to advance between windows. Defaults to
+    test_size so the out-of-sample windows tile the index.
+    :param anchored: (Optional) Start every in-sample window at row 0.
+    :returns: List of ``Window`` tuples.
+    """
+    step = test_size if step is None else step
+    windows = []
+    start = 0
+    while start + train_size < n:
+        train_end = start + train_size
+        windows.append(Window(0 if anchored else start, train_end,
+                              train_end, min(train_end + test_size, n)))
+        start += step
+    return windows
+
+
+class WalkForward(object):
+    """ Walk-forward optimization driver
+
+    Every in-sample window is optimized over the sweep's parameter grid.
+    These optimizations are independent, so all of them are run as a single
+    batch across the sweep's worker pool. Each window's best parameters are
+    then run out-of-sample in date order on one account, so cash and open
+    positions carry from one window into the next and the out-of-sample
+    equity curves are stitched without restarting. Indicator columns are
+    computed once for the whole history and windows are views of the
+    sweep's shared arrays.
+    """
+    def __init__(self, sweep, train_size, test_size, step=None,
+                 anchored=False, metric='sharpe', maximize=True):
+        """ Create an instance of the WalkForward class
+
+        :param sweep: ``Sweep`` holding the algorithm, parameter grid and
+        shared data.
+        :param train_size: Number of rows in each in-sample window.
+        :param test_size: Number of rows in each out-of-sample window.
+        :param step: (Optional) Rows to advance between windows. The
+        out-of-sample windows are stitched into one equity curve, so this
+        must equal test_size: a smaller step would replay dates and a larger
+        one would skip them. Raises ValueError otherwise.
+        :param anchored: (Optional) Start every in-sample window at row 0.
+        :param metric: (Optional) Summary metric used to choose parameters.
+        :param maximize: (Optional) Choose the parameters that maximize the
+        metric. If False, minimize it.
+        """
+        if step is not None and step != test_size:
+            raise ValueError('step (%d) must equal test_size (%d) to stitch '
+                             'out-of-sample windows' % (step, test_size))
+        self.sweep = sweep
+        self.windows = walk_forward_windows(len(sweep.timestamps), train_size,
+                                            test_size, step, anchored)
+        self.metric = metric
+        self.maximize = maximize
+        self.equity_curve = None
+        self.results = None
+
+    def run(self):
+        """ Optimize each in-sample window and run it out-of-sample
+
+        :returns: DataFrame with one row per window containing the window
+        dates, chosen parameters, in-sample score and out-of-sample summary
+        metrics. The stitched out-of-sample equity curve is stored in
+        ``equity_curve``.
+        """
+        sweep = self.sweep
+        params = sweep.params
+        jobs = [(sweep.algorithm_class, p, sweep.security, sweep.initial_value,
+                 sweep.commission, window.train_start, window.train_end)
+                for window in self.windows for p in params]
+        outputs = _map(jobs, sweep._shared, sweep.processes)
+
+        _attach(*sweep._shared)
+        timestamps = _shared['timestamps']
+        account = None
+        rows = []
+        for i, window in enumerate(self.windows):
+            scores = np.array([summary[self.metric] for _, summary in
+                               outputs[i * len(params):(i + 1) * len(params)]])
+            if not self.maximize:
+                scores = -scores
+            best = int(np.where(np.isnan(scores), -np.inf, scores).argmax())
+
+            test = slice(window.test_start, window.test_end)
+            backtester = Backtester.from_arrays(sweep.algorithm_class(**params[best]),
+                                                sweep.security,
+                                                timestamps[test],
+                                                _shared['prices'][test],
+                                                _shared['data'][test],
+                                                sweep.initial_value,
+                                                sweep.commission)
+            if account is not None:
+                # Continue from the previous window's account
+                backtester.account = account
+            start = len(backtester.account.value)
+            previous = (backtester.account.value['value'][-1:] if start
+                        else [sweep.initial_value])
+            values = backtester.backtest()['value'][start:]
+            account = backtester.account
+
+            row = dict(params[best])
+            row.update(summarize(np.append(previous, values)))
+            row.update({'train_start': timestamps[window.train_start],
+                        'test_start': timestamps[window.test_start],
+                        'test_end': timestamps[window.test_end - 1],
+                        'in_sample': outputs[i * len(params) + best][1][self.metric]})
+            rows.append(row)
+
+        self.results = DataFrame(rows)
+        if account is not None:
+            self.equity_curve = Series(account.value['value'],
+                                       index=account.value['timestamp'])
+        return self.results